@@ -15,82 +15,497 @@ Set the ``OPENAI_API_KEY`` environment variable before running.
 """
 
 import os
+import time
+import uuid
+import asyncio
 import argparse
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-from typing import Callable
+from typing import TYPE_CHECKING, Callable, Optional
 
-from storage import storage
+import metrics
+from cache import ResponseCache
+from deadlines import LatencyWindow, earliest, hedged, within
+from prompts import EvolvingPrompt, estimate_tokens
+from pipeline import TOPOLOGIES, Pipeline, parse_dag, run_in_new_loop
 
-import tools
-
-from langchain.memory import ConversationBufferMemory
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-
-try:  # optional voice support
-    import voice
-except Exception:  # pragma: no cover - voice is optional
-    voice = None
+# LangChain, the tools and voice support are imported where they are first
+# needed, so ``import agent`` and ``agent.py --help`` stay fast.
+if TYPE_CHECKING:  # pragma: no cover
+    from langchain.chat_models import ChatOpenAI
+    from langchain.memory import ConversationBufferMemory
+    from handlers import FirstTokenTimer
 
 
 @dataclass
 class SimpleAgent:
-    """Represents a single conversational agent."""
+    """Represents a single conversational agent.
+
+    ``system_prompt`` is the rendered form of ``prompt``: the initial prompt
+    as a fixed prefix followed by short notes about recent answers.  Requests
+    send the prefix first and the notes after the history, right before the
+    new prompt, so everything up to the newest turn stays a cacheable prefix.
+
+    ``timeout`` bounds every model call in seconds; a call that runs past it
+    is cancelled and raises :class:`deadlines.DeadlineExceeded`.  With
+    ``hedge`` a non-streamed call that runs past this agent's observed p95
+    latency is duplicated and the first answer wins.
+    """
 
     name: str
-    chat: ChatOpenAI
-    memory: ConversationBufferMemory
+    chat: "ChatOpenAI"
+    memory: "ConversationBufferMemory"
     system_prompt: str
+    cache: Optional[ResponseCache] = None
+    prompt: Optional[EvolvingPrompt] = field(default=None, repr=False)
+    timeout: Optional[float] = None
+    hedge: bool = False
+    latencies: LatencyWindow = field(default_factory=LatencyWindow, repr=False)
 
-    def respond(self, prompt: str) -> str:
-        """Generate a response to ``prompt`` using the agent's memory."""
-        messages = [SystemMessage(content=self.system_prompt)]
-        for msg in self.memory.chat_memory.messages:
-            messages.append(msg)
+    def __post_init__(self) -> None:
+        if self.prompt is None:
+            self.prompt = EvolvingPrompt(self.system_prompt)
+        self.system_prompt = self.prompt.render()
+
+    def _build_messages(self, prompt: str) -> list:
+        from langchain.schema import HumanMessage, SystemMessage
+
+        messages = [SystemMessage(content=self.prompt.prefix)]
+        messages.extend(self.memory.chat_memory.messages)
+        # What changes every turn goes last, after the stable history.
+        recall = getattr(self.memory, "recall", None)
+        if recall is not None:  # retrieval memory: older turns relevant to this prompt
+            messages.extend(recall(prompt))
+        notes = self.prompt.render_notes()
+        if notes:
+            messages.append(SystemMessage(content=notes))
         messages.append(HumanMessage(content=prompt))
-        resp = self.chat(messages)
-        answer = resp.content
+        return messages
+
+    def respond(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Generate a response to ``prompt`` using the agent's memory.
+
+        ``timeout`` tightens the agent's own deadline for this call.
+        """
+        if self.hedge or earliest(self.timeout, timeout) is not None:
+            # Deadlines and hedging need cancellable calls.
+            return run_in_new_loop(self.arespond(prompt, timeout=timeout))
+        with metrics.AGENT_SECONDS.time(agent=self.name):
+            messages = self._build_messages(prompt)
+            key = self._cache_key(messages)
+            if key is None:
+                answer = self._generate(messages)
+            else:
+                answer = self.cache.get_or_compute(key, lambda: self._generate(messages))
+            self._remember(prompt, answer)
+        return answer
+
+    async def arespond(
+        self, prompt: str, callbacks: Optional[list] = None, timeout: Optional[float] = None
+    ) -> str:
+        """Asynchronous variant of :meth:`respond`.
+
+        Uses the chat model's ``agenerate`` when available and otherwise runs
+        the blocking call in a worker thread.  ``callbacks`` are LangChain
+        handlers that apply to this call only, e.g. to stream its tokens.
+        Memory is only updated once an answer arrived, so a cancelled or timed
+        out call leaves the agent unchanged.
+        """
+        timeout = earliest(self.timeout, timeout)
+        with metrics.AGENT_SECONDS.time(agent=self.name):
+            messages = self._build_messages(prompt)
+            key = None if callbacks else self._cache_key(messages)
+            if key is None:
+                answer = await self._acall(messages, callbacks, timeout)
+            else:
+                # The deadline bounds this caller's wait, not the shared call:
+                # requests coalesced onto it keep their own deadlines.
+                answer = await within(
+                    self.cache.aget_or_compute(key, lambda: self._acall(messages, callbacks, None)),
+                    timeout,
+                    self.name,
+                )
+            if getattr(self.memory, "blocking", False):
+                await asyncio.to_thread(self._remember, prompt, answer)
+            else:
+                self._remember(prompt, answer)
+        return answer
+
+    async def _acall(self, messages: list, callbacks: Optional[list], timeout: Optional[float]) -> str:
+        hedge_after = None
+        if self.hedge and not callbacks and not getattr(self.chat, "streaming", False):
+            # Streamed tokens cannot be taken back, so only silent calls are hedged.
+            hedge_after = self.latencies.quantile(0.95)
+        call = hedged(lambda: self._agenerate(messages, callbacks), hedge_after, self.name)
+        return await within(call, timeout, self.name)
+
+    def _generate(self, messages: list) -> str:
+        timer = self._first_token_timer()
+        try:
+            resp = self.chat(messages, callbacks=[timer]) if timer else self.chat(messages)
+        except Exception:
+            metrics.AGENT_ERRORS.inc(agent=self.name)
+            raise
+        self._count_tokens(messages, resp.content)
+        return resp.content
+
+    async def _agenerate(self, messages: list, callbacks: Optional[list]) -> str:
+        timer = self._first_token_timer()
+        callbacks = list(callbacks or []) + ([timer] if timer else [])
+        kwargs = {"callbacks": callbacks} if callbacks else {}
+        usage = None
+        start = time.perf_counter()
+        try:
+            agenerate = getattr(self.chat, "agenerate", None)
+            if agenerate is None:
+                resp = await asyncio.to_thread(self.chat, messages, **kwargs)
+                answer = resp.content
+            else:
+                result = await agenerate([messages], **kwargs)
+                answer = result.generations[0][0].text
+                usage = (getattr(result, "llm_output", None) or {}).get("token_usage")
+        except Exception:
+            metrics.AGENT_ERRORS.inc(agent=self.name)
+            raise
+        self.latencies.add(time.perf_counter() - start)
+        self._count_tokens(messages, answer, usage)
+        return answer
+
+    def _first_token_timer(self) -> "FirstTokenTimer | None":
+        if getattr(self.chat, "streaming", False):
+            from handlers import FirstTokenTimer
+
+            return FirstTokenTimer(self.name)
+        return None
+
+    def _count_tokens(self, messages: list, answer: str, usage: Optional[dict] = None) -> None:
+        if usage and usage.get("prompt_tokens") is not None:
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens = sum(estimate_tokens(msg.content) for msg in messages)
+            completion_tokens = estimate_tokens(answer)
+        metrics.AGENT_PROMPT_TOKENS.inc(prompt_tokens, agent=self.name)
+        metrics.AGENT_COMPLETION_TOKENS.inc(completion_tokens, agent=self.name)
+
+    def _cache_key(self, messages: list) -> Optional[str]:
+        # Streamed calls skip the cache: a hit would never reach the callbacks.
+        if self.cache is None or not self.cache.enabled or getattr(self.chat, "callbacks", None):
+            return None
+        # Only deterministic calls are cached; a sampled answer would be frozen.
+        temperature = getattr(self.chat, "temperature", None)
+        if temperature != 0:
+            return None
+        return self.cache.key(getattr(self.chat, "model_name", None), temperature, messages)
+
+    def restore(self, turns: list) -> None:
+        """Replay stored ``(prompt, answer)`` turns into memory without calling the model."""
+        for prompt, answer in turns:
+            self._remember(prompt, answer)
+
+    def _remember(self, prompt: str, answer: str) -> None:
         self.memory.chat_memory.add_user_message(prompt)
         self.memory.chat_memory.add_ai_message(answer)
-        # evolve prompt with simple summary of last answer
-        summary = f"Previously you said: {answer}"
-        self.system_prompt += "\n" + summary
-        if len(self.system_prompt) > 2000:
-            self.system_prompt = self.system_prompt[-2000:]
-        return answer
+        # evolve prompt with a short note about the last answer
+        self.prompt.add_note(answer)
+        self.system_prompt = self.prompt.render()
+
+
+def resume_agents(agents: list, store, session_id: str, turns: int = 10) -> int:
+    """Load the last ``turns`` turns of ``session_id`` from ``store`` into ``agents``.
+
+    Returns the number of turns restored for the agent with the longest history.
+    """
+    history = store.load_turns(session_id, turns)
+    for agent in agents:
+        agent.restore(history.get(agent.name, []))
+    return max((len(pairs) for pairs in history.values()), default=0)
+
+
+def print_stats(agents: list, cache: Optional[ResponseCache] = None) -> None:
+    """Print a per-agent latency and token breakdown."""
+    print(f"{'agent':<10} {'calls':>6} {'mean s':>8} {'p95 s':>8} {'ttft s':>8} "
+          f"{'prompt tok':>11} {'compl tok':>10} {'errors':>7}")
+    for agent in agents:
+        timing = metrics.AGENT_SECONDS.snapshot(agent=agent.name)
+        ttft = metrics.AGENT_FIRST_TOKEN_SECONDS.snapshot(agent=agent.name)
+        print(
+            f"{agent.name:<10} {timing['count']:>6} {timing['mean']:>8.3f} {timing['p95']:>8.3g} "
+            f"{ttft['mean']:>8.3f} {metrics.AGENT_PROMPT_TOKENS.value(agent=agent.name):>11.0f} "
+            f"{metrics.AGENT_COMPLETION_TOKENS.value(agent=agent.name):>10.0f} "
+            f"{metrics.AGENT_ERRORS.value(agent=agent.name):>7.0f}"
+        )
+    from router import ModelRouter
+
+    for agent in agents:
+        if not isinstance(agent.chat, ModelRouter):
+            continue
+        for model, stats in agent.chat.stats().items():
+            print(
+                f"{agent.name} -> {model}: {stats['calls']} recent calls, "
+                f"mean {stats['latency_s']:.3f} s, errors {stats['error_rate']:.0%}"
+            )
+    save = metrics.STORAGE_SAVE_SECONDS.snapshot()
+    if save["count"]:
+        print(f"storage: {save['count']} saves, mean {save['mean'] * 1000:.2f} ms")
+    for labels in metrics.TOOL_SECONDS.label_sets():
+        tool = metrics.TOOL_SECONDS.snapshot(**labels)
+        print(f"tool {labels['tool']}: {tool['count']} calls, mean {tool['mean']:.3f} s")
+    if cache is not None:
+        print("cache: " + ", ".join(f"{name} {value}" for name, value in cache.stats().items()))
+
+
+def parse_agent_models(values: list) -> dict:
+    """Parse ``--agent-models`` values of the form ``AGENT=MODELS``."""
+    models = {}
+    for value in values:
+        name, sep, spec = value.partition("=")
+        if not sep or not name or not spec:
+            raise ValueError(f"expected AGENT=MODELS, got {value!r}")
+        models[name.strip()] = spec.strip()
+    return models
+
+
+def run_batch_mode(args: argparse.Namespace, new_agents: Callable[[], list]) -> None:
+    """Run ``--batch`` and print progress to stderr."""
+    import sys
+
+    from batch import default_output_path, run_batch
+
+    output = args.output or default_output_path(args.batch)
+
+    def on_done(record: dict) -> None:
+        status = f"error: {record['error']}" if "error" in record else "ok"
+        print(f"[batch] {record['id']}: {status}", file=sys.stderr)
+
+    stats = run_in_new_loop(
+        run_batch(
+            args.batch,
+            output,
+            new_agents,
+            concurrency=args.batch_concurrency,
+            topology=args.topology,
+            dag=parse_dag(args.dag) if args.dag else None,
+            pipeline_concurrency=args.concurrency,
+            turn_timeout=args.turn_timeout,
+            on_done=on_done,
+        )
+    )
+    print(
+        f"[batch] {stats['done']} done, {stats['failed']} failed, "
+        f"{stats['skipped']} already in {output}",
+        file=sys.stderr,
+    )
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Multi-agent chat")
     parser.add_argument("--model", default="gpt-3.5-turbo", help="OpenAI model name")
+    parser.add_argument(
+        "--models",
+        help="Route between models, e.g. 'gpt-4o-mini:500,gpt-4o' (optional max prompt tokens)",
+    )
+    parser.add_argument(
+        "--agent-models",
+        action="append",
+        default=[],
+        metavar="AGENT=MODELS",
+        help="Models for one agent, e.g. 'Agent2=gpt-4o'; may be repeated",
+    )
+    parser.add_argument(
+        "--model-timeout", type=float, default=60.0, help="Seconds before a routed call fails over"
+    )
+    parser.add_argument(
+        "--agent-timeout", type=float, help="Seconds each agent may take before it is skipped"
+    )
+    parser.add_argument(
+        "--turn-timeout", type=float, help="Seconds a whole turn may take; late agents are skipped"
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request when a call runs past the agent's p95 latency",
+    )
     parser.add_argument("--temperature", type=float, default=0.7, help="Sampling temperature")
     parser.add_argument("--agents", type=int, default=2, help="Initial number of agents")
     parser.add_argument("--voice", action="store_true", help="Enable voice input/output")
     parser.add_argument("--stream", action="store_true", help="Stream responses in real time")
+    parser.add_argument(
+        "--topology", choices=TOPOLOGIES, default="chain", help="How agents are connected"
+    )
+    parser.add_argument(
+        "--dag", default="", help="Edges for --topology dag, e.g. 'Agent1->Agent2,Agent1->Agent3'"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Maximum agents generating at once"
+    )
+    parser.add_argument("--cache-db", help="SQLite file that persists cached responses")
+    parser.add_argument(
+        "--cache-ttl", type=float, help="Seconds before a cached response expires"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument(
+        "--memory-tokens",
+        type=int,
+        default=0,
+        help="Token budget per agent memory; older turns are summarized (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--recall",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Keep recent turns and retrieve the K most relevant older turns per prompt",
+    )
+    parser.add_argument(
+        "--compact-memory",
+        action="store_true",
+        help="Keep full histories in a compact byte arena instead of LangChain messages",
+    )
+    parser.add_argument("--session", help="Stored session ID to resume (default: start a new one)")
+    parser.add_argument(
+        "--resume-turns", type=int, default=10, help="Turns to reload when resuming a session"
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute shared by all agents (default: $OPENAI_RPM)"
+    )
+    parser.add_argument(
+        "--tpm", type=float, help="Tokens per minute shared by all agents (default: $OPENAI_TPM)"
+    )
+    parser.add_argument("--batch", metavar="FILE", help="Run the conversations in a JSONL file and exit")
+    parser.add_argument("--output", help="Results file for --batch (default: FILE.out.jsonl)")
+    parser.add_argument(
+        "--batch-concurrency", type=int, default=8, help="Conversations run at once in --batch mode"
+    )
     args = parser.parse_args()
+    if args.compact_memory and (args.recall or args.memory_tokens):
+        parser.error("--compact-memory cannot be combined with --recall or --memory-tokens")
+    try:
+        agent_models = parse_agent_models(args.agent_models)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.batch:
+        # Answers go to the output file; nothing is streamed or spoken.
+        args.stream = args.voice = False
+    elif args.stream and args.topology != "chain":
+        # Concurrent agents would interleave their tokens on one terminal
+        # and one speech queue.
+        print("[System] --stream only applies to the chain topology; printing whole answers")
+        args.stream = False
 
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY environment variable is required")
 
+    from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+    from langchain.memory import ConversationBufferMemory
+
+    import tools
+    from clients import get_pool
+    from handlers import SpeechStreamingHandler
+    from memory import CompactMemory, RetrievalMemory, SummaryWindowMemory, llm_summarizer
+    from router import ModelRouter
+    from storage import get_storage
+
+    voice = None
+    if args.voice:
+        try:  # optional voice support
+            import voice
+        except Exception:  # pragma: no cover - voice is optional
+            voice = None
+    storage = get_storage()
+    pool = get_pool()
+    pool.configure(rpm=args.rpm, tpm=args.tpm)
+
+    cache = ResponseCache(args.cache_db, ttl=args.cache_ttl)
+    cache.enabled = not args.no_cache
+
+    summarizer = None
+    if args.memory_tokens:
+        summarizer = llm_summarizer(pool.chat_model(args.model, api_key, temperature=0))
+
+    def new_memory():
+        if args.recall:
+            return RetrievalMemory(k=args.recall)
+        if args.memory_tokens:
+            return SummaryWindowMemory(max_tokens=args.memory_tokens, summarize=summarizer)
+        if args.compact_memory:
+            return CompactMemory()
+        return ConversationBufferMemory()
+
     def new_agent(n: int) -> SimpleAgent:
-        return SimpleAgent(
-            name=f"Agent{n}",
-            chat=ChatOpenAI(
-                openai_api_key=api_key,
-                model_name=args.model,
+        callbacks = None
+        if args.stream:
+            callbacks = [StreamingStdOutCallbackHandler()]
+            if args.voice and voice:
+                callbacks.append(SpeechStreamingHandler())
+
+        def new_chat(model: str):
+            return pool.chat_model(
+                model,
+                api_key,
                 temperature=args.temperature,
                 streaming=args.stream,
-                callbacks=[StreamingStdOutCallbackHandler()] if args.stream else None,
+                callbacks=callbacks,
+            )
+
+        models = agent_models.get(f"Agent{n}", args.models)
+        return SimpleAgent(
+            name=f"Agent{n}",
+            chat=(
+                ModelRouter.from_spec(models, new_chat, timeout=args.model_timeout)
+                if models
+                else new_chat(args.model)
             ),
-            memory=ConversationBufferMemory(),
+            memory=new_memory(),
             system_prompt=f"You are Agent{n}, a helpful assistant.",
+            cache=cache,
+            timeout=args.agent_timeout,
+            hedge=args.hedge,
         )
 
+    if args.batch:
+        run_batch_mode(args, lambda: [new_agent(i + 1) for i in range(args.agents)])
+        return
+
     agents = [new_agent(i + 1) for i in range(args.agents)]
+    session_id = args.session or uuid.uuid4().hex
+    if args.session and storage:
+        restored = resume_agents(agents, storage, session_id, args.resume_turns)
+        print(f"Resumed {restored} turns of session {session_id}")
+    pipeline = Pipeline(
+        agents,
+        topology=args.topology,
+        dag=parse_dag(args.dag) if args.dag else None,
+        concurrency=args.concurrency,
+        turn_timeout=args.turn_timeout,
+    )
+
+    def on_skip(agent: SimpleAgent, exc: Exception) -> None:
+        print(f"[{agent.name} skipped: {exc}]")
+
+    # Filled by the pipeline each turn: what every agent was asked.
+    prompts: dict = {}
+
+    def on_result(agent: SimpleAgent, answer: str) -> None:
+        if not args.stream:
+            print(f"{agent.name}: {answer}")
+        if args.voice and voice and not args.stream:
+            voice.speak(answer)  # queued; streamed answers are spoken per sentence
+        if args.stream:
+            print()  # newline after streaming tokens
+            print(f"[{agent.name} done]")
+        if storage:
+            storage.save(agent.name, "assistant", answer, session_id, prompts[agent.name])
 
+    def report_clone(job: "tools.CloneJob") -> None:
+        if job.status == "done":
+            print(f"\n[Git] job {job.job_id}: cloned to {job.path}")
+        else:
+            print(f"\n[Git error] job {job.job_id}: {job.error}")
+
+    if storage:
+        print(f"Session: {session_id}")
     print("Type 'add agent' to create a new agent. Type 'quit' to exit.")
     while True:
         if args.voice and voice:
@@ -102,6 +517,8 @@ def main() -> None:
         else:
             user_input = input("User: ")
         if user_input.lower() in {"quit", "exit"}:
+            if voice:
+                voice.get_worker().shutdown()
             break
 
         if user_input.startswith("search "):
@@ -114,14 +531,28 @@ def main() -> None:
             print(result)
             continue
 
+        if user_input.startswith("history "):
+            if not storage:
+                print("[History] persistence is disabled (set CHAT_PERSIST=1)")
+                continue
+            for hit in storage.search(user_input[len("history "):]):
+                print(f"[{hit.id}] {hit.session_id[:8]} {hit.agent}: {hit.snippet}")
+            continue
+
         if user_input.startswith("clone "):
             repo = user_input[len("clone "):]
-            try:
-                path = tools.pull_from_github(repo)
-            except Exception as exc:
-                print(f"[Git error] {exc}")
-                continue
-            print(f"Cloned to {path}")
+            job = tools.get_clone_manager().submit(repo, on_done=report_clone)
+            print(f"[Git] Started job {job.job_id} for {repo}")
+            continue
+
+        if user_input.lower() == "stats":
+            print_stats(agents, cache)
+            continue
+
+        if user_input.lower() == "jobs":
+            for job in tools.get_clone_manager().jobs():
+                detail = job.path or job.error or ""
+                print(f"[Git] job {job.job_id} {job.status}: {job.repo_url} {detail}".rstrip())
             continue
 
         if user_input.lower() == "add agent":
@@ -131,20 +562,9 @@ def main() -> None:
             continue
 
         if storage:
-            storage.save("user", "user", user_input)
-        prompt = user_input
-        for agent in agents:
-            answer = agent.respond(prompt)
-            if not args.stream:
-                print(f"{agent.name}: {answer}")
-            if args.voice and voice:
-                voice.speak(answer)
-            if args.stream:
-                print()  # newline after streaming tokens
-                print(f"[{agent.name} done]")
-            if storage:
-                storage.save(agent.name, "assistant", answer)
-            prompt = answer  # pass along to the next agent
+            storage.save("user", "user", user_input, session_id)
+        prompts.clear()
+        pipeline.run(user_input, on_result=on_result, on_skip=on_skip, inputs=prompts)
 
 
 if __name__ == "__main__":
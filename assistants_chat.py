@@ -5,11 +5,71 @@ self‑updating assistant that evolves based on the conversation.
 """
 import os
 import time
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
 from openai import OpenAI
 
+from prompts import EvolvingPrompt
+
+TERMINAL_STATUSES = {
+    "completed",
+    "failed",
+    "cancelled",
+    "expired",
+    "requires_action",
+    "incomplete",
+}
+
+
+class RunError(RuntimeError):
+    """Raised when a run ends in any status other than ``completed``."""
+
+    def __init__(self, run) -> None:
+        detail = getattr(run, "last_error", None)
+        message = f"Run {run.id} ended with status {run.status!r}"
+        if detail:
+            message += f": {getattr(detail, 'message', detail)}"
+        super().__init__(message)
+        self.run = run
+
+
+def wait_for_run(
+    runs,
+    thread_id: str,
+    run_id: str,
+    timeout: float = 120.0,
+    initial_delay: float = 0.05,
+    max_delay: float = 2.0,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """Poll ``runs.retrieve`` with exponential backoff until a terminal status.
+
+    The first checks come quickly so short runs return with little added
+    latency; the interval then doubles up to ``max_delay``.  The run is
+    cancelled and :class:`TimeoutError` raised once ``timeout`` elapses.
+    """
+    deadline = clock() + timeout
+    delay = initial_delay
+    while True:
+        run = runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status in TERMINAL_STATUSES:
+            return run
+        remaining = deadline - clock()
+        if remaining <= 0:
+            runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise TimeoutError(f"Run {run_id} did not finish within {timeout} seconds")
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def message_text(message) -> str:
+    """Concatenate the text parts of an assistant message."""
+    return "".join(
+        part.text.value for part in message.content if getattr(part, "type", "text") == "text"
+    )
+
 
 @dataclass
 class AssistantAgent:
@@ -17,36 +77,75 @@ class AssistantAgent:
     assistant_id: str
     thread_id: str
     instructions: str
+    prompt: Optional[EvolvingPrompt] = field(default=None, repr=False)
+    timeout: float = 120.0
+    stream: bool = True
+
+    def __post_init__(self) -> None:
+        if self.prompt is None:
+            self.prompt = EvolvingPrompt(self.instructions)
+        self.instructions = self.prompt.render()
+
+    def respond(self, user_message: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Send ``user_message`` and return the assistant's reply.
 
-    def respond(self, user_message: str) -> str:
-        self.client.beta.threads.messages.create(
+        Runs are streamed when the client supports it, which also lets
+        ``on_token`` receive text as it is generated; otherwise the run is
+        polled with :func:`wait_for_run`.  Raises :class:`RunError` if the run
+        does not complete.
+        """
+        threads = self.client.beta.threads
+        threads.messages.create(
             thread_id=self.thread_id,
             role="user",
             content=user_message,
         )
-        run = self.client.beta.threads.runs.create(
+        if self.stream and hasattr(threads.runs, "stream"):
+            run, message = self._stream_run(on_token)
+        else:
+            run = threads.runs.create(
+                thread_id=self.thread_id,
+                assistant_id=self.assistant_id,
+                instructions=self.instructions,
+            )
+            run = wait_for_run(threads.runs, self.thread_id, run.id, timeout=self.timeout)
+            message = None
+        if run.status != "completed":
+            if run.status == "requires_action":
+                # No tools are registered, so free the thread for the next turn.
+                threads.runs.cancel(thread_id=self.thread_id, run_id=run.id)
+            raise RunError(run)
+        if message is None:
+            message = self._latest_reply(run.id)
+        answer = message_text(message) if message is not None else ""
+        self.prompt.add_note(answer)
+        self.instructions = self.prompt.render()
+        return answer
+
+    def _stream_run(self, on_token: Optional[Callable[[str], None]]):
+        with self.client.beta.threads.runs.stream(
             thread_id=self.thread_id,
             assistant_id=self.assistant_id,
             instructions=self.instructions,
+            timeout=self.timeout,
+        ) as stream:
+            if on_token is None:
+                stream.until_done()
+            else:
+                for text in stream.text_deltas:
+                    on_token(text)
+            run = stream.get_final_run()
+            replies = [msg for msg in stream.get_final_messages() if msg.role == "assistant"]
+        return run, replies[-1] if replies else None
+
+    def _latest_reply(self, run_id: str):
+        page = self.client.beta.threads.messages.list(
+            thread_id=self.thread_id, order="desc", limit=1, run_id=run_id
         )
-        while True:
-            run = self.client.beta.threads.runs.retrieve(
-                thread_id=self.thread_id, run_id=run.id
-            )
-            if run.status in {"completed", "failed"}:
-                break
-            time.sleep(0.5)
-        messages = self.client.beta.threads.messages.list(thread_id=self.thread_id)
-        for msg in reversed(messages.data):
+        for msg in page.data:
             if msg.role == "assistant":
-                answer = msg.content[0].text.value
-                break
-        else:
-            answer = ""
-        self.instructions += f"\nPreviously you said: {answer}"
-        if len(self.instructions) > 2000:
-            self.instructions = self.instructions[-2000:]
-        return answer
+                return msg
+        return None
 
 
 def main() -> None:
@@ -73,8 +172,12 @@ def main() -> None:
         user_input = input("User: ")
         if user_input.lower() in {"quit", "exit"}:
             break
-        answer = agent.respond(user_input)
-        print(f"Assistant: {answer}")
+        print("Assistant: ", end="", flush=True)
+        try:
+            agent.respond(user_input, on_token=lambda text: print(text, end="", flush=True))
+        except (RunError, TimeoutError) as exc:
+            print(f"[Run error] {exc}", end="")
+        print()
 
 
 if __name__ == "__main__":
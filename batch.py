@@ -0,0 +1,176 @@
+"""Run JSONL prompt files through the agents without a REPL.
+
+Each input line is one conversation: a JSON object with an ``id`` (or
+``request_id``) and either a list of ``prompts`` or a single ``prompt``
+(``message`` and ``body`` are accepted too, so files such as a request backlog
+work unchanged).  Up to ``concurrency`` conversations run at once, each with
+its own fresh agents.  The input is read lazily, so files of any size stream
+through in constant memory.
+
+Results are appended to the output JSONL as soon as each conversation
+finishes.  The output doubles as the checkpoint: on restart, conversations
+that already have a successful record are skipped.  Failed conversations are
+recorded with an ``error`` and retried on the next run; a later record for the
+same ``id`` supersedes an earlier one.  Malformed input lines are recorded as
+failures too and do not stop the batch.
+"""
+
+import asyncio
+import json
+import os
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from pipeline import Pipeline
+
+PROMPT_FIELDS = ("prompt", "message", "body")
+
+
+def parse_record(record: dict, line_no: int) -> Tuple[str, List[str]]:
+    """Return ``(conversation id, prompts)`` for one input object."""
+    if not isinstance(record, dict):
+        raise ValueError(f"line {line_no}: expected a JSON object")
+    conv_id = record.get("id") or record.get("request_id") or f"line-{line_no}"
+    prompts = record.get("prompts")
+    if prompts is None:
+        prompt = next((record[name] for name in PROMPT_FIELDS if record.get(name)), None)
+        prompts = [] if prompt is None else [prompt]
+    if not prompts or not all(isinstance(p, str) for p in prompts):
+        raise ValueError(f"line {line_no}: expected 'prompts' or one of {', '.join(PROMPT_FIELDS)}")
+    return str(conv_id), list(prompts)
+
+
+def read_conversations(path: str) -> Iterator[Tuple[str, Optional[List[str]], Optional[str]]]:
+    """Yield ``(id, prompts, error)`` from the JSONL file at ``path`` one line at a time.
+
+    A malformed line yields ``prompts=None`` and the reason in ``error``
+    instead of ending the batch; its id is ``line-N`` unless it names one.
+    """
+    with open(path, encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield f"line-{line_no}", None, f"{path}:{line_no}: invalid JSON ({exc})"
+                continue
+            try:
+                conv_id, prompts = parse_record(record, line_no)
+            except ValueError as exc:
+                named = isinstance(record, dict) and (record.get("id") or record.get("request_id"))
+                yield str(named or f"line-{line_no}"), None, f"{path}:{exc}"
+                continue
+            yield conv_id, prompts, None
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Return ids with a successful record in the output file at ``path``.
+
+    A partial last line left by an interrupted run is truncated so appending
+    can continue cleanly.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            fh.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "error" in record:
+            done.discard(record.get("id"))
+        else:
+            done.add(record.get("id"))
+    return done
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    new_agents: Callable[[], list],
+    concurrency: int = 8,
+    topology: str = "chain",
+    dag: Optional[Dict[str, List[str]]] = None,
+    pipeline_concurrency: int = 4,
+    turn_timeout: Optional[float] = None,
+    on_done: Optional[Callable[[dict], None]] = None,
+) -> Dict[str, int]:
+    """Run every conversation in ``input_path`` and append results to ``output_path``.
+
+    ``new_agents`` builds the agents for one conversation and
+    ``turn_timeout`` bounds each of its turns (agents that miss it are left
+    out of ``replies``).  ``on_done`` is called with each output record.
+    Returns counts of ``done``, ``failed`` and ``skipped`` (already
+    completed) conversations.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    done = completed_ids(output_path)
+    stats = {"done": 0, "failed": 0, "skipped": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: Set[asyncio.Task] = set()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        def write(record: dict) -> None:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if on_done is not None:
+                on_done(record)
+
+        async def run_one(conv_id: str, prompts: List[str]) -> None:
+            try:
+                pipeline = Pipeline(
+                    new_agents(),
+                    topology=topology,
+                    dag=dag,
+                    concurrency=pipeline_concurrency,
+                    turn_timeout=turn_timeout,
+                )
+                turns = []
+                for prompt in prompts:
+                    results = await pipeline.arun(prompt)
+                    turns.append(
+                        {
+                            "prompt": prompt,
+                            "reply": results[-1][1] if results else "",
+                            "replies": {agent.name: answer for agent, answer in results},
+                        }
+                    )
+                record = {"id": conv_id, "turns": turns}
+                stats["done"] += 1
+            except Exception as exc:
+                record = {"id": conv_id, "error": f"{type(exc).__name__}: {exc}"}
+                stats["failed"] += 1
+            finally:
+                semaphore.release()
+            write(record)
+
+        try:
+            for conv_id, prompts, error in read_conversations(input_path):
+                if conv_id in done:
+                    stats["skipped"] += 1
+                    continue
+                if error is not None:
+                    stats["failed"] += 1
+                    write({"id": conv_id, "error": f"ValueError: {error}"})
+                    continue
+                # Blocks reading further input until a slot frees up.
+                await semaphore.acquire()
+                task = asyncio.ensure_future(run_one(conv_id, prompts))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def default_output_path(input_path: str) -> str:
+    root, _ = os.path.splitext(input_path)
+    return root + ".out.jsonl"
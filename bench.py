@@ -0,0 +1,368 @@
+"""Offline benchmark and load-test suite.
+
+Every benchmark runs against :class:`fake_llm.FakeChatModel`, so no API key or
+network access is needed and results are repeatable.  Run all of them with::
+
+    python bench.py --output bench.json
+
+or a subset with ``python bench.py respond storage``.  Passing
+``--compare previous.json`` prints metrics that got worse by more than
+``--threshold`` percent and exits non-zero, which makes it usable in CI.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from fake_llm import FakeChatModel
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _timed(fn: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _new_agent(name: str, chat, memory=None):
+    from agent import SimpleAgent
+    from langchain.memory import ConversationBufferMemory
+
+    return SimpleAgent(
+        name=name,
+        chat=chat,
+        memory=memory if memory is not None else ConversationBufferMemory(),
+        system_prompt=f"You are {name}, a helpful assistant.",
+    )
+
+
+def bench_respond(history_sizes=(0, 100, 1000, 5000), repeat: int = 50) -> Dict[str, float]:
+    """Per-call overhead of ``SimpleAgent.respond`` as history grows."""
+    from memory import SummaryWindowMemory
+
+    results = {}
+    for kind in ("buffer", "window"):
+        for size in history_sizes:
+            memory = SummaryWindowMemory(max_tokens=2000) if kind == "window" else None
+            agent = _new_agent("Agent1", FakeChatModel(reply="ok"), memory)
+            for i in range(size):
+                agent.memory.chat_memory.add_user_message(f"question {i}")
+                agent.memory.chat_memory.add_ai_message(f"answer {i}")
+            samples = _timed(lambda: agent.respond("hello"), repeat)
+            results[f"{kind}_history_{size}_us"] = statistics.mean(samples) * 1e6
+    return results
+
+
+def bench_pipeline(agents: int = 6, latency: float = 0.05) -> Dict[str, float]:
+    """Wall time of one turn with chain versus broadcast topologies."""
+    from pipeline import Pipeline
+
+    results = {}
+    for topology in ("chain", "broadcast"):
+        team = [
+            _new_agent(f"Agent{i}", FakeChatModel(latency=latency, reply="ok"))
+            for i in range(1, agents + 1)
+        ]
+        pipeline = Pipeline(team, topology=topology, concurrency=agents)
+        results[f"{topology}_{agents}_agents_s"] = min(_timed(lambda: pipeline.run("hi"), 3))
+    return results
+
+
+def bench_tail(
+    users: int = 10, turns: int = 60, warmup: int = 20, agents: int = 3
+) -> Dict[str, float]:
+    """p50/p99 turn latency under load when 2% of model calls are very slow.
+
+    Compares plain calls, hedged calls and a per-agent deadline that skips
+    late agents.  The first ``warmup`` turns of every user are not measured,
+    so hedging has a p95 estimate to work from.
+    """
+    import asyncio
+
+    from pipeline import Pipeline
+
+    modes = {"plain": {}, "hedged": {"hedge": True}, "deadline": {"timeout": 0.1}}
+    results = {}
+    for mode, options in modes.items():
+
+        async def user(seed: int) -> List[float]:
+            team = []
+            for i in range(1, agents + 1):
+                chat = FakeChatModel(
+                    latency=0.01, tail_probability=0.02, tail_latency=0.5, reply="ok", seed=seed * 100 + i
+                )
+                agent = _new_agent(f"Agent{i}", chat)
+                agent.hedge = options.get("hedge", False)
+                agent.timeout = options.get("timeout")
+                team.append(agent)
+            pipeline = Pipeline(team, concurrency=agents)
+            samples = []
+            for turn in range(turns):
+                start = time.perf_counter()
+                await pipeline.arun(f"question {turn}")
+                if turn >= warmup:
+                    samples.append(time.perf_counter() - start)
+            return samples
+
+        async def run_users() -> list:
+            return await asyncio.gather(*(user(seed) for seed in range(users)))
+
+        samples = [sample for per_user in asyncio.run(run_users()) for sample in per_user]
+        results[f"{mode}_p50_s"] = percentile(samples, 0.5)
+        results[f"{mode}_p99_s"] = percentile(samples, 0.99)
+    return results
+
+
+def bench_retrieval(turns: int = 100_000, repeat: int = 50) -> Dict[str, float]:
+    """Indexing rate and top-5 query latency of the BM25 turn index."""
+    import random
+
+    from retrieval import BM25Index
+
+    rng = random.Random(0)
+    vocab = [f"w{i}" for i in range(20000)]
+    # Zipf-like word frequencies, as in natural text.
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    texts = [" ".join(rng.choices(vocab, weights, k=30)) for _ in range(turns)]
+    index = BM25Index()
+    start = time.perf_counter()
+    for text in texts:
+        index.add(text)
+    elapsed = time.perf_counter() - start
+    queries = [" ".join(rng.choices(vocab, weights, k=6)) for _ in range(repeat)]
+    samples = [s for query in queries for s in _timed(lambda: index.search(query, 5), 1)]
+    return {
+        "index_turns_per_s": turns / elapsed,
+        f"query_{turns}_turns_ms": statistics.mean(samples) * 1000,
+        f"query_{turns}_turns_p95_ms": percentile(samples, 0.95) * 1000,
+    }
+
+
+def bench_memory(turns: int = 2000) -> Dict[str, float]:
+    """Python heap bytes per stored turn for each unbounded memory backend."""
+    import tracemalloc
+
+    from langchain.memory import ConversationBufferMemory
+
+    from memory import CompactMemory
+
+    results = {}
+    for name, factory in (("buffer", ConversationBufferMemory), ("compact", CompactMemory)):
+        memory = factory()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        # Texts are built inside the measurement, as if they came off the wire.
+        for i in range(turns):
+            memory.chat_memory.add_user_message(f"question {i}: how do I roll back the deploy?")
+            memory.chat_memory.add_ai_message(f"answer {i}: " + "run the rollback job, then " * 8)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results[f"{name}_bytes_per_turn"] = used / turns
+    results["text_bytes_per_turn"] = len(
+        "question 0: how do I roll back the deploy?" + "answer 0: " + "run the rollback job, then " * 8
+    )
+    return results
+
+
+def bench_storage(messages: int = 2000) -> Dict[str, float]:
+    """``Storage.save`` throughput, synchronous and write-behind."""
+    from storage import Storage
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "write_behind"):
+            store = Storage(os.path.join(tmp, f"{mode}.db"), write_behind=mode == "write_behind")
+            start = time.perf_counter()
+            for i in range(messages):
+                store.save("Agent1", "assistant", f"message {i}")
+            store.flush()
+            elapsed = time.perf_counter() - start
+            store.close()
+            results[f"{mode}_msgs_per_s"] = messages / elapsed
+    return results
+
+
+def _start_test_server(latency: float):
+    """Serve ``server.app`` with fake agents on a free local port."""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs) -> None:
+            pass
+
+    server.sessions.factory = lambda: [
+        _new_agent("Agent1", FakeChatModel(latency=latency, tokens_per_second=200, reply="a b c d"))
+    ]
+    server.get_storage = lambda: None
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_port}"
+
+
+def load_test(url: str, concurrency: int, requests: int) -> Dict[str, float]:
+    """POST ``requests`` chats to ``url`` with ``concurrency`` clients."""
+
+    def one(i: int) -> float:
+        body = json.dumps({"message": f"hi {i}", "session_id": f"bench-{i}"}).encode()
+        req = urllib.request.Request(
+            url + "/chat", data=body, headers={"Content-Type": "application/json"}
+        )
+        start = time.perf_counter()
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "rps": requests / elapsed,
+    }
+
+
+def bench_http(
+    concurrency_levels=(1, 4, 16), requests: int = 64, latency: float = 0.05, url: str = ""
+) -> Dict[str, float]:
+    """Sweep client concurrency against server.py and report latency/throughput."""
+    httpd = None
+    if not url:
+        httpd, url = _start_test_server(latency)
+    results = {}
+    try:
+        for level in concurrency_levels:
+            for name, value in load_test(url, level, requests).items():
+                results[f"c{level}_{name}"] = value
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+    return results
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STARTUP_MODULES = ("agent", "server", "storage")
+
+
+def _import_time_us(module: str) -> int:
+    """Cumulative import time of ``module`` in a fresh interpreter (``-X importtime``)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nested
+        # imports are indented, so the top-level module has a single space.
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2] == f" {module}":
+            return int(parts[1])
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def bench_startup(modules=STARTUP_MODULES, repeat: int = 3) -> Dict[str, float]:
+    """Cold-start cost of each entry point and of ``agent.py --help``."""
+    results = {}
+    for module in modules:
+        best = min(_import_time_us(module) for _ in range(repeat))
+        results[f"{module}_import_ms"] = best / 1000
+    cmd = [sys.executable, os.path.join(ROOT, "agent.py"), "--help"]
+    results["agent_help_s"] = min(
+        _timed(lambda: subprocess.run(cmd, capture_output=True, check=True), repeat)
+    )
+    return results
+
+
+BENCHMARKS = {
+    "respond": bench_respond,
+    "pipeline": bench_pipeline,
+    "storage": bench_storage,
+    "retrieval": bench_retrieval,
+    "tail": bench_tail,
+    "memory": bench_memory,
+    "http": bench_http,
+    "startup": bench_startup,
+}
+
+# Metrics where a larger value is better; everything else is a duration.
+HIGHER_IS_BETTER = ("_per_s", "rps")
+
+
+def compare(previous: dict, current: dict, threshold: float) -> List[str]:
+    """Return descriptions of metrics that regressed by more than ``threshold`` %."""
+    regressions = []
+    for bench, metrics in current.items():
+        for name, value in metrics.items():
+            old = previous.get(bench, {}).get(name)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            if name.endswith(HIGHER_IS_BETTER):
+                change = -change
+            if change > threshold:
+                regressions.append(f"{bench}.{name}: {old:.4g} -> {value:.4g} ({change:+.1f}% worse)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run offline benchmarks")
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed slowdown in percent")
+    parser.add_argument("--url", default="", help="Load-test a running server instead of a local one")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.benchmarks) - set(BENCHMARKS))
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    for name in args.benchmarks or list(BENCHMARKS):
+        kwargs = {"url": args.url} if name == "http" else {}
+        results[name] = BENCHMARKS[name](**kwargs)
+        for metric, value in results[name].items():
+            print(f"{name}.{metric}: {value:.4g}")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump({"timestamp": time.time(), "results": results}, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)["results"]
+        regressions = compare(previous, results, args.threshold)
+        for line in regressions:
+            print(f"[Regression] {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Two-tier cache for chat completions.
+
+Responses are keyed on a hash of the model name, temperature and the full
+message list.  Lookups hit an in-memory LRU first and an optional SQLite file
+second; both tiers honour a TTL and a maximum entry count.  Identical requests
+that arrive while the first one is still in flight wait for its result instead
+of calling the API again ("single-flight").
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class ResponseCache:
+    """Cache chat completions in memory and, if ``path`` is given, on disk."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 1024,
+        max_disk_entries: int = 100_000,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.enabled = True
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            self.conn.commit()
+            self._disk_count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model: Optional[str], temperature: Optional[float], messages: list) -> str:
+        """Return the cache key for a request."""
+        payload = [
+            model,
+            temperature,
+            [[getattr(msg, "type", type(msg).__name__), msg.content] for msg in messages],
+        ]
+        return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._memory),
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for ``key`` or ``None`` on a miss."""
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl is None or now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (self.ttl is None or now - row[1] <= self.ttl):
+                    with self.conn:
+                        self.conn.execute(
+                            "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+                        )
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        now = self.clock()
+        with self._lock:
+            self._remember(key, value, now)
+            if self.conn is not None:
+                existed = self.conn.execute(
+                    "SELECT 1 FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, created, accessed) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, value, now, now),
+                    )
+                if existed is None:
+                    self._disk_count += 1
+                self._prune_disk(now)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """Return the cached value or compute it once across all threads."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """Asynchronous variant of :meth:`get_or_compute` for one event loop.
+
+        Waiting requests share the first caller's result or error.  If that
+        caller is cancelled (for instance by its own deadline) the computation
+        is abandoned and one of the waiting requests computes the value instead.
+        """
+        value = await self._offload(self.get, key)
+        if value is not None:
+            return value
+        while True:
+            future = self._ainflight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this request itself was cancelled
+        future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(value)
+            await self._offload(self.put, key, value)
+            return value
+        finally:
+            if self._ainflight.get(key) is future:
+                del self._ainflight[key]
+
+    async def _offload(self, func: Callable, *args):
+        # The disk tier runs blocking SQLite statements; keep them off the loop.
+        if self.conn is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now: float) -> None:
+        if self.ttl is not None and self._disk_count > self.max_disk_entries:
+            with self.conn:
+                cur = self.conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+                )
+            self._disk_count -= cur.rowcount
+        excess = self._disk_count - self.max_disk_entries
+        if excess > 0:
+            with self.conn:
+                cur = self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+            self._disk_count -= cur.rowcount
@@ -0,0 +1,273 @@
+"""Compact snapshots of whole agent sets.
+
+Agents keep their evolved prompt and memory only in process memory, so a
+restart used to lose them.  A checkpoint stores named agent sets (one per
+server session, or a single set for the GUI): each agent's name, model
+settings, prompt notes and memory.
+
+File layout, all integers little-endian::
+
+    b"AGCK" | version (u16) | body length (u32) | CRC-32 of body (u32) | body
+
+The body is zlib-compressed compact JSON.  Files are written to a temporary
+name and renamed into place, so a crash never leaves a torn checkpoint.
+Restoring fills each memory in one pass, building message objects without
+validation and without replaying them through the memory's ``add_*`` methods
+(which would re-run trimming and summaries).
+"""
+
+import json
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+MAGIC = b"AGCK"
+VERSION = 1
+_HEADER = struct.Struct("<4sHII")
+
+AgentSets = Dict[str, list]
+
+
+def encode_agent(agent) -> dict:
+    """Return the plain-data state of one :class:`agent.SimpleAgent`."""
+    from memory import CompactMemory, RetrievalMemory, SummaryWindowMemory
+
+    memory = agent.memory
+    state = {
+        "name": agent.name,
+        "model": {
+            "model_name": getattr(agent.chat, "model_name", None),
+            "temperature": getattr(agent.chat, "temperature", None),
+        },
+        "timeout": agent.timeout,
+        "hedge": agent.hedge,
+        "prompt": {
+            "prefix": agent.prompt.prefix,
+            "notes": list(agent.prompt.notes),
+            "max_notes": agent.prompt.notes.maxlen,
+            "max_tokens": agent.prompt.max_tokens,
+            "note_chars": agent.prompt.note_chars,
+        },
+    }
+    if isinstance(memory, SummaryWindowMemory):
+        state["memory"] = {
+            "kind": "window",
+            "max_tokens": memory.max_tokens,
+            "summary_tokens": memory.summary_tokens,
+            "summary": memory.summary,
+            "messages": [[msg.type, msg.content] for msg, _ in memory._window],
+        }
+    elif isinstance(memory, RetrievalMemory):
+        # The index is rebuilt from the turns on restore.
+        state["memory"] = {
+            "kind": "retrieval",
+            "k": memory.k,
+            "window_turns": memory.window_turns,
+            "max_chars": memory.max_chars,
+            "turns": [list(turn) for turn in memory.turns],
+            "pending": memory._pending,
+        }
+    else:
+        messages = list(memory.chat_memory.messages)
+        state["memory"] = {
+            "kind": "compact" if isinstance(memory, CompactMemory) else "buffer",
+            "messages": [[getattr(msg, "type", "human"), msg.content] for msg in messages],
+        }
+    return state
+
+
+def snapshot(agent_sets: AgentSets) -> Dict[str, List[dict]]:
+    """Encode ``{set name: [agents]}`` into plain data."""
+    return {name: [encode_agent(agent) for agent in agents] for name, agents in agent_sets.items()}
+
+
+def dumps(states: Dict[str, List[dict]]) -> bytes:
+    """Serialize :func:`snapshot` output to the checkpoint format."""
+    body = zlib.compress(
+        json.dumps(states, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    )
+    return _HEADER.pack(MAGIC, VERSION, len(body), zlib.crc32(body)) + body
+
+
+def loads(data: bytes) -> Dict[str, List[dict]]:
+    """Parse checkpoint bytes, validating the header and checksum."""
+    if len(data) < _HEADER.size:
+        raise ValueError("checkpoint is truncated")
+    magic, version, length, crc = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not an agent checkpoint")
+    if version > VERSION:
+        raise ValueError(f"checkpoint version {version} is newer than supported ({VERSION})")
+    body = data[_HEADER.size:_HEADER.size + length]
+    if len(body) != length or zlib.crc32(body) != crc:
+        raise ValueError("checkpoint is corrupt")
+    return json.loads(zlib.decompress(body))
+
+
+def write_checkpoint(path: str, data: bytes) -> None:
+    """Atomically replace ``path`` with ``data``."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_checkpoint(path: str) -> Dict[str, List[dict]]:
+    """Return the states stored at ``path``, or ``{}`` if there is no checkpoint."""
+    try:
+        with open(path, "rb") as fh:
+            return loads(fh.read())
+    except FileNotFoundError:
+        return {}
+
+
+def _build_messages(pairs: list) -> list:
+    from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+    classes = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+    # construct() skips validation: the data was valid when it was saved.
+    return [classes.get(kind, HumanMessage).construct(content=text) for kind, text in pairs]
+
+
+def decode_memory(state: dict, summarize: Optional[Callable] = None):
+    """Rebuild a memory object from :func:`encode_agent`'s ``memory`` entry.
+
+    ``summarize`` is handed to a restored :class:`memory.SummaryWindowMemory`;
+    functions are not saved, so the caller supplies the one it builds with.
+    """
+    if state["kind"] == "retrieval":
+        from memory import RetrievalMemory
+
+        memory = RetrievalMemory(state["k"], state["window_turns"], state["max_chars"])
+        for prompt, answer in state["turns"]:
+            memory._add_turn(prompt, answer)
+        memory._pending = state["pending"]
+        return memory
+    if state["kind"] == "compact":
+        from memory import ROLES, CompactMemory
+
+        memory = CompactMemory()
+        for kind, text in state["messages"]:
+            memory._append(ROLES.index(kind) if kind in ROLES else 0, text)
+        return memory
+    messages = _build_messages(state["messages"])
+    if state["kind"] == "window":
+        from langchain.schema import SystemMessage
+
+        from memory import SUMMARY_PREFIX, SummaryWindowMemory
+
+        memory = SummaryWindowMemory(
+            state["max_tokens"], state["summary_tokens"], summarize=summarize
+        )
+        memory.summary = state["summary"]
+        if memory.summary:
+            memory._summary_message = SystemMessage.construct(content=SUMMARY_PREFIX + memory.summary)
+        memory._window = deque((msg, memory.count_tokens(msg.content)) for msg in messages)
+        memory._window_tokens = sum(tokens for _, tokens in memory._window)
+        return memory
+    from langchain.memory import ConversationBufferMemory
+
+    memory = ConversationBufferMemory()
+    memory.chat_memory.messages = messages
+    return memory
+
+
+def decode_agent(
+    state: dict, new_chat: Callable[[dict], object], cache=None, summarize: Optional[Callable] = None
+):
+    """Rebuild a :class:`agent.SimpleAgent`; ``new_chat`` gets the saved model settings."""
+    from agent import SimpleAgent
+    from prompts import EvolvingPrompt
+
+    prompt_state = state["prompt"]
+    prompt = EvolvingPrompt(
+        prompt_state["prefix"],
+        max_notes=prompt_state["max_notes"],
+        max_tokens=prompt_state["max_tokens"],
+        note_chars=prompt_state["note_chars"],
+        notes=prompt_state["notes"],
+    )
+    return SimpleAgent(
+        name=state["name"],
+        chat=new_chat(state["model"]),
+        memory=decode_memory(state["memory"], summarize),
+        system_prompt=prompt.prefix,
+        cache=cache,
+        prompt=prompt,
+        timeout=state.get("timeout"),
+        hedge=state.get("hedge", False),
+    )
+
+
+def restore(
+    states: Dict[str, List[dict]],
+    new_chat: Callable[[dict], object],
+    cache=None,
+    summarize: Optional[Callable] = None,
+) -> AgentSets:
+    """Rebuild every agent set in ``states``; see :func:`decode_memory` for ``summarize``."""
+    return {
+        name: [decode_agent(state, new_chat, cache, summarize) for state in agent_states]
+        for name, agent_states in states.items()
+    }
+
+
+class Checkpointer:
+    """Write a checkpoint every ``interval`` seconds from a background thread.
+
+    ``collect`` returns :func:`snapshot` output; it runs on the checkpoint
+    thread, so callers whose agents live on another thread should hop over to
+    it inside ``collect``.  Unchanged snapshots are not rewritten.
+    """
+
+    def __init__(
+        self, path: str, collect: Callable[[], Dict[str, List[dict]]], interval: float = 30.0
+    ) -> None:
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self._last: Optional[bytes] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "Checkpointer":
+        self._thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+        self._thread.start()
+        return self
+
+    def save(self) -> bool:
+        """Write a checkpoint now if anything changed; return whether it wrote."""
+        with self._lock:
+            data = dumps(self.collect())
+            if data == self._last:
+                return False
+            write_checkpoint(self.path, data)
+            self._last = data
+            return True
+
+    def stop(self) -> None:
+        """Stop the thread and write a final checkpoint."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as exc:  # keep checkpointing after a bad write
+                print(f"[Checkpoint error] {exc}")
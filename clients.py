@@ -0,0 +1,247 @@
+"""Shared, rate-limited OpenAI clients for every agent.
+
+Building a ``ChatOpenAI`` per agent gives each one its own HTTP connection
+pool and its own retry loop, so many agents or sessions hammer the API
+independently and turn a 429 into a retry storm.  :class:`ClientPool` hands
+out chat models that share one client per (API key, base URL) and one
+:class:`ratelimit.RateLimiter` per (API key, model), which is the scope of
+OpenAI's budgets.  Retries of 429s, connection errors and 5xx responses are
+done here, after waiting for the limiter, instead of inside the OpenAI client.
+
+Async clients are kept per event loop: the CLI and GUI run every turn in a
+fresh loop, and pooled connections cannot outlive the loop that opened them.
+Whoever ends such a loop awaits :func:`release_loop_clients` first (see
+:func:`pipeline.run_in_new_loop`) so its connections are closed.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+import openai
+
+import metrics
+from prompts import estimate_tokens
+from ratelimit import RateLimiter, retry_after_from_headers
+
+RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+ClientKey = Tuple[Optional[str], Optional[str]]
+
+
+def request_tokens(params: dict) -> int:
+    """Estimate the tokens a chat completion request counts against the TPM budget."""
+    prompt = sum(estimate_tokens(str(msg.get("content") or "")) for msg in params.get("messages", ()))
+    return prompt + (params.get("max_tokens") or 0)
+
+
+class LimitedCompletions:
+    """Stand-in for ``OpenAI().chat.completions`` that waits for the limiter."""
+
+    def __init__(
+        self, pool: "ClientPool", key: ClientKey, model: str, limiter: RateLimiter, max_retries: int
+    ) -> None:
+        self.pool = pool
+        self.key = key
+        self.model = model
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def create(self, **params):
+        tokens = request_tokens(params)
+        error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if error is not None:
+                time.sleep(self._backoff(error, attempt - 1))
+            self._waited(self.limiter.acquire(tokens))
+            try:
+                response = self.pool.sync_client(self.key).chat.completions.create(**params)
+            except RETRYABLE as exc:
+                error = exc
+                continue
+            return self._done(tokens, response)
+        raise error
+
+    def _waited(self, seconds: float) -> None:
+        metrics.LLM_WAIT_SECONDS.observe(seconds, model=self.model)
+
+    def _backoff(self, exc: Exception, attempt: int) -> float:
+        """Return how long this caller should sleep before retrying ``exc``."""
+        if isinstance(exc, openai.RateLimitError):
+            metrics.LLM_THROTTLED.inc(model=self.model)
+            # Pauses every caller; the next acquire() waits it out.
+            self.limiter.penalize(retry_after_from_headers(exc.response.headers))
+            return 0.0
+        return min(0.5 * (2 ** attempt) * random.uniform(0.5, 1.5), 30.0)
+
+    def _done(self, reserved: int, response):
+        self.limiter.success()
+        usage = getattr(response, "usage", None)
+        self.limiter.settle(reserved, getattr(usage, "total_tokens", None))
+        return response
+
+
+class AsyncLimitedCompletions(LimitedCompletions):
+    """Asynchronous :class:`LimitedCompletions` for ``ChatOpenAI.async_client``."""
+
+    async def create(self, **params):
+        tokens = request_tokens(params)
+        error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if error is not None:
+                await asyncio.sleep(self._backoff(error, attempt - 1))
+            self._waited(await self.limiter.aacquire(tokens))
+            try:
+                client = self.pool.async_client(self.key)
+                response = await client.chat.completions.create(**params)
+            except RETRYABLE as exc:
+                error = exc
+                continue
+            return self._done(tokens, response)
+        raise error
+
+
+class ClientPool:
+    """Chat models sharing HTTP clients and per-model rate limiters.
+
+    ``rpm`` and ``tpm`` apply to each (API key, model) pair; ``None`` means
+    only the 429 backoff applies.  ``max_retries`` bounds retries per request
+    and each HTTP client keeps at most ``max_connections`` connections.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 6,
+        max_connections: int = 20,
+        timeout: float = 600.0,
+    ) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self.timeout = timeout
+        self._sync: Dict[ClientKey, openai.OpenAI] = {}
+        self._async: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._limiters: Dict[Tuple[ClientKey, str], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rpm: Optional[float] = None, tpm: Optional[float] = None) -> None:
+        """Set the limits for every limiter created from now on.
+
+        Only the limits that are given change; ``None`` keeps the current one.
+        """
+        if rpm is not None:
+            self.rpm = rpm
+        if tpm is not None:
+            self.tpm = tpm
+
+    def limiter(self, key: ClientKey, model: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get((key, model))
+            if limiter is None:
+                limiter = self._limiters[(key, model)] = RateLimiter(self.rpm, self.tpm)
+            return limiter
+
+    def sync_client(self, key: ClientKey) -> openai.OpenAI:
+        with self._lock:
+            client = self._sync.get(key)
+            if client is None:
+                client = self._sync[key] = openai.OpenAI(
+                    api_key=key[0],
+                    base_url=key[1],
+                    max_retries=0,
+                    http_client=httpx.Client(limits=self.limits, timeout=self.timeout),
+                )
+            return client
+
+    def async_client(self, key: ClientKey) -> openai.AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = openai.AsyncOpenAI(
+                    api_key=key[0],
+                    base_url=key[1],
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout),
+                )
+            return client
+
+    async def aclose_loop(self) -> None:
+        """Close the async clients opened on the running loop.
+
+        Their connections belong to that loop, so a short-lived loop should
+        call this before it ends; the next loop gets fresh clients.
+        """
+        with self._lock:
+            clients = self._async.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.close()
+
+    def chat_model(
+        self,
+        model_name: str = "gpt-3.5-turbo",
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        **kwargs,
+    ):
+        """Return a ``ChatOpenAI`` backed by the shared clients and limiter."""
+        from langchain.chat_models import ChatOpenAI
+
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        key = (api_key, base_url or os.getenv("OPENAI_API_BASE") or None)
+        limiter = self.limiter(key, model_name)
+        return ChatOpenAI(
+            openai_api_key=api_key,
+            openai_api_base=key[1],
+            model_name=model_name,
+            client=LimitedCompletions(self, key, model_name, limiter, self.max_retries),
+            async_client=AsyncLimitedCompletions(self, key, model_name, limiter, self.max_retries),
+            **kwargs,
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {model: limiter.stats() for (_, model), limiter in self._limiters.items()}
+
+
+def _env_limit(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+_pool: Optional[ClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ClientPool:
+    """Return the process-wide :class:`ClientPool`, creating it on first use.
+
+    Limits default to the ``OPENAI_RPM`` and ``OPENAI_TPM`` environment variables.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool(_env_limit("OPENAI_RPM"), _env_limit("OPENAI_TPM"))
+        return _pool
+
+
+async def release_loop_clients() -> None:
+    """Close the shared pool's async clients for the running loop, if any."""
+    if _pool is not None:
+        await _pool.aclose_loop()
+
+
+def chat_model(model_name: str = "gpt-3.5-turbo", api_key: Optional[str] = None, **kwargs):
+    """Shorthand for ``get_pool().chat_model(...)``."""
+    return get_pool().chat_model(model_name, api_key, **kwargs)
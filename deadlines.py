@@ -0,0 +1,108 @@
+"""Deadlines and hedged requests for model calls.
+
+:func:`within` runs a call under a deadline and cancels it when the deadline
+passes, raising :class:`DeadlineExceeded`.  :func:`hedged` sends a duplicate
+of a call that runs past a delay (normally the agent's observed p95 latency),
+keeps whichever finishes first and cancels the other; that trims the slowest
+few percent of calls at the cost of a few percent more requests.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """An agent did not answer within its deadline."""
+
+    def __init__(self, agent: str, timeout: float) -> None:
+        super().__init__(f"{agent} did not answer within {timeout:g} s")
+        self.agent = agent
+        self.timeout = timeout
+
+
+def earliest(*timeouts: Optional[float]) -> Optional[float]:
+    """Return the smallest of ``timeouts`` that is set, or ``None``."""
+    values = [timeout for timeout in timeouts if timeout is not None]
+    return min(values) if values else None
+
+
+class LatencyWindow:
+    """The last ``size`` latencies of one agent, for estimating quantiles.
+
+    :meth:`quantile` returns ``None`` until ``min_samples`` calls were seen,
+    so hedging only starts once there is a meaningful p95.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+async def within(awaitable: Awaitable[T], timeout: Optional[float], agent: str) -> T:
+    """Await ``awaitable`` for at most ``timeout`` seconds, then cancel it.
+
+    Raises :class:`DeadlineExceeded` on expiry.  Unlike ``asyncio.wait_for``
+    a ``TimeoutError`` raised by the call itself is passed through unchanged.
+    """
+    if timeout is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=max(timeout, 0.0))
+    except BaseException:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        metrics.AGENT_DEADLINE_MISSES.inc(agent=agent)
+        raise DeadlineExceeded(agent, timeout)
+    return task.result()
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: Optional[float], agent: str) -> T:
+    """Run ``call()``; if it is still running after ``delay`` seconds, race a second one.
+
+    The first successful result wins and the other call is cancelled.  An
+    error from one call is ignored while the other is still running.
+    """
+    first = asyncio.ensure_future(call())
+    if delay is None:
+        return await first
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+        metrics.AGENT_HEDGES.inc(agent=agent)
+        tasks.append(asyncio.ensure_future(call()))
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.AGENT_HEDGE_WINS.inc(agent=agent)
+                    return task.result()
+            if not pending:
+                return first.result()  # both failed: report the original error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,118 @@
+"""Offline stand-in for ``ChatOpenAI`` used by tests and benchmarks.
+
+:class:`FakeChatModel` answers after a configurable time-to-first-token and
+then emits tokens at a fixed rate, with optional random jitter, calling
+``on_llm_new_token`` on any callbacks just like a streaming chat model.  It
+supports the sync call and ``agenerate`` interfaces :class:`agent.SimpleAgent`
+uses, so agents, pipelines and the server can be driven without network
+access.
+"""
+
+import asyncio
+import inspect
+import random
+import time
+from typing import List, Optional
+
+
+class FakeMessage:
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.type = "ai"
+
+
+class FakeGeneration:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.message = FakeMessage(text)
+
+
+class FakeResult:
+    def __init__(self, text: str) -> None:
+        self.generations = [[FakeGeneration(text)]]
+
+
+class FakeChatModel:
+    """Chat model with a synthetic latency profile.
+
+    ``latency`` is the time to first token in seconds, ``tokens_per_second``
+    the generation rate (``0`` means instantaneous) and ``jitter`` a relative
+    random variation applied to both.  With probability ``tail_probability``
+    a call waits ``tail_latency`` instead of ``latency`` before its first
+    token, which models the slow tail of a real API.  ``reply`` is the answer;
+    by default the model echoes the last message.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        jitter: float = 0.0,
+        reply: Optional[str] = None,
+        model_name: str = "fake",
+        temperature: float = 0.0,
+        seed: Optional[int] = None,
+        tail_probability: float = 0.0,
+        tail_latency: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.reply = reply
+        self.model_name = model_name
+        self.temperature = temperature
+        self.streaming = False
+        self.callbacks = None
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def __call__(self, messages: list, callbacks: Optional[list] = None) -> FakeMessage:
+        self.calls += 1
+        time.sleep(self._first_token_delay())
+        tokens = self._tokens(messages)
+        delay = self._token_delay()
+        for token in tokens:
+            for handler in self._handlers(callbacks):
+                handler.on_llm_new_token(token)
+            if delay:
+                time.sleep(delay)
+        return FakeMessage("".join(tokens))
+
+    async def agenerate(self, batches: List[list], callbacks: Optional[list] = None) -> FakeResult:
+        self.calls += 1
+        await asyncio.sleep(self._first_token_delay())
+        tokens = self._tokens(batches[0])
+        delay = self._token_delay()
+        for token in tokens:
+            for handler in self._handlers(callbacks):
+                result = handler.on_llm_new_token(token)
+                if inspect.isawaitable(result):
+                    await result
+            if delay:
+                await asyncio.sleep(delay)
+        return FakeResult("".join(tokens))
+
+    def _tokens(self, messages: list) -> List[str]:
+        text = self.reply if self.reply is not None else f"echo: {messages[-1].content}"
+        words = text.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _handlers(self, callbacks: Optional[list]) -> list:
+        return list(self.callbacks or []) + list(callbacks or [])
+
+    def _first_token_delay(self) -> float:
+        if self.tail_probability and self._random.random() < self.tail_probability:
+            return self._vary(self.tail_latency)
+        return self._vary(self.latency)
+
+    def _token_delay(self) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return self._vary(1.0 / self.tokens_per_second)
+
+    def _vary(self, value: float) -> float:
+        if not value or not self.jitter:
+            return value
+        return max(0.0, value * (1 + self._random.uniform(-self.jitter, self.jitter)))
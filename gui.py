@@ -1,13 +1,20 @@
 import os
+import queue
+import asyncio
+import threading
+import uuid
 import tkinter as tk
 from tkinter.scrolledtext import ScrolledText
 
-from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.callbacks.base import BaseCallbackHandler
 
+import checkpoint
 from agent import SimpleAgent
-from storage import storage
+from clients import chat_model, release_loop_clients
+from cache import ResponseCache
+from pipeline import Pipeline
+from storage import get_storage
 
 try:  # optional voice support
     import voice
@@ -15,17 +22,24 @@ except Exception:  # pragma: no cover - voice is optional
     voice = None
 
 
+# Tokens are collected on a queue and painted at most this often.
+FRAME_MS = 33
+# Oldest lines are dropped beyond this so long sessions stay responsive.
+MAX_TRANSCRIPT_LINES = 5000
+
+
 class TextBoxStreamingHandler(BaseCallbackHandler):
-    """Stream LLM tokens directly into a Tkinter text widget."""
+    """Forward LLM tokens to the GUI's event queue.
 
-    def __init__(self, text: ScrolledText) -> None:
-        self.text = text
+    The worker thread must not touch Tk widgets; the main loop picks the
+    tokens up and inserts them in batches.
+    """
+
+    def __init__(self, events: "queue.Queue") -> None:
+        self.events = events
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:  # type: ignore[override]
-        self.text.configure(state="normal")
-        self.text.insert(tk.END, token)
-        self.text.configure(state="disabled")
-        self.text.yview(tk.END)
+        self.events.put(("token", token))
 
 
 class ChatGUI:
@@ -48,6 +62,11 @@ class ChatGUI:
         self.send_btn = tk.Button(button_frame, text="Send", command=self.send_message)
         self.send_btn.pack(side="left", padx=5)
 
+        self.cancel_btn = tk.Button(
+            button_frame, text="Cancel", command=self.cancel_turn, state="disabled"
+        )
+        self.cancel_btn.pack(side="left", padx=5)
+
         self.add_btn = tk.Button(button_frame, text="Add Agent", command=self.add_agent)
         self.add_btn.pack(side="left", padx=5)
 
@@ -60,6 +79,10 @@ class ChatGUI:
         self.stream_chk = tk.Checkbutton(button_frame, text="Stream", variable=self.stream_var)
         self.stream_chk.pack(side="left", padx=5)
 
+        self.topology_var = tk.StringVar(value="chain")
+        self.topology_menu = tk.OptionMenu(button_frame, self.topology_var, "chain", "broadcast")
+        self.topology_menu.pack(side="left", padx=5)
+
         if voice is not None:
             self.rec_btn = tk.Button(button_frame, text="Record", command=self.record_voice)
             self.rec_btn.pack(side="left", padx=5)
@@ -68,30 +91,97 @@ class ChatGUI:
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY environment variable is required")
 
-        self.agents = [self.new_agent(1), self.new_agent(2)]
+        self.events: "queue.Queue" = queue.Queue()
+        self._loop: "asyncio.AbstractEventLoop | None" = None
+        self._task: "asyncio.Task | None" = None
+        # Guards _loop/_task so Cancel never reaches a loop that is closing.
+        self._turn_lock = threading.Lock()
+        self._busy = False
+
+        self.cache = ResponseCache(os.getenv("CHAT_CACHE_DB"))
+        # CHAT_CHECKPOINT keeps agent prompts and memories across restarts.
+        self.checkpointer = None
+        checkpoint_path = os.getenv("CHAT_CHECKPOINT")
+        saved = checkpoint.read_checkpoint(checkpoint_path).get("gui") if checkpoint_path else None
+        if saved:
+            self.agents = checkpoint.restore({"gui": saved}, self.new_chat, self.cache)["gui"]
+        else:
+            self.agents = [self.new_agent(1), self.new_agent(2)]
+        if checkpoint_path:
+            # The checkpoint thread only reads this; it is refreshed on the
+            # Tk thread while no turn is mutating the agents.
+            self._snapshot = checkpoint.snapshot({"gui": list(self.agents)})
+            self.checkpointer = checkpoint.Checkpointer(
+                checkpoint_path, lambda: self._snapshot
+            ).start()
+            root.protocol("WM_DELETE_WINDOW", self.close)
+        self.session_id = uuid.uuid4().hex
+        turn_timeout = os.getenv("CHAT_TURN_TIMEOUT")
+        self.pipeline = Pipeline(
+            self.agents, turn_timeout=float(turn_timeout) if turn_timeout else None
+        )
         self.log("System: Type your message and press Enter. Click 'Add Agent' to create a new agent.")
+        self.root.after(FRAME_MS, self._drain_events)
+
+    def new_chat(self, settings: "dict | None" = None):
+        kwargs = {key: value for key, value in (settings or {}).items() if value is not None}
+        return chat_model(api_key=self.api_key, streaming=self.stream_var.get(), **kwargs)
 
     def new_agent(self, n: int) -> SimpleAgent:
-        streaming = self.stream_var.get()
-        callbacks = [TextBoxStreamingHandler(self.text)] if streaming else None
         return SimpleAgent(
             name=f"Agent{n}",
-            chat=ChatOpenAI(
-                openai_api_key=self.api_key,
-                streaming=streaming,
-                callbacks=callbacks,
-            ),
+            chat=self.new_chat(),
             memory=ConversationBufferMemory(),
             system_prompt=f"You are Agent{n}, a helpful assistant.",
+            cache=self.cache,
         )
 
     def log(self, text: str) -> None:
+        self._write(text + "\n")
+
+    def _write(self, text: str) -> None:
         self.text.configure(state="normal")
-        self.text.insert(tk.END, text + "\n")
+        self.text.insert(tk.END, text)
+        lines = int(self.text.index("end-1c").split(".")[0])
+        if lines > MAX_TRANSCRIPT_LINES:
+            self.text.delete("1.0", f"{lines - MAX_TRANSCRIPT_LINES + 1}.0")
         self.text.configure(state="disabled")
         self.text.yview(tk.END)
 
+    def _drain_events(self) -> None:
+        """Apply queued worker output to the widget once per frame."""
+        chunks = []
+        finished = False
+        try:
+            while True:
+                kind, payload = self.events.get_nowait()
+                if kind == "token":
+                    chunks.append(payload)
+                elif kind == "log":
+                    chunks.append(payload + "\n")
+                elif kind == "done":
+                    finished = True
+        except queue.Empty:
+            pass
+        if chunks:
+            self._write("".join(chunks))
+        if finished:
+            self._set_busy(False)
+            self._refresh_snapshot()
+        self.root.after(FRAME_MS, self._drain_events)
+
+    def _refresh_snapshot(self) -> None:
+        if self.checkpointer is not None and not self._busy:
+            self._snapshot = checkpoint.snapshot({"gui": list(self.agents)})
+
+    def _set_busy(self, busy: bool) -> None:
+        self._busy = busy
+        self.send_btn.configure(state="disabled" if busy else "normal")
+        self.cancel_btn.configure(state="normal" if busy else "disabled")
+
     def send_message(self, event=None) -> None:
+        if self._busy:
+            return  # a turn is already running
         user_input = self.entry.get().strip()
         if not user_input:
             return
@@ -102,31 +192,81 @@ class ChatGUI:
             return
 
         self.log(f"User: {user_input}")
-        if storage:
-            storage.save("user", "user", user_input)
-        prompt = user_input
+        self.pipeline.topology = self.topology_var.get()
+        # Agents answering at once would interleave their tokens in one widget.
+        streaming = self.stream_var.get() and self.pipeline.topology == "chain"
+        speak = self.voice_var.get() and voice is not None
         for agent in self.agents:
-            streaming = self.stream_var.get()
             agent.chat.streaming = streaming
-            agent.chat.callbacks = [TextBoxStreamingHandler(self.text)] if streaming else None
+        self._set_busy(True)
+        threading.Thread(
+            target=self._run_turn, args=(user_input, streaming, speak), daemon=True
+        ).start()
+
+    def _run_turn(self, user_input: str, streaming: bool, speak: bool) -> None:
+        """Run one turn on a worker thread, reporting through ``self.events``."""
+        events = self.events
+        storage = get_storage()
+        if storage:
+            storage.save("user", "user", user_input, self.session_id)
+
+        def on_start(agent: SimpleAgent) -> None:
             if streaming:
-                self.text.configure(state="normal")
-                self.text.insert(tk.END, f"{agent.name}: ")
-                self.text.configure(state="disabled")
-            answer = agent.respond(prompt)
-            if not streaming:
-                self.log(f"{agent.name}: {answer}")
-            else:
-                self.log("")
+                events.put(("token", f"{agent.name}: "))
+
+        prompts = {}
+
+        def on_result(agent: SimpleAgent, answer: str) -> None:
+            events.put(("log", "" if streaming else f"{agent.name}: {answer}"))
             if storage:
-                storage.save(agent.name, "assistant", answer)
-            if self.voice_var.get() and voice:
+                storage.save(agent.name, "assistant", answer, self.session_id, prompts[agent.name])
+            if speak:
                 voice.speak(answer)
-            prompt = answer
+
+        def callbacks(agent: SimpleAgent) -> list:
+            return [TextBoxStreamingHandler(events)]
+
+        def on_skip(agent: SimpleAgent, exc: Exception) -> None:
+            events.put(("log", f"\n[{agent.name} skipped: {exc}]"))
+
+        loop = asyncio.new_event_loop()
+        try:
+            task = loop.create_task(
+                self.pipeline.arun(
+                    user_input,
+                    on_start=on_start,
+                    on_result=on_result,
+                    callbacks=callbacks if streaming else None,
+                    on_skip=on_skip,
+                    inputs=prompts,
+                )
+            )
+            with self._turn_lock:
+                self._loop, self._task = loop, task
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            events.put(("log", "\n[System] Turn cancelled"))
+        except Exception as exc:
+            events.put(("log", f"\n[Error] {exc}"))
+        finally:
+            with self._turn_lock:
+                self._task = None
+                self._loop = None
+            loop.run_until_complete(release_loop_clients())
+            loop.close()
+            events.put(("done", None))
+
+    def cancel_turn(self) -> None:
+        """Abort the running turn; agents that already answered keep their reply."""
+        with self._turn_lock:
+            loop, task = self._loop, self._task
+            if loop is not None and task is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(task.cancel)
 
     def add_agent(self) -> None:
         idx = len(self.agents) + 1
         self.agents.append(self.new_agent(idx))
+        self._refresh_snapshot()
         self.log(f"System: Added Agent{idx}")
 
     def record_voice(self) -> None:
@@ -142,6 +282,11 @@ class ChatGUI:
             self.entry.insert(0, text)
             self.send_message()
 
+    def close(self) -> None:
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+        self.root.destroy()
+
     def run(self) -> None:
         self.root.mainloop()
 
@@ -0,0 +1,65 @@
+"""LangChain callback handlers shared by the CLI and the server.
+
+They live apart from :mod:`agent` so importing the agent does not load
+LangChain's callback machinery; callers import this module when they first
+need a handler.
+"""
+
+import queue
+import time
+
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+
+import metrics
+
+
+class FirstTokenTimer(BaseCallbackHandler):
+    """Record an agent's time to first token."""
+
+    # Run on the event loop thread so the timestamp is not delayed.
+    run_inline = True
+
+    def __init__(self, agent_name: str) -> None:
+        self.agent_name = agent_name
+        self.start = time.perf_counter()
+        self.seen = False
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:  # type: ignore[override]
+        if not self.seen:
+            self.seen = True
+            metrics.AGENT_FIRST_TOKEN_SECONDS.observe(
+                time.perf_counter() - self.start, agent=self.agent_name
+            )
+
+
+class SpeechStreamingHandler(BaseCallbackHandler):
+    """Speak each sentence of a streamed answer as soon as it is complete."""
+
+    def __init__(self) -> None:
+        import voice
+
+        self.stream = voice.SpeechStream(voice.get_worker())
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:  # type: ignore[override]
+        # A cancelled call reports nothing; don't let its tail start this answer.
+        self.stream.reset()
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:  # type: ignore[override]
+        self.stream.feed(token)
+
+    def on_llm_end(self, response, **kwargs) -> None:  # type: ignore[override]
+        self.stream.end()
+
+    def on_llm_error(self, error, **kwargs) -> None:  # type: ignore[override]
+        self.stream.reset()
+
+
+class QueueStreamingHandler(AsyncCallbackHandler):
+    """Forward one agent's tokens to a thread-safe event queue."""
+
+    def __init__(self, agent_name: str, events: "queue.Queue") -> None:
+        self.agent_name = agent_name
+        self.events = events
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:  # type: ignore[override]
+        self.events.put(("token", {"agent": self.agent_name, "token": token}))
@@ -0,0 +1,283 @@
+"""Bounded conversation memory for long sessions.
+
+``ConversationBufferMemory`` grows without limit, so the prompt sent on every
+turn keeps getting longer.  :class:`SummaryWindowMemory` keeps the most recent
+turns verbatim within a token budget and folds turns that fall out of the
+window into a running summary.  The summary is updated incrementally from the
+previous summary plus the evicted turns only, never rebuilt from the full
+history.
+
+:class:`CompactMemory` keeps the whole conversation like
+``ConversationBufferMemory`` but in a few flat arrays instead of one pydantic
+object per message, for servers holding many sessions.
+
+:class:`RetrievalMemory` instead keeps only the last few turns verbatim and
+indexes every turn in a local BM25 index; each prompt then gets just the
+earlier turns most relevant to it.
+"""
+
+from array import array
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from prompts import estimate_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def _speaker(msg) -> str:
+    return "User" if getattr(msg, "type", "") == "human" else "Assistant"
+
+
+def extractive_summary(summary: str, evicted: list, max_tokens: int) -> str:
+    """Append the evicted turns to ``summary`` and keep its most recent part.
+
+    No model call is involved; older lines drop off once ``max_tokens`` is
+    exceeded.
+    """
+    lines = [line for line in summary.splitlines() if line]
+    for msg in evicted:
+        text = " ".join(msg.content.split())
+        lines.append(f"{_speaker(msg)}: {text}")
+    budget = max_tokens * 4
+    kept: List[str] = []
+    size = 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > budget:
+            if not kept:
+                kept.append(line[: max(budget - 3, 0)] + "...")
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(reversed(kept))
+
+
+def llm_summarizer(chat) -> Callable[[str, list, int], str]:
+    """Return a summarizer that asks ``chat`` to update the running summary."""
+
+    def summarize(summary: str, evicted: list, max_tokens: int) -> str:
+        transcript = "\n".join(f"{_speaker(msg)}: {msg.content}" for msg in evicted)
+        prompt = (
+            "Update the running summary of a conversation with the new lines below. "
+            f"Keep it under {max(max_tokens * 3 // 4, 1)} words and keep names, facts "
+            "and decisions.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew lines:\n{transcript}\n\n"
+            "Updated summary:"
+        )
+        return chat([HumanMessage(content=prompt)]).content.strip()
+
+    summarize.blocking = True  # a network round-trip; see SummaryWindowMemory.blocking
+    return summarize
+
+
+class SummaryWindowMemory:
+    """Token-budgeted replacement for ``ConversationBufferMemory``.
+
+    It exposes the same ``chat_memory.messages`` / ``add_user_message`` /
+    ``add_ai_message`` surface that :class:`agent.SimpleAgent` relies on.  At
+    most ``max_tokens`` are kept: up to ``summary_tokens`` for the summary and
+    the rest for the verbatim window.  The latest turn is always kept whole.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        summary_tokens: Optional[int] = None,
+        summarize: Optional[Callable[[str, list, int], str]] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ) -> None:
+        self.chat_memory = self
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens if summary_tokens is not None else max_tokens // 4
+        self.summarize = summarize or extractive_summary
+        self.count_tokens = count_tokens
+        self.summary = ""
+        self._window: Deque[tuple] = deque()
+        self._window_tokens = 0
+        self._summary_message: Optional[SystemMessage] = None
+
+    @property
+    def blocking(self) -> bool:
+        """Whether adding a message may wait on the network (an LLM summarizer).
+
+        :meth:`agent.SimpleAgent.arespond` then updates the memory in a worker
+        thread so the event loop keeps serving other agents.
+        """
+        return getattr(self.summarize, "blocking", False)
+
+    @property
+    def messages(self) -> list:
+        """Summary (if any) followed by the verbatim window."""
+        window = [msg for msg, _ in self._window]
+        if self._summary_message is None:
+            return window
+        return [self._summary_message] + window
+
+    def add_user_message(self, text: str) -> None:
+        self._add(HumanMessage(content=text))
+
+    def add_ai_message(self, text: str) -> None:
+        self._add(AIMessage(content=text))
+
+    def clear(self) -> None:
+        self.summary = ""
+        self._summary_message = None
+        self._window.clear()
+        self._window_tokens = 0
+
+    def _add(self, msg) -> None:
+        tokens = self.count_tokens(msg.content)
+        self._window.append((msg, tokens))
+        self._window_tokens += tokens
+        self._trim()
+
+    def _trim(self) -> None:
+        budget = self.max_tokens - self.summary_tokens
+        evicted = []
+        # Evict whole turns (user + assistant) but never the latest one.
+        while self._window_tokens > budget and len(self._window) > 2:
+            for _ in range(2):
+                msg, tokens = self._window.popleft()
+                self._window_tokens -= tokens
+                evicted.append(msg)
+        if evicted:
+            self.summary = self.summarize(self.summary, evicted, self.summary_tokens)
+            self._summary_message = SystemMessage(content=SUMMARY_PREFIX + self.summary)
+
+
+ROLES = ("human", "ai", "system")
+_ROLE_CLASSES = (HumanMessage, AIMessage, SystemMessage)
+
+
+class CompactMemory:
+    """Unbounded conversation memory stored as a byte arena.
+
+    A message costs one role byte, one 8-byte end offset and its UTF-8 text
+    in a shared ``bytearray``, instead of a LangChain message object with its
+    pydantic field dictionaries and a separate ``str``.  Messages are built
+    (without validation) only when :attr:`messages` is read to assemble a
+    prompt.  It exposes the same surface as :class:`SummaryWindowMemory`.
+    """
+
+    __slots__ = ("chat_memory", "_roles", "_ends", "_text")
+
+    def __init__(self) -> None:
+        self.chat_memory = self
+        self._roles = array("B")
+        self._ends = array("Q")
+        self._text = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    @property
+    def messages(self) -> list:
+        result = []
+        start = 0
+        # Released on exit: the arena cannot grow while a view is exported.
+        with memoryview(self._text) as text:
+            for role, end in zip(self._roles, self._ends):
+                content = str(text[start:end], "utf-8")
+                result.append(_ROLE_CLASSES[role].construct(content=content))
+                start = end
+        return result
+
+    def add_user_message(self, text: str) -> None:
+        self._append(0, text)
+
+    def add_ai_message(self, text: str) -> None:
+        self._append(1, text)
+
+    def add_message(self, message) -> None:
+        kind = getattr(message, "type", "human")
+        self._append(ROLES.index(kind) if kind in ROLES else 0, message.content)
+
+    def clear(self) -> None:
+        self._roles = array("B")
+        self._ends = array("Q")
+        self._text = bytearray()
+
+    def _append(self, role: int, text: str) -> None:
+        self._text += text.encode("utf-8")
+        self._roles.append(role)
+        self._ends.append(len(self._text))
+
+
+RECALL_PREFIX = "Relevant earlier conversation:\n"
+
+
+class RetrievalMemory:
+    """Recent turns verbatim plus the top ``k`` older turns relevant to each prompt.
+
+    Every completed turn (user message and answer) is added to a
+    :class:`retrieval.BM25Index`.  ``messages`` holds the last
+    ``window_turns`` turns; :meth:`recall` returns a system message with the
+    ``k`` best matching turns from before that window, each cut to
+    ``max_chars`` characters.  :class:`agent.SimpleAgent` calls it for every
+    new prompt.
+    """
+
+    def __init__(self, k: int = 3, window_turns: int = 4, max_chars: int = 1000) -> None:
+        from retrieval import BM25Index
+
+        self.chat_memory = self
+        self.k = k
+        self.window_turns = window_turns
+        self.max_chars = max_chars
+        self.turns: List[Tuple[str, str]] = []
+        self.index = BM25Index()
+        self._pending: Optional[str] = None
+
+    @property
+    def messages(self) -> list:
+        window = []
+        recent = self.turns[-self.window_turns:] if self.window_turns > 0 else []
+        for prompt, answer in recent:
+            if prompt:
+                window.append(HumanMessage(content=prompt))
+            window.append(AIMessage(content=answer))
+        if self._pending is not None:
+            window.append(HumanMessage(content=self._pending))
+        return window
+
+    def add_user_message(self, text: str) -> None:
+        if self._pending is not None:
+            self._add_turn(self._pending, "")
+        self._pending = text
+
+    def add_ai_message(self, text: str) -> None:
+        prompt, self._pending = self._pending or "", None
+        self._add_turn(prompt, text)
+
+    def clear(self) -> None:
+        from retrieval import BM25Index
+
+        self.turns = []
+        self.index = BM25Index()
+        self._pending = None
+
+    def recall(self, prompt: str) -> list:
+        """Return ``[SystemMessage]`` with the turns most relevant to ``prompt``, or ``[]``."""
+        older = len(self.turns) - self.window_turns
+        if self.k <= 0 or older <= 0:
+            return []
+        hits = self.index.search(prompt, self.k, limit=older)
+        if not hits:
+            return []
+        lines = []
+        for turn, _ in sorted(hits):  # chronological reads more naturally
+            question, answer = self.turns[turn]
+            if question:
+                lines.append("User: " + self._clip(question))
+            lines.append("Assistant: " + self._clip(answer))
+        return [SystemMessage(content=RECALL_PREFIX + "\n".join(lines))]
+
+    def _add_turn(self, prompt: str, answer: str) -> None:
+        self.turns.append((prompt, answer))
+        self.index.add(prompt + "\n" + answer)
+
+    def _clip(self, text: str) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= self.max_chars else text[: self.max_chars - 3] + "..."
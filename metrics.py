@@ -0,0 +1,247 @@
+"""Lightweight in-process metrics with Prometheus text output.
+
+Counters, gauges and fixed-bucket histograms are provided; each observation is a
+dictionary lookup and a few additions under a lock, so instrumentation can
+stay enabled in production.  :data:`REGISTRY` holds the process-wide metrics
+and :meth:`Registry.render` produces the text served at ``/metrics``.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(key)} {value:g}"
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram:
+    """Observation counts in cumulative ``buckets`` plus sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._data: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                # per-bucket counts, then +Inf, sum and count
+                data = self._data[key] = [0.0] * (len(self.buckets) + 3)
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        with self._lock:
+            return [dict(key) for key in self._data]
+
+    def snapshot(self, **labels: str) -> Dict[str, float]:
+        """Return count, sum, mean and bucket-estimated p50/p95 for ``labels``."""
+        with self._lock:
+            data = list(self._data.get(_key(labels), ()))
+        if not data or not data[-1]:
+            return {"count": 0, "sum": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0}
+        count, total = data[-1], data[-2]
+        return {
+            "count": int(count),
+            "sum": total,
+            "mean": total / count,
+            "p50": self._quantile(data, 0.5),
+            "p95": self._quantile(data, 0.95),
+        }
+
+    def _quantile(self, data: List[float], q: float) -> float:
+        target = q * data[-1]
+        seen = 0.0
+        for bound, count in zip(self.buckets, data):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._data.items()]
+        for key, data in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                labels = _format_labels(key, 'le="%g"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative:g}"
+            labels = _format_labels(key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {data[-1]:g}"
+            yield f"{self.name}_sum{_format_labels(key)} {data[-2]:g}"
+            yield f"{self.name}_count{_format_labels(key)} {data[-1]:g}"
+
+
+class Registry:
+    """Named collection of metrics; asking twice for a name returns the same one."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def get(self, name: str) -> Optional[object]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def _get(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            return metric
+
+
+REGISTRY = Registry()
+
+AGENT_SECONDS = REGISTRY.histogram(
+    "agent_response_seconds", "Time for an agent to produce a full answer"
+)
+AGENT_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "agent_first_token_seconds", "Time until a streaming agent emits its first token"
+)
+AGENT_PROMPT_TOKENS = REGISTRY.counter(
+    "agent_prompt_tokens_total", "Prompt tokens sent per agent (estimated when not reported)"
+)
+AGENT_COMPLETION_TOKENS = REGISTRY.counter(
+    "agent_completion_tokens_total", "Completion tokens received per agent"
+)
+AGENT_ERRORS = REGISTRY.counter("agent_errors_total", "Failed agent calls")
+AGENT_DEADLINE_MISSES = REGISTRY.counter(
+    "agent_deadline_misses_total", "Agent calls cancelled because their deadline passed"
+)
+AGENT_HEDGES = REGISTRY.counter(
+    "agent_hedged_requests_total", "Duplicate requests sent after a call ran past its p95"
+)
+AGENT_HEDGE_WINS = REGISTRY.counter(
+    "agent_hedge_wins_total", "Hedged requests that answered before the original"
+)
+STORAGE_SAVE_SECONDS = REGISTRY.histogram(
+    "storage_save_seconds", "Latency of Storage.save as seen by the caller"
+)
+STORAGE_BATCH_SECONDS = REGISTRY.histogram(
+    "storage_batch_write_seconds", "Time to commit one batch of messages"
+)
+MONGO_REPLICATED = REGISTRY.counter(
+    "mongo_replicated_messages_total", "Messages copied from SQLite to MongoDB"
+)
+MONGO_REPLICATION_ERRORS = REGISTRY.counter(
+    "mongo_replication_errors_total", "Failed MongoDB replication batches"
+)
+MONGO_REPLICATION_PENDING = REGISTRY.gauge(
+    "mongo_replication_pending_messages", "Messages stored in SQLite but not yet in MongoDB"
+)
+MONGO_REPLICATION_LAG_SECONDS = REGISTRY.gauge(
+    "mongo_replication_lag_seconds", "Age of the oldest message not yet in MongoDB"
+)
+LLM_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_ratelimit_wait_seconds", "Time requests waited for the shared rate limiter"
+)
+LLM_THROTTLED = REGISTRY.counter("llm_throttled_total", "429 responses from the model API")
+LLM_ROUTED = REGISTRY.counter("llm_routed_total", "Calls answered per model by a model router")
+LLM_FAILOVERS = REGISTRY.counter(
+    "llm_failovers_total", "Router calls that failed or timed out and moved to the next model"
+)
+TOOL_SECONDS = REGISTRY.histogram("tool_call_seconds", "Latency of tool calls")
+TOOL_ERRORS = REGISTRY.counter("tool_errors_total", "Failed tool calls")
+
+
+@contextmanager
+def track_tool(tool: str) -> Iterator[None]:
+    """Time a tool call and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        TOOL_ERRORS.inc(tool=tool)
+        raise
+    finally:
+        TOOL_SECONDS.observe(time.perf_counter() - start, tool=tool)
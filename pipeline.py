@@ -0,0 +1,224 @@
+"""Execution engine that routes one user prompt through a set of agents.
+
+Three topologies are supported:
+
+``chain``
+    The original behaviour: every agent answers the previous agent's reply.
+``broadcast``
+    Every agent answers the user prompt independently and concurrently.
+``dag``
+    A user-defined graph such as ``Agent1->Agent2,Agent1->Agent3``.  Agents
+    that do not appear as a target answer the user prompt; the others answer
+    the combined replies of their parents once those are available.
+
+Independent agents run concurrently on an asyncio event loop, limited by a
+semaphore so large agent sets do not flood the API.
+
+A turn may have a deadline (``turn_timeout``) and every agent call a timeout
+(``agent_timeout``, on top of the agent's own).  An agent that misses its
+deadline, or whose model call times out (for instance on every route of a
+:class:`router.ModelRouter`), is skipped instead of failing the turn: agents
+that consume its answer get the input it was given instead, so a chain simply
+continues with the next agent.
+"""
+
+import asyncio
+import inspect
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from deadlines import DeadlineExceeded, earliest
+
+TOPOLOGIES = ("chain", "broadcast", "dag")
+
+
+def run_in_new_loop(coro):
+    """``asyncio.run(coro)``, closing the pooled async clients the loop opened.
+
+    Pooled HTTP clients are bound to the loop that created them; without this
+    every short-lived loop would leak its connections.
+    """
+
+    async def main():
+        try:
+            return await coro
+        finally:
+            clients = sys.modules.get("clients")  # loaded once a pooled model exists
+            if clients is not None:
+                await clients.release_loop_clients()
+
+    return asyncio.run(main())
+
+
+def parse_dag(spec: str) -> Dict[str, List[str]]:
+    """Parse ``"A->B,A->C,B->D"`` into a mapping of agent to its parents."""
+    deps: Dict[str, List[str]] = {}
+    for edge in spec.split(","):
+        edge = edge.strip()
+        if not edge:
+            continue
+        if "->" not in edge:
+            raise ValueError(f"Invalid DAG edge {edge!r}; expected 'A->B'")
+        src, dst = (part.strip() for part in edge.split("->", 1))
+        if not src or not dst:
+            raise ValueError(f"Invalid DAG edge {edge!r}; expected 'A->B'")
+        deps.setdefault(src, [])
+        deps.setdefault(dst, []).append(src)
+    _check_acyclic(deps)
+    return deps
+
+
+def _check_acyclic(deps: Dict[str, List[str]]) -> None:
+    state: Dict[str, int] = {}
+
+    def visit(node: str) -> None:
+        if state.get(node) == 1:
+            raise ValueError(f"DAG contains a cycle through {node!r}")
+        if state.get(node) == 2:
+            return
+        state[node] = 1
+        for parent in deps.get(node, []):
+            visit(parent)
+        state[node] = 2
+
+    for node in deps:
+        visit(node)
+
+
+class Pipeline:
+    """Run ``agents`` over a prompt using the selected topology.
+
+    ``agents`` is kept by reference so agents appended at runtime (``add
+    agent``) take part in the next turn.
+    """
+
+    def __init__(
+        self,
+        agents: list,
+        topology: str = "chain",
+        dag: Optional[Dict[str, List[str]]] = None,
+        concurrency: int = 4,
+        turn_timeout: Optional[float] = None,
+        agent_timeout: Optional[float] = None,
+    ) -> None:
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology {topology!r}; choose from {TOPOLOGIES}")
+        if topology == "dag" and not dag:
+            raise ValueError("The 'dag' topology requires a graph specification")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if dag:
+            _check_acyclic(dag)
+        self.agents = agents
+        self.topology = topology
+        self.dag = dag or {}
+        self.concurrency = concurrency
+        self.turn_timeout = turn_timeout
+        self.agent_timeout = agent_timeout
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        """Return, for every agent name, the names whose answers it consumes."""
+        names = [agent.name for agent in self.agents]
+        if self.topology == "chain":
+            return {name: names[i - 1 : i] for i, name in enumerate(names)}
+        if self.topology == "broadcast":
+            return {name: [] for name in names}
+        unknown = sorted(set(self.dag) - set(names))
+        if unknown:
+            raise ValueError(f"DAG references unknown agents: {', '.join(unknown)}")
+        return {name: list(self.dag.get(name, [])) for name in names}
+
+    async def arun(
+        self,
+        prompt: str,
+        on_start: Optional[Callable] = None,
+        on_result: Optional[Callable] = None,
+        callbacks: Optional[Callable] = None,
+        on_skip: Optional[Callable] = None,
+        inputs: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[object, str]]:
+        """Run one turn and return ``(agent, answer)`` pairs in agent order.
+
+        ``on_start(agent)`` is called right before an agent starts generating
+        and ``on_result(agent, answer)`` as soon as its answer is available;
+        ``on_result`` may be a coroutine function, which is awaited.
+        ``callbacks(agent)`` may return LangChain handlers for that agent's
+        call, which is how token streaming is wired per request.  Agents that
+        miss their deadline or time out are left out of the result and
+        reported through ``on_skip(agent, error)``.  If ``inputs`` is given it is filled with
+        the prompt each agent was given, by agent name.
+        """
+        deps = self.dependencies()
+        agents = list(self.agents)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: Dict[str, asyncio.Future] = {}
+        inputs = {} if inputs is None else inputs
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.turn_timeout if self.turn_timeout is not None else None
+
+        async def run_agent(agent) -> Optional[str]:
+            parents = deps[agent.name]
+            answers = [(name, await tasks[name]) for name in parents]
+            answers = [(name, answer) for name, answer in answers if answer is not None]
+            if not parents:
+                agent_prompt = prompt
+            elif not answers:
+                # Every parent was skipped: answer what they were asked.
+                agent_prompt = inputs[parents[0]]
+            elif len(answers) == 1:
+                agent_prompt = answers[0][1]
+            else:
+                agent_prompt = "\n\n".join(f"{name}: {answer}" for name, answer in answers)
+            inputs[agent.name] = agent_prompt
+            async with semaphore:
+                remaining = deadline - loop.time() if deadline is not None else None
+                timeout = earliest(self.agent_timeout, remaining)
+                kwargs = {} if timeout is None else {"timeout": timeout}
+                if callbacks:
+                    kwargs["callbacks"] = callbacks(agent)
+                try:
+                    if timeout is not None and timeout <= 0:
+                        metrics.AGENT_DEADLINE_MISSES.inc(agent=agent.name)
+                        raise DeadlineExceeded(agent.name, 0)
+                    if on_start:
+                        on_start(agent)
+                    answer = await agent.arespond(agent_prompt, **kwargs)
+                except TimeoutError as exc:  # DeadlineExceeded included
+                    if on_skip:
+                        on_skip(agent, exc)
+                    return None
+            if on_result:
+                result = on_result(agent, answer)
+                if inspect.isawaitable(result):
+                    await result
+            return answer
+
+        for agent in agents:
+            tasks[agent.name] = asyncio.ensure_future(run_agent(agent))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return [
+            (agent, tasks[agent.name].result())
+            for agent in agents
+            if tasks[agent.name].result() is not None
+        ]
+
+    def run(
+        self,
+        prompt: str,
+        on_start: Optional[Callable] = None,
+        on_result: Optional[Callable] = None,
+        on_skip: Optional[Callable] = None,
+        inputs: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[object, str]]:
+        """Blocking wrapper around :meth:`arun`."""
+        return run_in_new_loop(
+            self.arun(
+                prompt, on_start=on_start, on_result=on_result, on_skip=on_skip, inputs=inputs
+            )
+        )
@@ -0,0 +1,70 @@
+"""Structured, cache-friendly evolving system prompts.
+
+Agents used to evolve their prompt by appending ``"Previously you said: ..."``
+to a string and keeping the last 2000 characters, which cut through words and
+eventually the agent's identity line.  :class:`EvolvingPrompt` keeps the
+identity as an immutable prefix followed by a bounded ring buffer of short
+notes.  The prefix stays byte-identical across turns, so provider-side prompt
+prefix caching keeps applying as long as the notes, which change every turn,
+are sent after the conversation history (see :meth:`EvolvingPrompt.render_notes`).
+"""
+
+import textwrap
+from collections import deque
+from typing import Callable, Deque, Iterable, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+class EvolvingPrompt:
+    """Immutable ``prefix`` plus at most ``max_notes`` recent notes.
+
+    :meth:`render` returns the prefix and as many of the newest notes as fit
+    in ``max_tokens``; :meth:`render_notes` returns just those notes.  The
+    prefix is always included in full.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        max_notes: int = 8,
+        max_tokens: int = 500,
+        note_chars: int = 200,
+        notes: Optional[Iterable[str]] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ) -> None:
+        self.prefix = prefix
+        self.max_tokens = max_tokens
+        self.note_chars = note_chars
+        self.count_tokens = count_tokens
+        self.notes: Deque[str] = deque(notes or (), maxlen=max_notes)
+        self._notes: Optional[str] = None
+
+    def add_note(self, answer: str) -> None:
+        """Record a shortened note about the agent's latest ``answer``."""
+        text = textwrap.shorten(answer, width=self.note_chars, placeholder=" ...")
+        self.notes.append(f"Previously you said: {text}")
+        self._notes = None
+
+    def render_notes(self) -> str:
+        """Return the newest notes that fit the budget, or ``""``."""
+        if self._notes is None:
+            budget = self.max_tokens - self.count_tokens(self.prefix)
+            kept = []
+            for note in reversed(self.notes):
+                budget -= self.count_tokens(note)
+                if budget < 0:
+                    break
+                kept.append(note)
+            self._notes = "\n".join(kept[::-1])
+        return self._notes
+
+    def render(self) -> str:
+        notes = self.render_notes()
+        return f"{self.prefix}\n{notes}" if notes else self.prefix
+
+    def __str__(self) -> str:
+        return self.render()
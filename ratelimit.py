@@ -0,0 +1,165 @@
+"""Requests-per-minute and tokens-per-minute limiting shared by all agents.
+
+:class:`RateLimiter` keeps one token bucket for requests and one for tokens.
+Callers *reserve* capacity before a request: reservations are granted in call
+order and may drive a bucket negative, and each caller then sleeps until its
+share has refilled.  Callers therefore queue first come, first served instead
+of failing or racing each other into 429s.  When the API still answers 429,
+:meth:`RateLimiter.penalize` pauses every caller for the server's retry hint
+(or an exponential backoff when there is none).
+"""
+
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+
+class _Bucket:
+    """Token bucket holding up to ``per_minute`` units, refilled continuously."""
+
+    def __init__(self, per_minute: float, now: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """Reserve ``amount`` and return the seconds until it is covered."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # An oversized request waits for a full bucket instead of forever.
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Fair limiter for ``rpm`` requests and ``tpm`` tokens per minute.
+
+    Either limit may be ``None`` (unlimited); 429 backoff applies regardless.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        now = clock()
+        self.rpm = rpm
+        self.tpm = tpm
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._requests = _Bucket(rpm, now) if rpm else None
+        self._tokens = _Bucket(tpm, now) if tpm else None
+        self._blocked_until = now
+        self._strikes = 0
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.waited = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Claim one request and ``tokens`` tokens; return how long to wait."""
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self._blocked_until - now)
+            if self._requests is not None:
+                wait = max(wait, self._requests.take(1, now))
+            if self._tokens is not None and tokens:
+                wait = max(wait, self._tokens.take(tokens, now))
+            self.waited += wait
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block the calling thread until a request of ``tokens`` may be sent."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Asynchronous :meth:`acquire`."""
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Correct a reservation once the real token usage is known."""
+        if self._tokens is None or used is None:
+            return
+        with self._lock:
+            self._tokens.give(reserved - used)
+
+    def success(self) -> None:
+        with self._lock:
+            self._strikes = 0
+
+    def penalize(self, retry_after: Optional[float] = None) -> float:
+        """Pause all callers after a 429 and return the pause in seconds.
+
+        ``retry_after`` is the server's hint; without one the pause doubles
+        with every consecutive 429, up to ``max_backoff``.
+        """
+        with self._lock:
+            self.throttled += 1
+            if retry_after is None:
+                retry_after = self.base_backoff * (2 ** self._strikes) * random.uniform(0.5, 1.0)
+            self._strikes += 1
+            delay = min(max(retry_after, 0.0), self.max_backoff)
+            self._blocked_until = max(self._blocked_until, self.clock() + delay)
+            return delay
+
+    def stats(self) -> Dict[str, float]:
+        return {"throttled": self.throttled, "waited_s": round(self.waited, 3)}
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI reset durations such as ``"20ms"``, ``"1.5s"`` or ``"6m0s"``."""
+    parts = _DURATION.findall(value.strip())
+    if not parts or "".join(num + unit for num, unit in parts) != value.strip():
+        return None
+    return sum(float(num) * _UNITS[unit] for num, unit in parts)
+
+
+def retry_after_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """Return the wait in seconds suggested by a 429 response, if any.
+
+    Checks ``retry-after-ms``, ``retry-after`` (seconds or an HTTP date) and
+    finally the larger of ``x-ratelimit-reset-requests``/``-tokens``.
+    """
+    headers = {name.lower(): value for name, value in headers.items()}
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    resets = [
+        parse_duration(headers[name])
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        if name in headers
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
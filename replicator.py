@@ -0,0 +1,196 @@
+"""Copy stored messages from SQLite to MongoDB in the background.
+
+SQLite is the source of truth.  :class:`MongoReplicator` tails the
+``messages`` table from a cursor kept in the same database (the
+``replication_cursors`` table), pushes new rows to a MongoDB collection with
+``insert_many`` and advances the cursor only after MongoDB accepted the batch.
+A slow or unreachable MongoDB therefore never blocks :meth:`Storage.save`;
+failed batches are retried with exponential backoff and replication resumes
+from the cursor after a restart.
+
+Each document uses the SQLite row ``id`` as its ``_id``, so a batch that is
+sent again after a crash between the insert and the cursor update is
+recognized as duplicates instead of being stored twice.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import metrics
+
+DUPLICATE_KEY = 11000
+
+
+def _only_duplicates(exc: Exception) -> bool:
+    """Whether ``exc`` is a bulk write error caused only by already stored ids."""
+    details = getattr(exc, "details", None) or {}
+    errors = details.get("writeErrors") if isinstance(details, dict) else None
+    return bool(errors) and all(error.get("code") == DUPLICATE_KEY for error in errors)
+
+
+class MongoReplicator:
+    """Replicate new rows of ``db_path`` into ``collection``.
+
+    ``collection`` only needs an ``insert_many(documents, ordered=False)``
+    method, so tests can pass an in-process stand-in.  Up to ``batch_size``
+    rows are sent per call.  The thread polls every ``poll_interval`` seconds
+    or sooner after :meth:`notify`; after a failure it waits ``base_backoff``
+    seconds, doubling up to ``max_backoff``.  ``name`` keys the persisted
+    cursor, so several targets can replicate the same database.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        collection,
+        name: str = "mongo",
+        batch_size: int = 500,
+        poll_interval: float = 1.0,
+        base_backoff: float = 0.5,
+        max_backoff: float = 60.0,
+    ) -> None:
+        from storage import migrate
+
+        self.db_path = db_path
+        self.collection = collection
+        self.name = name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        migrate(self.conn)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO replication_cursors VALUES (?, 0)", (name,)
+            )
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def cursor(self) -> int:
+        """Id of the last message known to be in MongoDB."""
+        with self._lock:
+            return self._cursor()
+
+    def _cursor(self) -> int:
+        return self.conn.execute(
+            "SELECT last_id FROM replication_cursors WHERE name = ?", (self.name,)
+        ).fetchone()[0]
+
+    def sync_once(self) -> int:
+        """Send the next batch to MongoDB and return how many rows it held."""
+        with self._lock:
+            cursor = self._cursor()
+            rows = self.conn.execute(
+                "SELECT id, session_id, agent, role, content, created_at FROM messages "
+                "WHERE id > ? ORDER BY id LIMIT ?",
+                (cursor, self.batch_size),
+            ).fetchall()
+            if rows:
+                documents = [
+                    {
+                        "_id": row_id,
+                        "session_id": session_id,
+                        "agent": agent,
+                        "role": role,
+                        "content": content,
+                        "created_at": created_at,
+                    }
+                    for row_id, session_id, agent, role, content, created_at in rows
+                ]
+                try:
+                    self.collection.insert_many(documents, ordered=False)
+                except Exception as exc:
+                    if not _only_duplicates(exc):
+                        raise
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE replication_cursors SET last_id = ? WHERE name = ?",
+                        (rows[-1][0], self.name),
+                    )
+                metrics.MONGO_REPLICATED.inc(len(rows))
+            self._update_lag()
+        return len(rows)
+
+    def drain(self) -> int:
+        """Replicate until caught up; return the number of rows sent."""
+        total = 0
+        while True:
+            sent = self.sync_once()
+            total += sent
+            if sent < self.batch_size:
+                return total
+
+    def lag(self):
+        """Return ``(pending messages, age in seconds of the oldest one)``."""
+        with self._lock:
+            return self._lag()
+
+    def _lag(self):
+        pending, oldest = self.conn.execute(
+            "SELECT COUNT(*), MIN(created_at) FROM messages WHERE id > ?", (self._cursor(),)
+        ).fetchone()
+        age = max(0.0, time.time() - oldest) if pending and oldest is not None else 0.0
+        return pending, age
+
+    def _update_lag(self) -> None:
+        pending, age = self._lag()
+        metrics.MONGO_REPLICATION_PENDING.set(pending)
+        metrics.MONGO_REPLICATION_LAG_SECONDS.set(age)
+
+    def notify(self) -> None:
+        """Tell the thread that new rows were committed."""
+        self._wake.set()
+
+    def start(self) -> "MongoReplicator":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mongo-replicator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, drain: bool = True) -> None:
+        """Stop the thread, then try once to send what is left if ``drain``.
+
+        Rows that cannot be sent now stay behind the cursor for the next run.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            try:
+                self.drain()
+            except Exception as exc:
+                print(f"[Replication error] {exc}")
+
+    def close(self) -> None:
+        self.stop()
+        self.conn.close()
+
+    def _run(self) -> None:
+        backoff = self.base_backoff
+        while not self._stop.is_set():
+            try:
+                sent = self.sync_once()
+            except Exception as exc:
+                metrics.MONGO_REPLICATION_ERRORS.inc()
+                print(f"[Replication error] {exc}")
+                try:
+                    with self._lock:
+                        self._update_lag()
+                except sqlite3.Error:
+                    pass
+                # New messages must not cut the backoff short; only stop() does.
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.base_backoff
+            if sent < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
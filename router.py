@@ -0,0 +1,242 @@
+"""Route each chat call to one of several models, failing over on errors.
+
+A :class:`ModelRouter` stands in for a single chat model on an agent.  For
+every call it ranks the configured :class:`Route` objects:
+
+* routes whose ``max_prompt_tokens`` is smaller than the prompt go last, so
+  short, simple turns can use a small fast model and long ones a larger one;
+* routes whose recent error rate exceeds ``max_error_rate`` go after healthy
+  ones;
+* within each group, the lowest moving-window mean latency wins, and routes
+  without measurements yet come first so they get probed.  Ties keep the
+  configured order.
+
+The call goes to the first route.  If it raises or takes longer than
+``timeout`` seconds, the next route is tried until one succeeds.  Tokens a
+streaming model emitted before it failed have already reached the callbacks.
+
+Routes are written as ``"gpt-4o-mini:500,gpt-4o"``: comma-separated model
+names, each with an optional ``:max_prompt_tokens``.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import metrics
+from prompts import estimate_tokens
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _thread_pool() -> concurrent.futures.ThreadPoolExecutor:
+    # Blocking calls run here so they can be abandoned after a timeout.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=32, thread_name_prefix="model-router"
+            )
+        return _executor
+
+
+class ModelHealth:
+    """Latency and outcome of the last ``window`` calls to one model.
+
+    Calls older than ``max_age`` seconds are forgotten, so a model that was
+    failing is tried again once its errors have aged out.
+    """
+
+    def __init__(
+        self, window: int = 20, max_age: float = 300.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.max_age = max_age
+        self.clock = clock
+        self._calls: Deque[Tuple[float, float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._calls.append((self.clock(), seconds, ok))
+
+    def _recent(self) -> List[Tuple[float, bool]]:
+        cutoff = self.clock() - self.max_age
+        with self._lock:
+            return [(seconds, ok) for at, seconds, ok in self._calls if at >= cutoff]
+
+    def latency(self) -> Optional[float]:
+        """Mean latency of the recent successful calls, if any."""
+        times = [seconds for seconds, ok in self._recent() if ok]
+        return sum(times) / len(times) if times else None
+
+    def error_rate(self) -> float:
+        calls = self._recent()
+        return sum(not ok for _, ok in calls) / len(calls) if calls else 0.0
+
+    def calls(self) -> int:
+        return len(self._recent())
+
+
+class Route:
+    """One model a router may use; ``max_prompt_tokens=None`` means any prompt."""
+
+    def __init__(self, name: str, chat, max_prompt_tokens: Optional[int] = None, window: int = 20):
+        self.name = name
+        self.chat = chat
+        self.max_prompt_tokens = max_prompt_tokens
+        self.health = ModelHealth(window)
+
+    def fits(self, tokens: int) -> bool:
+        return self.max_prompt_tokens is None or tokens <= self.max_prompt_tokens
+
+
+def parse_routes(spec: str) -> List[Tuple[str, Optional[int]]]:
+    """Parse ``"small:500,large"`` into ``[("small", 500), ("large", None)]``."""
+    routes = []
+    for part in spec.split(","):
+        name, _, limit = part.strip().partition(":")
+        if not name:
+            raise ValueError(f"invalid model route {part!r}")
+        routes.append((name, int(limit) if limit else None))
+    if not routes:
+        raise ValueError("at least one model is required")
+    return routes
+
+
+def is_route_spec(value: Optional[str]) -> bool:
+    """Whether ``value`` names several models or a prompt limit rather than one model."""
+    return bool(value) and ("," in value or ":" in value)
+
+
+class ModelRouter:
+    """Chat-model facade that picks and fails over between ``routes``.
+
+    It offers the calls :class:`agent.SimpleAgent` makes on a chat model:
+    calling it with messages and ``agenerate``.
+    """
+
+    def __init__(
+        self,
+        routes: List[Route],
+        timeout: Optional[float] = 60.0,
+        max_error_rate: float = 0.5,
+    ) -> None:
+        if not routes:
+            raise ValueError("at least one route is required")
+        self.routes = routes
+        self.timeout = timeout
+        self.max_error_rate = max_error_rate
+        self.last_model: Optional[str] = None
+
+    @classmethod
+    def from_spec(cls, spec: str, new_chat: Callable[[str], object], **kwargs) -> "ModelRouter":
+        """Build a router from a route spec; ``new_chat(name)`` creates each model."""
+        return cls([Route(name, new_chat(name), limit) for name, limit in parse_routes(spec)], **kwargs)
+
+    @property
+    def model_name(self) -> str:
+        # Also the response cache key, so it reflects the whole configuration.
+        return ",".join(
+            route.name if route.max_prompt_tokens is None else f"{route.name}:{route.max_prompt_tokens}"
+            for route in self.routes
+        )
+
+    @property
+    def callbacks(self) -> Optional[list]:
+        for route in self.routes:
+            if getattr(route.chat, "callbacks", None):
+                return route.chat.callbacks
+        return None
+
+    @property
+    def temperature(self) -> Optional[float]:
+        # Only a temperature every route shares describes the router's
+        # answers; the response cache and checkpoints rely on it.
+        temperatures = {getattr(route.chat, "temperature", None) for route in self.routes}
+        return temperatures.pop() if len(temperatures) == 1 else None
+
+    @property
+    def streaming(self) -> bool:
+        return any(getattr(route.chat, "streaming", False) for route in self.routes)
+
+    def order(self, messages: list) -> List[Route]:
+        """Return the routes in the order they would be tried for ``messages``."""
+        tokens = sum(estimate_tokens(str(getattr(msg, "content", ""))) for msg in messages)
+
+        def rank(route: Route):
+            latency = route.health.latency()
+            return (
+                not route.fits(tokens),
+                route.health.error_rate() > self.max_error_rate,
+                latency if latency is not None else 0.0,
+            )
+
+        return sorted(self.routes, key=rank)
+
+    def __call__(self, messages: list, callbacks: Optional[list] = None):
+        kwargs = {"callbacks": callbacks} if callbacks else {}
+        last_error: Optional[BaseException] = None
+        for route in self.order(messages):
+            start = time.perf_counter()
+            future = _thread_pool().submit(route.chat, messages, **kwargs)
+            try:
+                result = future.result(timeout=self.timeout)
+            except Exception as exc:
+                last_error = self._failed(route, start, exc)
+                continue
+            return self._succeeded(route, start, result)
+        raise last_error
+
+    async def agenerate(self, batches: List[list], callbacks: Optional[list] = None):
+        messages = batches[0]
+        kwargs = {"callbacks": callbacks} if callbacks else {}
+        last_error: Optional[BaseException] = None
+        for route in self.order(messages):
+            start = time.perf_counter()
+            agenerate = getattr(route.chat, "agenerate", None)
+            if agenerate is None:
+                call = asyncio.to_thread(self._generate_sync, route.chat, messages, kwargs)
+            else:
+                call = agenerate([messages], **kwargs)
+            try:
+                result = await asyncio.wait_for(call, self.timeout)
+            except Exception as exc:  # asyncio.TimeoutError included
+                last_error = self._failed(route, start, exc)
+                continue
+            return self._succeeded(route, start, result)
+        raise last_error
+
+    @staticmethod
+    def _generate_sync(chat, messages: list, kwargs: dict):
+        from langchain.schema import ChatGeneration, LLMResult
+
+        message = chat(messages, **kwargs)
+        return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+    def _succeeded(self, route: Route, start: float, result):
+        route.health.record(time.perf_counter() - start, True)
+        self.last_model = route.name
+        metrics.LLM_ROUTED.inc(model=route.name)
+        return result
+
+    def _failed(self, route: Route, start: float, exc: BaseException) -> BaseException:
+        route.health.record(time.perf_counter() - start, False)
+        metrics.LLM_FAILOVERS.inc(model=route.name)
+        if isinstance(exc, (asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+            return TimeoutError(f"{route.name} did not answer within {self.timeout} s")
+        return exc
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Moving-window latency, error rate and sample count per model."""
+        return {
+            route.name: {
+                "latency_s": round(route.health.latency() or 0.0, 3),
+                "error_rate": round(route.health.error_rate(), 3),
+                "calls": route.health.calls(),
+            }
+            for route in self.routes
+        }
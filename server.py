@@ -1,26 +1,312 @@
 import os
+import json
+import queue
+import asyncio
 import argparse
-from flask import Flask, request, jsonify, render_template_string
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
+import threading
+import uuid
+from typing import Optional
 
-from agent import SimpleAgent
-from storage import storage
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 
+import metrics
+from agent import SimpleAgent, resume_agents
+from cache import ResponseCache
+from pipeline import TOPOLOGIES, Pipeline, parse_dag
+from router import ModelRouter, is_route_spec
+from sessions import SessionManager
+from state_store import get_state_store
+from storage import get_storage
+
+# Importing this module has no side effects beyond creating the app: the API
+# key, LangChain, the response cache and the database are set up on first use.
 app = Flask(__name__)
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY environment variable is required")
+config = {
+    "agents": 1,
+    "topology": "chain",
+    "dag": None,
+    "concurrency": 4,
+    "memory_tokens": 0,
+    "recall": 0,
+    "compact_memory": False,
+    "models": None,
+    "model_timeout": 60.0,
+    "agent_timeout": None,
+    "turn_timeout": None,
+    "resume_turns": 10,
+}
+_response_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the server's :class:`ResponseCache`, creating it on first use."""
+    global _response_cache
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(os.getenv("CHAT_CACHE_DB"))
+        return _response_cache
+
+
+def new_chat(settings: Optional[dict] = None):
+    """Build a streaming chat model, optionally with saved ``model_name``/``temperature``.
+
+    A ``model_name`` (or ``--models``) listing several models builds a
+    :class:`router.ModelRouter` over them.
+    """
+    from clients import chat_model
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY environment variable is required")
+    kwargs = {key: value for key, value in (settings or {}).items() if value is not None}
+    models = kwargs.pop("model_name", None) or config["models"]
+    if is_route_spec(models):
+        return ModelRouter.from_spec(
+            models,
+            lambda name: chat_model(name, api_key, streaming=True, **kwargs),
+            timeout=config["model_timeout"],
+        )
+    if models:
+        kwargs["model_name"] = models
+    return chat_model(api_key=api_key, streaming=True, **kwargs)
+
+
+def new_agents() -> list:
+    """Build a fresh agent set for a new session."""
+    from langchain.memory import ConversationBufferMemory
+
+    from memory import CompactMemory, RetrievalMemory, SummaryWindowMemory
+
+    def new_memory():
+        if config["recall"]:
+            return RetrievalMemory(k=config["recall"])
+        if config["memory_tokens"]:
+            return SummaryWindowMemory(max_tokens=config["memory_tokens"])
+        if config["compact_memory"]:
+            return CompactMemory()
+        return ConversationBufferMemory()
+
+    return [
+        SimpleAgent(
+            name=f"Agent{n}",
+            chat=new_chat(),
+            memory=new_memory(),
+            system_prompt=f"You are Agent{n}, a helpful assistant.",
+            cache=get_response_cache(),
+            timeout=config["agent_timeout"],
+        )
+        for n in range(1, config["agents"] + 1)
+    ]
+
+
+sessions = SessionManager(new_agents)
+
+# All LLM calls run on one event loop in a background thread, so many slow
+# completions share the process while request threads only relay results.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="agent-loop", daemon=True).start()
+        return _loop
+
+
+# Attempts to commit a turn when other workers keep winning the race.
+MAX_COMMIT_ATTEMPTS = 5
+
+
+async def run_turn(session_id: str, message: str, events: "queue.Queue | None" = None) -> dict:
+    """Run one chat turn for ``session_id`` and return the JSON reply."""
+    storage = get_storage()
+    store = get_state_store()
+    session = sessions.get(session_id)
+    async with session.lock:
+        if store is not None:
+            # Store reads and commits block too.
+            await asyncio.to_thread(_load_state, session, store)
+        if storage and not session.restored:
+            # A session unknown to this process may have been stored by an
+            # earlier one; pick up where it left off.
+            await asyncio.to_thread(
+                resume_agents, session.agents, storage, session.session_id, config["resume_turns"]
+            )
+        session.restored = True
+        # SQLite commits block, so they run in worker threads rather than
+        # stalling every session on the shared loop.
+        if storage:
+            await asyncio.to_thread(storage.save, "user", "user", message, session.session_id)
+
+        prompts = {}
+
+        async def on_result(agent: SimpleAgent, answer: str) -> None:
+            if storage:
+                await asyncio.to_thread(
+                    storage.save,
+                    agent.name,
+                    "assistant",
+                    answer,
+                    session.session_id,
+                    prompts[agent.name],
+                )
+            if events is not None:
+                events.put(("agent_done", {"agent": agent.name, "answer": answer}))
+
+        def callbacks(agent: SimpleAgent) -> list:
+            from handlers import QueueStreamingHandler
+
+            return [QueueStreamingHandler(agent.name, events)]
+
+        pipeline = Pipeline(
+            session.agents,
+            topology=config["topology"],
+            dag=config["dag"],
+            concurrency=config["concurrency"],
+            turn_timeout=config["turn_timeout"],
+        )
+        skipped = {}
+
+        def on_skip(agent: SimpleAgent, exc: Exception) -> None:
+            skipped[agent.name] = str(exc)
+            if events is not None:
+                events.put(("agent_skipped", {"agent": agent.name, "error": str(exc)}))
+
+        try:
+            results = await pipeline.arun(
+                message,
+                on_result=on_result,
+                callbacks=callbacks if events is not None else None,
+                on_skip=on_skip,
+                inputs=prompts,
+            )
+            if store is not None:
+                turn = [(agent.name, prompts[agent.name], answer) for agent, answer in results]
+                await asyncio.to_thread(_commit_state, session, store, turn)
+        except BaseException:
+            # The agents may hold a half-finished turn; reload them next time.
+            session.version = -1
+            raise
+    return {
+        "session_id": session.session_id,
+        "reply": results[-1][1] if results else "",
+        "replies": {agent.name: answer for agent, answer in results},
+        "skipped": skipped,
+    }
+
+
+def _encode_agents(agents: list) -> bytes:
+    import checkpoint
+
+    return checkpoint.dumps(checkpoint.snapshot({"agents": agents}))
+
+
+def _load_state(session, store, force: bool = False) -> None:
+    """Replace the session's agents with the shared state if it has moved on."""
+    import checkpoint
+
+    if not force and store.version(session.session_id) == session.version:
+        return
+    record = store.load(session.session_id)
+    if record is None:
+        session.version = 0
+        return
+    states = checkpoint.loads(record.data)
+    session.agents = checkpoint.restore(states, new_chat, cache=get_response_cache())["agents"]
+    session.version = record.version
+    session.restored = True
+
+
+def _commit_state(session, store, turn: list) -> None:
+    """Save the session after a turn, merging with any concurrent commit.
+
+    ``turn`` holds ``(agent name, prompt, answer)`` for every agent that
+    answered.  On a conflict the latest state is loaded and those prompts and
+    answers are replayed into it, so no model call is repeated and turns from
+    different workers are serialized in commit order.
+    """
+    from state_store import StateConflict
+
+    for _ in range(MAX_COMMIT_ATTEMPTS):
+        try:
+            session.version = store.save(
+                session.session_id, _encode_agents(session.agents), session.version
+            )
+            return
+        except StateConflict:
+            _load_state(session, store, force=True)
+            by_name = {agent.name: agent for agent in session.agents}
+            for name, prompt, answer in turn:
+                if name in by_name:
+                    by_name[name].restore([(prompt, answer)])
+    raise StateConflict(session.session_id, session.version)
+
+
+async def _collect_sessions() -> dict:
+    import checkpoint
+
+    states = {}
+    for sid, session in sessions.items():
+        # A turn awaits its model calls while holding the lock, so without it
+        # a snapshot could catch a memory between a prompt and its answer.
+        async with session.lock:
+            states.update(checkpoint.snapshot({sid: session.agents}))
+    return states
 
-agents = [
-    SimpleAgent(
-        name="Agent1",
-        chat=ChatOpenAI(openai_api_key=api_key),
-        memory=ConversationBufferMemory(),
-        system_prompt="You are Agent1, a helpful assistant.",
+
+async def _restore_sessions(states: dict) -> int:
+    import checkpoint
+
+    restored = checkpoint.restore(states, new_chat, cache=get_response_cache())
+    for session_id, agents in restored.items():
+        # Already up to date; don't reload turns from storage on top.
+        sessions.put(session_id, agents).restored = True
+    return len(restored)
+
+
+def start_checkpointing(path: str, interval: float = 30.0):
+    """Restore sessions from ``path`` and keep checkpointing them there.
+
+    Returns the running :class:`checkpoint.Checkpointer`.
+    """
+    import atexit
+
+    import checkpoint
+
+    loop = get_loop()
+    states = checkpoint.read_checkpoint(path)
+    if states:
+        count = asyncio.run_coroutine_threadsafe(_restore_sessions(states), loop).result()
+        print(f"Restored {count} sessions from {path}")
+    checkpointer = checkpoint.Checkpointer(
+        path,
+        lambda: asyncio.run_coroutine_threadsafe(_collect_sessions(), loop).result(),
+        interval=interval,
+    ).start()
+    atexit.register(checkpointer.stop)
+    return checkpointer
+
+
+def _request_message() -> "tuple[str, str | None]":
+    data = request.get_json(silent=True) or {}
+    message = request.form.get("message") or data.get("message", "")
+    session_id = (
+        request.form.get("session_id")
+        or data.get("session_id")
+        or request.headers.get("X-Session-ID")
+        or request.cookies.get("session_id")
     )
-]
+    return message, session_id
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
 @app.route("/", methods=["GET"])
 def index():
@@ -38,24 +324,182 @@ def index():
 
 @app.route("/chat", methods=["POST"])
 def chat():
-    message = request.form.get("message") or request.json.get("message", "")
-    if storage:
-        storage.save("user", "user", message)
-    prompt = message
-    for agent in agents:
-        answer = agent.respond(prompt)
-        if storage:
-            storage.save(agent.name, "assistant", answer)
-        prompt = answer
-    return jsonify({"reply": prompt})
+    message, session_id = _request_message()
+    future = asyncio.run_coroutine_threadsafe(run_turn(session_id, message), get_loop())
+    reply = future.result()
+    resp = jsonify(reply)
+    resp.set_cookie("session_id", reply["session_id"], httponly=True, samesite="Lax")
+    return resp
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Stream a turn as Server-Sent Events.
+
+    Emits ``session`` first, then ``token`` events as each agent generates,
+    ``agent_done`` with every full answer, ``agent_skipped`` for agents that
+    missed their deadline and finally ``done`` (or ``error``).
+    """
+    message, session_id = _request_message()
+    session_id = session_id or uuid.uuid4().hex
+    events: "queue.Queue" = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        run_turn(session_id, message, events), get_loop()
+    )
+    future.add_done_callback(lambda _: events.put(None))
+
+    def generate():
+        yield _sse("session", {"session_id": session_id})
+        try:
+            while True:
+                item = events.get()
+                if item is None:
+                    break
+                yield _sse(*item)
+            exc = future.exception()
+            if exc is not None:
+                yield _sse("error", {"error": str(exc)})
+            else:
+                yield _sse("done", future.result())
+        finally:
+            future.cancel()  # client went away mid-turn
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.set_cookie("session_id", session_id, httponly=True, samesite="Lax")
+    return resp
+
+
+@app.route("/history", methods=["GET"])
+def history():
+    """Return one page of a session's stored messages, oldest first.
+
+    Pass ``next_before`` from the reply as ``before`` to fetch the previous page.
+    """
+    session_id = request.args.get("session_id") or request.cookies.get("session_id")
+    if not session_id:
+        return jsonify({"error": "session_id is required"}), 400
+    storage = get_storage()
+    if not storage:
+        return jsonify({"error": "persistence is disabled (set CHAT_PERSIST=1)"}), 404
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    page = storage.history(session_id, limit=limit, before=request.args.get("before", type=int))
+    return jsonify(
+        {
+            "session_id": session_id,
+            "messages": [msg._asdict() for msg in page],
+            "next_before": page[0].id if len(page) == limit else None,
+        }
+    )
+
+
+@app.route("/search", methods=["GET"])
+def search():
+    """Full-text search over stored messages, best match first.
+
+    ``q`` is required; ``session_id`` narrows the search to one session.  Pass
+    ``next_offset`` from the reply as ``offset`` to fetch the next page.
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    storage = get_storage()
+    if not storage:
+        return jsonify({"error": "persistence is disabled (set CHAT_PERSIST=1)"}), 404
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    hits = storage.search(
+        query, session_id=request.args.get("session_id"), limit=limit, offset=offset
+    )
+    return jsonify(
+        {
+            "query": query,
+            "results": [hit._asdict() for hit in hits],
+            "next_offset": offset + limit if len(hits) == limit else None,
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Expose agent, storage and tool metrics in Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run chat server")
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--agents", type=int, default=1, help="Agents per session")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="chain")
+    parser.add_argument("--dag", default="", help="Edges for --topology dag")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--session-ttl", type=float, default=1800, help="Seconds before an idle session is evicted"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument(
+        "--memory-tokens", type=int, default=0, help="Token budget per agent memory (0 = unlimited)"
+    )
+    parser.add_argument(
+        "--models", help="Model, or models to route between, e.g. 'gpt-4o-mini:500,gpt-4o'"
+    )
+    parser.add_argument(
+        "--model-timeout", type=float, default=60.0, help="Seconds before a routed call fails over"
+    )
+    parser.add_argument(
+        "--agent-timeout", type=float, help="Seconds each agent may take before it is skipped"
+    )
+    parser.add_argument(
+        "--turn-timeout", type=float, help="Seconds a whole turn may take; late agents are skipped"
+    )
+    parser.add_argument(
+        "--recall", type=int, default=0, metavar="K", help="Retrieve the K most relevant older turns"
+    )
+    parser.add_argument(
+        "--compact-memory",
+        action="store_true",
+        help="Store full histories in a compact byte arena (less RAM per session)",
+    )
+    parser.add_argument(
+        "--resume-turns", type=int, default=10, help="Stored turns to reload for a returning session"
+    )
+    parser.add_argument("--rpm", type=float, help="Requests per minute across all sessions")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute across all sessions")
+    parser.add_argument("--checkpoint", help="File to restore sessions from and checkpoint them to")
+    parser.add_argument(
+        "--checkpoint-interval", type=float, default=30, help="Seconds between checkpoints"
+    )
     args = parser.parse_args()
-    app.run(host=args.host, port=args.port)
+    if args.compact_memory and (args.recall or args.memory_tokens):
+        parser.error("--compact-memory cannot be combined with --recall or --memory-tokens")
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY environment variable is required")
+    get_response_cache().enabled = not args.no_cache
+    if args.rpm or args.tpm:
+        from clients import get_pool
+
+        # Limits that were not given keep their OPENAI_RPM/OPENAI_TPM value.
+        get_pool().configure(rpm=args.rpm, tpm=args.tpm)
+    config.update(
+        agents=args.agents,
+        topology=args.topology,
+        dag=parse_dag(args.dag) if args.dag else None,
+        concurrency=args.concurrency,
+        memory_tokens=args.memory_tokens,
+        recall=args.recall,
+        compact_memory=args.compact_memory,
+        models=args.models,
+        model_timeout=args.model_timeout,
+        agent_timeout=args.agent_timeout,
+        turn_timeout=args.turn_timeout,
+        resume_turns=args.resume_turns,
+    )
+    sessions.idle_timeout = args.session_ttl
+    if args.checkpoint:
+        start_checkpointing(args.checkpoint, args.checkpoint_interval)
+    app.run(host=args.host, port=args.port, threaded=True)
 
 
 if __name__ == "__main__":
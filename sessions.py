@@ -0,0 +1,103 @@
+"""Per-client agent sessions for the HTTP server.
+
+Each session owns its own agents, so their memories and evolving prompts are
+never shared between clients.  Sessions are created lazily on first use and
+evicted once they have been idle for longer than ``idle_timeout`` seconds or
+when ``max_sessions`` would be exceeded (least recently used first).
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class Session:
+    """State owned by one client.
+
+    ``lock`` serializes turns within the session while different sessions
+    proceed concurrently.  ``restored`` is set once stored history has been
+    loaded into the agents, and ``version`` is the shared-state version the
+    agents correspond to (see :mod:`state_store`; ``-1`` means stale).
+    """
+
+    session_id: str
+    agents: list
+    last_used: float = field(default_factory=time.monotonic)
+    restored: bool = False
+    version: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SessionManager:
+    """Create, look up and evict :class:`Session` objects."""
+
+    def __init__(
+        self,
+        factory: Callable[[], list],
+        idle_timeout: float = 1800.0,
+        max_sessions: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """Return the session for ``session_id``, creating it if needed.
+
+        A new random ID is generated when ``session_id`` is empty.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        now = self.clock()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.factory(), last_used=now)
+                self._sessions[session_id] = session
+                if self.max_sessions is not None:
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def put(self, session_id: str, agents: list) -> Session:
+        """Install ``agents`` as the session ``session_id``, e.g. from a checkpoint."""
+        with self._lock:
+            session = Session(session_id, agents, last_used=self.clock())
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def items(self) -> list:
+        """Return ``(session_id, session)`` pairs, least recently used first."""
+        with self._lock:
+            return list(self._sessions.items())
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float) -> None:
+        # Sessions are ordered by last use, so the idle ones are at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
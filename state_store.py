@@ -0,0 +1,162 @@
+"""Shared session state so several server processes can serve one session.
+
+A :class:`StateStore` keeps one opaque blob per session together with a
+version number.  Writers pass the version they loaded; the write succeeds
+only if nobody committed in between and otherwise raises
+:class:`StateConflict` (optimistic concurrency).  The interface is small on
+purpose: it maps onto a compare-and-swap in SQL, ``WATCH``/``MULTI`` in Redis
+or a conditional put in most key-value services.
+
+:class:`SQLiteStateStore` shares state between processes on one machine.
+:class:`MemoryStateStore` is the in-process reference implementation.
+"""
+
+import abc
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class StateConflict(Exception):
+    """The session was changed by another writer since it was loaded."""
+
+    def __init__(self, session_id: str, expected: int) -> None:
+        super().__init__(f"session {session_id} is no longer at version {expected}")
+        self.session_id = session_id
+        self.expected = expected
+
+
+class StateRecord(NamedTuple):
+    version: int
+    data: bytes
+
+
+class StateStore(abc.ABC):
+    """Interface for versioned per-session state.
+
+    Version ``0`` means "no state yet"; every successful :meth:`save`
+    increments the version by one.
+    """
+
+    def version(self, session_id: str) -> int:
+        """Return the current version of ``session_id`` (``0`` if unknown)."""
+        record = self.load(session_id)
+        return record.version if record is not None else 0
+
+    @abc.abstractmethod
+    def load(self, session_id: str) -> Optional[StateRecord]:
+        """Return the state and version of ``session_id``, or ``None``."""
+
+    @abc.abstractmethod
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        """Store ``data`` if the session is still at ``expected_version``.
+
+        Returns the new version; raises :class:`StateConflict` otherwise.
+        """
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Forget ``session_id``."""
+
+
+class MemoryStateStore(StateStore):
+    """State kept in a dictionary; only shared within one process."""
+
+    def __init__(self) -> None:
+        self._records: Dict[str, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[StateRecord]:
+        record = self._records.get(session_id)
+        return StateRecord(*record) if record is not None else None
+
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        with self._lock:
+            current = self._records.get(session_id, (0, b""))[0]
+            if current != expected_version:
+                raise StateConflict(session_id, expected_version)
+            self._records[session_id] = (current + 1, data)
+            return current + 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._records.pop(session_id, None)
+
+
+class SQLiteStateStore(StateStore):
+    """State in a SQLite file that every worker process opens.
+
+    WAL mode lets readers proceed while one worker commits, and the version
+    check is part of the ``UPDATE`` so it is atomic across processes.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT version FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id: str) -> Optional[StateRecord]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT version, data FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return StateRecord(row[0], bytes(row[1])) if row else None
+
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        now = time.time()
+        with self._lock, self.conn:
+            if expected_version == 0:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO session_state VALUES (?, 1, ?, ?)",
+                    (session_id, data, now),
+                )
+            else:
+                cursor = self.conn.execute(
+                    "UPDATE session_state SET version = version + 1, data = ?, updated_at = ? "
+                    "WHERE session_id = ? AND version = ?",
+                    (data, now, session_id, expected_version),
+                )
+        if cursor.rowcount != 1:
+            raise StateConflict(session_id, expected_version)
+        return expected_version + 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_UNSET = object()
+_store = _UNSET
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> Optional[StateStore]:
+    """Return the store named by ``CHAT_STATE_DB``, or ``None`` for in-process state."""
+    global _store
+    with _store_lock:
+        if _store is _UNSET:
+            path = os.getenv("CHAT_STATE_DB")
+            _store = SQLiteStateStore(path) if path else None
+        return _store
@@ -1,44 +1,404 @@
+import atexit
 import os
+import queue
 import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-try:
-    from pymongo import MongoClient
-except Exception:
-    MongoClient = None
+import metrics
 
-class Storage:
-    """Persist messages to SQLite and optionally MongoDB."""
+_FLUSH = object()
+_STOP = object()
+
+
+class StoredMessage(NamedTuple):
+    """One row of the ``messages`` table."""
+
+    id: int
+    session_id: str
+    agent: str
+    role: str
+    content: str
+    created_at: Optional[float]
+
+
+class SearchHit(NamedTuple):
+    """One :meth:`Storage.search` result; ``snippet`` marks the matched terms."""
+
+    id: int
+    session_id: str
+    agent: str
+    role: str
+    snippet: str
+    created_at: Optional[float]
+    rank: float
 
-    def __init__(self, path: str = "chat.db") -> None:
-        self.conn = sqlite3.connect(path)
-        self.conn.execute(
-            "CREATE TABLE IF NOT EXISTS messages (agent TEXT, role TEXT, content TEXT)"
+
+def match_expression(query: str) -> str:
+    """Turn free text into an FTS5 query matching messages with every word.
+
+    Each word is quoted, so punctuation and FTS5 operators in user input are
+    searched for literally instead of raising syntax errors.
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    # Version 0 is either an empty database or the original
+    # (agent, role, content) table without keys or indexes.
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages'"
+    ).fetchone()
+    conn.execute(
+        """CREATE TABLE messages_v1 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL DEFAULT '',
+            agent TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL,
+            prompt TEXT
+        )"""
+    )
+    if legacy:
+        conn.execute(
+            "INSERT INTO messages_v1 (agent, role, content) "
+            "SELECT agent, role, content FROM messages ORDER BY rowid"
         )
-        self.conn.commit()
+        conn.execute("DROP TABLE messages")
+    conn.execute("ALTER TABLE messages_v1 RENAME TO messages")
+    # History pages and resume both read one session in id order.
+    conn.execute("CREATE INDEX messages_session ON messages (session_id, id)")
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    # Positions of the background replicators (see replicator.py).  Earlier
+    # versions mirrored to MongoDB inline, so existing rows either are there
+    # already or were never meant to be: start the cursor at the current end.
+    conn.execute(
+        """CREATE TABLE replication_cursors (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )"""
+    )
+    conn.execute(
+        "INSERT INTO replication_cursors SELECT 'mongo', COALESCE(MAX(id), 0) FROM messages"
+    )
+
+
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    # Full-text index over message content.  It is an external-content FTS5
+    # table: the text lives only in ``messages`` and triggers keep the index
+    # in step with every insert, update and delete.
+    conn.execute(
+        "CREATE VIRTUAL TABLE messages_fts USING fts5("
+        "content, content='messages', content_rowid='id', tokenize='unicode61')"
+    )
+    conn.execute(
+        """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END"""
+    )
+    # Backfill whatever the database already holds.
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+# MIGRATIONS[n] upgrades a database from ``PRAGMA user_version`` n to n + 1.
+MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Bring the schema up to :data:`SCHEMA_VERSION` and return the old version.
+
+    All pending migrations run in one ``BEGIN IMMEDIATE`` transaction, so
+    concurrent processes opening the same file cannot migrate it twice.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return version
+
+
+class Storage:
+    """Persist messages to SQLite and optionally mirror them to MongoDB.
+
+    Every message belongs to a ``session_id`` and gets a monotonically
+    increasing ``id`` and a ``created_at`` timestamp.  :meth:`history` pages
+    through a session by ``id``, :meth:`search` runs ranked full-text queries
+    and :meth:`load_turns` fetches the latest turns for resuming it.  Older
+    databases are migrated when opened.
+
+    By default every :meth:`save` is written and committed immediately.  With
+    ``write_behind=True`` messages are queued instead and a background thread
+    writes them with ``executemany`` in one transaction per batch, either when
+    ``batch_size`` messages are waiting or ``flush_interval`` seconds after the
+    first one arrived.  The queue holds at most ``max_queue`` messages; when it
+    is full :meth:`save` blocks until the writer catches up.
+
+    When ``MONGODB_URI`` is set, a :class:`replicator.MongoReplicator` copies
+    committed messages to MongoDB in the background; saving never waits for
+    MongoDB.
+    """
+
+    def __init__(
+        self,
+        path: str = "chat.db",
+        write_behind: bool = False,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_queue: int = 10000,
+    ) -> None:
+        self.path = path
+        # Turns may be saved from worker threads; writes are serialized below.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        migrate(self.conn)
         mongo_uri = os.getenv("MONGODB_URI")
-        if mongo_uri and MongoClient is not None:
+        MongoClient = _mongo_client_class() if mongo_uri else None
+        self.replicator = None
+        if MongoClient is not None:
+            from replicator import MongoReplicator
+
             self.mongo_client = MongoClient(mongo_uri)
             db_name = os.getenv("MONGODB_DB", "chat")
             self.mongo_db = self.mongo_client[db_name]
+            self.replicator = MongoReplicator(path, self.mongo_db.messages).start()
         else:
             self.mongo_client = None
             self.mongo_db = None
 
-    def save(self, agent: str, role: str, content: str) -> None:
-        self.conn.execute(
-            "INSERT INTO messages (agent, role, content) VALUES (?, ?, ?)",
-            (agent, role, content),
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue | None" = None
+        self._writer: "threading.Thread | None" = None
+        self._error: "Exception | None" = None
+        if write_behind:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._writer = threading.Thread(
+                target=self._write_loop, name="storage-writer", daemon=True
+            )
+            self._writer.start()
+        if write_behind or self.replicator is not None:
+            atexit.register(self.close)
+
+    def save(
+        self,
+        agent: str,
+        role: str,
+        content: str,
+        session_id: str = "",
+        prompt: Optional[str] = None,
+    ) -> None:
+        """Store one message; ``prompt`` is what an agent was asked, if not the user message."""
+        with metrics.STORAGE_SAVE_SECONDS.time():
+            row = (session_id, agent, role, content, time.time(), prompt)
+            if self._queue is not None:
+                self._raise_pending_error()
+                self._queue.put(row)
+                return
+            with self._lock:
+                self._write(self.conn, [row])
+
+    def history(
+        self, session_id: str, limit: int = 50, before: Optional[int] = None
+    ) -> List[StoredMessage]:
+        """Return up to ``limit`` messages of ``session_id`` in chronological order.
+
+        Pages are keyed on ``id`` rather than an offset: pass the ``id`` of the
+        first message of a page as ``before`` to get the page preceding it.
+        Queued writes are flushed first.
+        """
+        self.flush()
+        query = (
+            "SELECT id, session_id, agent, role, content, created_at FROM messages "
+            "WHERE session_id = ?"
         )
-        self.conn.commit()
-        if self.mongo_db is not None:
-            self.mongo_db.messages.insert_one(
-                {"agent": agent, "role": role, "content": content}
+        params: list = [session_id]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [StoredMessage(*row) for row in reversed(rows)]
+
+    def search(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        highlight: Tuple[str, str] = ("[", "]"),
+    ) -> List[SearchHit]:
+        """Return messages matching every word of ``query``, best match first.
+
+        Uses the FTS5 index, ranked by BM25.  ``session_id`` restricts the
+        search to one session; page through results with ``offset``.  Matched
+        terms in each snippet are wrapped in ``highlight``.
+        """
+        expression = match_expression(query)
+        if not expression:
+            return []
+        self.flush()
+        sql = (
+            "SELECT m.id, m.session_id, m.agent, m.role, "
+            "snippet(messages_fts, 0, ?, ?, '…', 16), m.created_at, messages_fts.rank "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params: list = [highlight[0], highlight[1], expression]
+        if session_id is not None:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY messages_fts.rank, m.id LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def load_turns(self, session_id: str, turns: int = 10) -> Dict[str, List[Tuple[str, str]]]:
+        """Return the last ``turns`` turns of ``session_id`` grouped by agent.
+
+        Each agent maps to ``(prompt, answer)`` pairs, oldest first, ready to
+        be replayed into its memory.  The prompt is the one saved with the
+        answer, or else the user message of the turn.  Queued writes are
+        flushed first.
+        """
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                """SELECT agent, role, content, prompt FROM messages
+                WHERE session_id = ? AND id >= COALESCE(
+                    (SELECT id FROM messages WHERE session_id = ? AND role = 'user'
+                     ORDER BY id DESC LIMIT 1 OFFSET ?), 0)
+                ORDER BY id""",
+                (session_id, session_id, max(turns, 1) - 1),
+            ).fetchall()
+        grouped: Dict[str, List[Tuple[str, str]]] = {}
+        user_message = None
+        for agent, role, content, prompt in rows:
+            if role == "user":
+                user_message = content
+            elif user_message is not None:
+                grouped.setdefault(agent, []).append((user_message if prompt is None else prompt, content))
+        return grouped
+
+    def flush(self) -> None:
+        """Block until every queued message has been committed."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+        self._raise_pending_error()
+
+    def close(self) -> None:
+        """Flush pending messages, stop the writer and replicator, close the database."""
+        atexit.unregister(self.close)
+        if self._writer is not None:
+            if self._writer.is_alive():
+                self._queue.put(_STOP)
+                self._writer.join()
+            self._writer = None
+        if self.replicator is not None:
+            self.replicator.close()
+            self.replicator = None
+        self.conn.close()
+        self._raise_pending_error()
+
+    def _write(self, conn: sqlite3.Connection, rows: list) -> None:
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, agent, role, content, created_at, prompt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
             )
+        if self.replicator is not None:
+            self.replicator.notify()
 
-def get_storage() -> "Storage | None":
+    def _write_loop(self) -> None:
+        conn = sqlite3.connect(self.path)
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] not in (_FLUSH, _STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item is not _FLUSH and item is not _STOP]
+            running = batch[-1] is not _STOP
+            try:
+                if rows:
+                    with metrics.STORAGE_BATCH_SECONDS.time():
+                        self._write(conn, rows)
+            except Exception as exc:  # surfaced on the next save/flush/close
+                self._error = exc
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            exc, self._error = self._error, None
+            raise RuntimeError(f"Background write to {self.path} failed") from exc
+
+
+def _mongo_client_class():
+    try:
+        from pymongo import MongoClient
+    except Exception:
+        return None
+    return MongoClient
+
+
+_UNSET = object()
+_storage = _UNSET
+_storage_lock = threading.Lock()
+
+
+def storage_from_env() -> "Storage | None":
+    """Build a :class:`Storage` from ``CHAT_PERSIST``/``MONGODB_URI``, or ``None``."""
     if os.getenv("CHAT_PERSIST") or os.getenv("MONGODB_URI"):
         path = os.getenv("CHAT_DB", "chat.db")
-        return Storage(path)
+        return Storage(path, write_behind=bool(os.getenv("CHAT_WRITE_BEHIND")))
     return None
 
-storage = get_storage()
+
+def get_storage() -> "Storage | None":
+    """Return the process-wide storage, opening it on first use.
+
+    ``None`` means persistence is disabled.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is _UNSET:
+            _storage = storage_from_env()
+        return _storage
@@ -6,11 +6,8 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-try:
-    from agent import SimpleAgent
-except ModuleNotFoundError:
-    import pytest
-    pytest.skip("LangChain not available", allow_module_level=True)
+pytest.importorskip("langchain", reason="LangChain not available")
+from agent import SimpleAgent
 
 
 @dataclass
@@ -68,8 +65,10 @@ def test_agent_respond_appends_memory_and_prompt_truncates():
 def test_search_web(monkeypatch):
     from tools import search_web
 
-    def fake_get(url, params, timeout):
+    def fake_get(self, url, params, timeout):
         class R:
+            status_code = 200
+
             def raise_for_status(self):
                 pass
 
@@ -79,7 +78,8 @@ def test_search_web(monkeypatch):
         return R()
 
     monkeypatch.setenv("TAVILY_API_KEY", "x")
-    monkeypatch.setattr("tools.requests.get", fake_get)
+    monkeypatch.setattr("tools.requests.Session.get", fake_get)
+    monkeypatch.setattr("tools._search_client", None)
     result = search_web("test")
     assert "answer" in result
 
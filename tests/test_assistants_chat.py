@@ -0,0 +1,122 @@
+import os
+import sys
+from types import SimpleNamespace as NS
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+try:
+    from assistants_chat import AssistantAgent, RunError, wait_for_run
+except ModuleNotFoundError:
+    pytest.skip("openai not available", allow_module_level=True)
+
+
+def text_message(role, text):
+    return NS(role=role, content=[NS(type="text", text=NS(value=text))])
+
+
+class FakeRuns:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.retrieved = 0
+        self.cancelled = []
+
+    def create(self, thread_id, assistant_id, instructions):
+        self.instructions = instructions
+        return NS(id="run_1", status="queued")
+
+    def retrieve(self, thread_id, run_id):
+        self.retrieved += 1
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return NS(id=run_id, status=status, last_error=None)
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+
+class FakeMessages:
+    def __init__(self):
+        self.created = []
+        self.list_kwargs = None
+
+    def create(self, thread_id, role, content):
+        self.created.append(content)
+
+    def list(self, thread_id, **kwargs):
+        self.list_kwargs = kwargs
+        return NS(data=[text_message("assistant", "newest reply")])
+
+
+class FakeStream:
+    def __init__(self, status):
+        self.status = status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_deltas(self):
+        yield from ["stre", "amed"]
+
+    def until_done(self):
+        pass
+
+    def get_final_run(self):
+        return NS(id="run_2", status=self.status, last_error=None)
+
+    def get_final_messages(self):
+        return [text_message("assistant", "streamed")]
+
+
+def make_client(statuses, stream_status=None):
+    runs = FakeRuns(statuses)
+    if stream_status is not None:
+        runs.stream = lambda **kwargs: FakeStream(stream_status)
+    return NS(beta=NS(threads=NS(runs=runs, messages=FakeMessages())))
+
+
+def test_polling_fetches_only_newest_reply():
+    client = make_client(["queued", "in_progress", "completed"])
+    agent = AssistantAgent(client, "asst", "thread", "Be nice.", stream=False)
+    assert agent.respond("hi") == "newest reply"
+    assert client.beta.threads.runs.retrieved == 3
+    assert client.beta.threads.messages.list_kwargs == {"order": "desc", "limit": 1, "run_id": "run_1"}
+    assert agent.instructions.endswith("Previously you said: newest reply")
+
+
+@pytest.mark.parametrize("status", ["failed", "cancelled", "expired", "requires_action"])
+def test_terminal_statuses_raise(status):
+    client = make_client(["in_progress", status])
+    agent = AssistantAgent(client, "asst", "thread", "Be nice.", stream=False)
+    with pytest.raises(RunError, match=status):
+        agent.respond("hi")
+    assert agent.instructions == "Be nice."
+
+
+def test_backoff_grows_and_deadline_cancels():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    runs = FakeRuns(["in_progress"])
+    with pytest.raises(TimeoutError):
+        wait_for_run(runs, "t", "r", timeout=1.0, clock=lambda: now[0], sleep=sleep)
+    assert sleeps[:4] == [0.05, 0.1, 0.2, 0.4]
+    assert sum(sleeps) == pytest.approx(1.0)
+    assert runs.cancelled == ["r"]
+
+
+def test_streaming_run_delivers_tokens():
+    client = make_client(["completed"], stream_status="completed")
+    agent = AssistantAgent(client, "asst", "thread", "Be nice.")
+    tokens = []
+    assert agent.respond("hi", on_token=tokens.append) == "streamed"
+    assert tokens == ["stre", "amed"]
+    assert client.beta.threads.runs.retrieved == 0
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+pytest.importorskip("langchain", reason="LangChain not available")
+from agent import SimpleAgent
+from batch import completed_ids, parse_record, run_batch
+from fake_llm import FakeChatModel
+from test_agent import SimpleMemory
+
+
+def new_agents(latency=0.0):
+    return [
+        SimpleAgent(
+            name=f"Agent{i}",
+            chat=FakeChatModel(latency=latency),
+            memory=SimpleMemory(),
+            system_prompt=f"You are Agent{i}.",
+        )
+        for i in (1, 2)
+    ]
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_parse_record_accepts_several_shapes():
+    assert parse_record({"id": 1, "prompts": ["a", "b"]}, 1) == ("1", ["a", "b"])
+    assert parse_record({"request_id": "r", "title": "t", "body": "b"}, 2) == ("r", ["b"])
+    assert parse_record({"prompt": "p"}, 3) == ("line-3", ["p"])
+    with pytest.raises(ValueError):
+        parse_record({"id": "x"}, 4)
+
+
+def test_run_batch_writes_results_concurrently(tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(src, [{"id": f"c{i}", "prompts": ["hi", "again"]} for i in range(10)])
+    new_agents()[0].respond("warm up")  # keep LangChain's first import out of the timing
+    start = time.perf_counter()
+    stats = asyncio.run(
+        run_batch(str(src), str(out), lambda: new_agents(latency=0.05), concurrency=10)
+    )
+    elapsed = time.perf_counter() - start
+    assert stats == {"done": 10, "failed": 0, "skipped": 0}
+    # 2 turns x 2 chained agents x 0.05 s; sequential would take 2 s
+    assert elapsed < 1.0
+    records = {r["id"]: r for r in read_jsonl(out)}
+    assert set(records) == {f"c{i}" for i in range(10)}
+    turn = records["c0"]["turns"][1]
+    assert turn["prompt"] == "again"
+    assert turn["replies"]["Agent1"] == "echo: again"
+    assert turn["reply"] == "echo: echo: again"
+
+
+def test_run_batch_resumes_and_retries_failures(tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(src, [{"id": name, "prompt": "hi"} for name in ("a", "b", "c")])
+    out.write_text(
+        json.dumps({"id": "a", "turns": []}) + "\n"
+        + json.dumps({"id": "b", "error": "RateLimitError"}) + "\n"
+        + '{"id": "c", "tur'  # interrupted mid-write
+    )
+    assert completed_ids(str(out)) == {"a"}
+    seen = []
+    stats = asyncio.run(run_batch(str(src), str(out), new_agents, on_done=seen.append))
+    assert stats == {"done": 2, "failed": 0, "skipped": 1}
+    assert sorted(r["id"] for r in seen) == ["b", "c"]
+    assert completed_ids(str(out)) == {"a", "b", "c"}
+    assert len(read_jsonl(out)) == 4
+
+
+def test_run_batch_records_errors(tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(src, [{"id": "x", "prompt": "hi"}])
+
+    def broken():
+        raise RuntimeError("no agents")
+
+    stats = asyncio.run(run_batch(str(src), str(out), broken))
+    assert stats["failed"] == 1
+    assert read_jsonl(out) == [{"id": "x", "error": "RuntimeError: no agents"}]
+
+
+def test_malformed_lines_are_recorded_without_stopping_the_batch(tmp_path):
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    src.write_text(
+        json.dumps({"id": "a", "prompt": "hi"}) + "\n"
+        + "{not json\n"
+        + json.dumps({"id": "empty"}) + "\n"
+        + "[1, 2]\n"
+        + json.dumps({"id": "b", "prompt": "hi"}) + "\n"
+    )
+    stats = asyncio.run(run_batch(str(src), str(out), new_agents))
+    assert stats == {"done": 2, "failed": 3, "skipped": 0}
+    records = {r["id"]: r for r in read_jsonl(out)}
+    assert "turns" in records["a"] and "turns" in records["b"]
+    assert "invalid JSON" in records["line-2"]["error"]
+    assert "expected 'prompts'" in records["empty"]["error"]
+    assert "expected a JSON object" in records["line-4"]["error"]
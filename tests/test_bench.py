@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from fake_llm import FakeChatModel
+import bench
+
+
+class Msg:
+    def __init__(self, content):
+        self.content = content
+
+
+class Collect:
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.append(token)
+
+
+def test_fake_model_streams_at_configured_rate():
+    chat = FakeChatModel(latency=0.02, tokens_per_second=100, reply="a b c d e")
+    handler = Collect()
+    start = time.perf_counter()
+    assert chat([Msg("hi")], callbacks=[handler]).content == "a b c d e"
+    assert time.perf_counter() - start >= 0.02 + 4 * 0.01
+    assert handler.tokens == ["a ", "b ", "c ", "d ", "e"]
+
+
+def test_fake_model_async_and_jitter():
+    chat = FakeChatModel(latency=0.01, jitter=0.5, seed=1)
+    result = asyncio.run(chat.agenerate([[Msg("ping")]]))
+    assert result.generations[0][0].text == "echo: ping"
+    assert chat.calls == 1
+
+
+def test_compare_flags_regressions_in_both_directions():
+    previous = {"storage": {"sync_msgs_per_s": 1000.0}, "pipeline": {"chain_s": 1.0}}
+    current = {"storage": {"sync_msgs_per_s": 500.0}, "pipeline": {"chain_s": 1.1}}
+    regressions = bench.compare(previous, current, threshold=20)
+    assert len(regressions) == 1 and regressions[0].startswith("storage.sync_msgs_per_s")
+
+
+def test_small_benchmarks_run(tmp_path):
+    pytest.importorskip("langchain")
+    results = bench.bench_pipeline(agents=3, latency=0.02)
+    assert results["broadcast_3_agents_s"] < results["chain_3_agents_s"]
+    assert bench.bench_storage(messages=50)["write_behind_msgs_per_s"] > 0
+    assert bench.bench_retrieval(turns=200, repeat=5)["query_200_turns_ms"] > 0
+    footprint = bench.bench_memory(turns=200)
+    assert footprint["compact_bytes_per_turn"] < footprint["buffer_bytes_per_turn"] / 2
+    tail = bench.bench_tail(users=2, turns=22, warmup=20, agents=2)
+    assert tail["deadline_p99_s"] < 0.4
+
+
+def test_startup_benchmark_reports_import_times():
+    results = bench.bench_startup(modules=("prompts",), repeat=1)
+    assert results["prompts_import_ms"] > 0
+    assert results["agent_help_s"] > 0
+
+
+def test_importing_agent_and_server_is_lazy(tmp_path):
+    import subprocess
+
+    code = (
+        "import os, sys; os.environ.pop('OPENAI_API_KEY', None); os.environ['CHAT_PERSIST'] = '1'; "
+        "import agent, server; "
+        "assert 'langchain' not in sys.modules and 'tools' not in sys.modules, sorted(sys.modules); "
+        "assert not os.path.exists('chat.db')"
+    )
+    env = dict(os.environ, PYTHONPATH=bench.ROOT)
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from cache import ResponseCache
+
+
+class Msg:
+    def __init__(self, type, content):
+        self.type = type
+        self.content = content
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_depends_on_model_temperature_and_messages():
+    msgs = [Msg("system", "s"), Msg("human", "hi")]
+    key = ResponseCache.key("m", 0.0, msgs)
+    assert key == ResponseCache.key("m", 0.0, [Msg("system", "s"), Msg("human", "hi")])
+    assert key != ResponseCache.key("m", 0.7, msgs)
+    assert key != ResponseCache.key("other", 0.0, msgs)
+    assert key != ResponseCache.key("m", 0.0, [Msg("ai", "s"), Msg("human", "hi")])
+
+
+def test_lru_eviction_and_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_disk_tier_survives_restart_and_prunes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path, max_disk_entries=2)
+    for key in "abc":
+        cache.put(key, key.upper())
+    fresh = ResponseCache(path)
+    assert fresh.get("a") is None
+    assert fresh.get("c") == "C"
+    assert fresh.disk_hits == 1
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "answer"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert cache.coalesced == 4
+
+
+def test_async_requests_are_coalesced():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_compute("k", compute) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["answer"] * 4
+    assert len(calls) == 1
+
+
+def test_waiters_recompute_when_first_caller_is_cancelled():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute(delay):
+        calls.append(delay)
+        await asyncio.sleep(delay)
+        return "answer"
+
+    async def main():
+        leader = asyncio.ensure_future(cache.aget_or_compute("k", lambda: compute(1.0)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.aget_or_compute("k", lambda: compute(0.01)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "answer"
+        assert await cache.aget_or_compute("k", lambda: compute(5.0)) == "answer"
+
+    asyncio.run(main())
+    assert calls == [1.0, 0.01]
+
+
+def test_async_errors_are_shared_with_waiters():
+    cache = ResponseCache()
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad request")
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.aget_or_compute("k", broken) for _ in range(3)), return_exceptions=True
+        )
+
+    assert [type(result) for result in asyncio.run(main())] == [ValueError] * 3
+    assert cache.coalesced == 2
+
+
+def test_agent_uses_cache_unless_disabled():
+    try:
+        from agent import SimpleAgent
+    except ModuleNotFoundError:
+        pytest.skip("LangChain not available")
+    from test_agent import DummyChat, SimpleMemory
+
+    class CountingChat(DummyChat):
+        calls = 0
+        temperature = 0
+
+        def __call__(self, messages):
+            CountingChat.calls += 1
+            return super().__call__(messages)
+
+    cache = ResponseCache()
+    make = lambda: SimpleAgent("A", CountingChat("r"), SimpleMemory(), "You are A.", cache=cache)
+    make().respond("hi")
+    make().respond("hi")
+    assert CountingChat.calls == 1
+    cache.enabled = False
+    make().respond("hi")
+    assert CountingChat.calls == 2
+
+    cache.enabled = True
+    CountingChat.temperature = 0.7  # sampled answers are never reused
+    make().respond("hi")
+    assert CountingChat.calls == 3
+
+
+def test_coalesced_agents_keep_their_own_deadlines():
+    try:
+        from agent import SimpleAgent
+    except ModuleNotFoundError:
+        pytest.skip("LangChain not available")
+    from deadlines import DeadlineExceeded
+    from fake_llm import FakeChatModel
+    from test_agent import SimpleMemory
+
+    cache = ResponseCache()
+    chat = FakeChatModel(latency=0.1, reply="answer")
+    hasty = SimpleAgent("A", chat, SimpleMemory(), "You are A.", cache=cache, timeout=0.02)
+    patient = SimpleAgent("A", chat, SimpleMemory(), "You are A.", cache=cache, timeout=1.0)
+
+    async def main():
+        return await asyncio.gather(
+            hasty.arespond("hi"), patient.arespond("hi"), return_exceptions=True
+        )
+
+    hasty_result, patient_result = asyncio.run(main())
+    assert isinstance(hasty_result, DeadlineExceeded)
+    assert patient_result == "answer"
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+pytest.importorskip("langchain", reason="LangChain not available")
+from langchain.memory import ConversationBufferMemory
+
+import checkpoint
+from agent import SimpleAgent
+from fake_llm import FakeChatModel
+from memory import CompactMemory, RetrievalMemory, SummaryWindowMemory
+
+
+def make_agents():
+    chat = FakeChatModel(reply="an answer", model_name="gpt-x", temperature=0.3)
+    buffer_agent = SimpleAgent("Agent1", chat, ConversationBufferMemory(), "You are Agent1.")
+    window_agent = SimpleAgent(
+        "Agent2", FakeChatModel(), SummaryWindowMemory(max_tokens=20, summary_tokens=10), "You are Agent2."
+    )
+    for i in range(4):
+        buffer_agent.respond(f"question {i}")
+        window_agent.respond(f"a somewhat longer question number {i}")
+    return [buffer_agent, window_agent]
+
+
+def new_chat(settings):
+    return FakeChatModel(**{k: v for k, v in settings.items() if v is not None})
+
+
+def test_round_trip_restores_prompt_memory_and_settings():
+    agents = make_agents()
+    data = checkpoint.dumps(checkpoint.snapshot({"s1": agents}))
+    restored = checkpoint.restore(checkpoint.loads(data), new_chat)["s1"]
+
+    buffer_agent, window_agent = restored
+    assert buffer_agent.name == "Agent1"
+    assert buffer_agent.chat.model_name == "gpt-x" and buffer_agent.chat.temperature == 0.3
+    assert buffer_agent.system_prompt == agents[0].system_prompt
+    assert list(buffer_agent.prompt.notes) == list(agents[0].prompt.notes)
+    original = agents[0].memory.chat_memory.messages
+    assert [(m.type, m.content) for m in buffer_agent.memory.chat_memory.messages] == [
+        (m.type, m.content) for m in original
+    ]
+
+    assert window_agent.memory.summary == agents[1].memory.summary != ""
+    assert [(m.type, m.content) for m in window_agent.memory.messages] == [
+        (m.type, m.content) for m in agents[1].memory.messages
+    ]
+    assert window_agent.memory._window_tokens == agents[1].memory._window_tokens
+    # restored agents keep working
+    assert buffer_agent.respond("next") == "echo: next"
+
+
+def test_loads_rejects_bad_data():
+    data = checkpoint.dumps({"s": []})
+    with pytest.raises(ValueError, match="not an agent checkpoint"):
+        checkpoint.loads(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="corrupt"):
+        checkpoint.loads(data[:-1] + bytes([data[-1] ^ 1]))
+    with pytest.raises(ValueError, match="newer"):
+        checkpoint.loads(data[:4] + (checkpoint.VERSION + 1).to_bytes(2, "little") + data[6:])
+    with pytest.raises(ValueError, match="truncated"):
+        checkpoint.loads(data[:5])
+
+
+def test_checkpointer_writes_atomically_and_only_on_change(tmp_path):
+    path = tmp_path / "agents.ckpt"
+    assert checkpoint.read_checkpoint(str(path)) == {}
+    agents = make_agents()
+    saver = checkpoint.Checkpointer(str(path), lambda: checkpoint.snapshot({"gui": agents}))
+    assert saver.save() is True
+    assert saver.save() is False
+    agents[0].respond("more")
+    saver.start()
+    saver.stop()
+    assert os.listdir(tmp_path) == ["agents.ckpt"]
+    states = checkpoint.read_checkpoint(str(path))
+    assert states["gui"][0]["memory"]["messages"][-2] == ["human", "more"]
+
+
+def test_retrieval_memory_round_trip_rebuilds_index():
+    agent = SimpleAgent("Agent1", FakeChatModel(), RetrievalMemory(k=1, window_turns=1), "You are Agent1.")
+    for prompt in ["alpha topic", "beta topic", "gamma topic"]:
+        agent.respond(prompt)
+    states = checkpoint.loads(checkpoint.dumps(checkpoint.snapshot({"s": [agent]})))
+    memory = checkpoint.restore(states, new_chat)["s"][0].memory
+    assert isinstance(memory, RetrievalMemory)
+    assert memory.turns == agent.memory.turns
+    assert memory.recall("alpha") == agent.memory.recall("alpha") != []
+
+
+def test_compact_memory_round_trip():
+    agent = SimpleAgent("Agent1", FakeChatModel(), CompactMemory(), "You are Agent1.", timeout=5, hedge=True)
+    agent.respond("hi")
+    restored = checkpoint.restore(
+        checkpoint.loads(checkpoint.dumps(checkpoint.snapshot({"s": [agent]}))), new_chat
+    )["s"][0]
+    assert isinstance(restored.memory, CompactMemory)
+    assert [m.content for m in restored.memory.messages] == ["hi", "echo: hi"]
+    assert restored.timeout == 5 and restored.hedge
+
+
+def test_window_memory_keeps_the_given_summarizer():
+    def summarize(summary, messages, max_tokens):
+        return "custom"
+
+    states = checkpoint.loads(checkpoint.dumps(checkpoint.snapshot({"s": make_agents()})))
+    memory = checkpoint.restore(states, new_chat, summarize=summarize)["s"][1].memory
+    assert memory.summarize is summarize
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+pytest.importorskip("openai")
+pytest.importorskip("langchain")
+
+from langchain.schema import HumanMessage
+
+from clients import ClientPool, request_tokens
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """Chat completions endpoint that answers 429 to the first ``throttle`` requests."""
+
+    throttle = 0
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeOpenAI.requests.append(body)
+        if len(FakeOpenAI.requests) <= FakeOpenAI.throttle:
+            self._reply(429, {"error": {"message": "slow down", "type": "rate_limit"}},
+                        {"retry-after-ms": "50"})
+            return
+        self._reply(200, {
+            "id": "cmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "pong"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        })
+
+    def _reply(self, status, payload, headers=()):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in dict(headers).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    FakeOpenAI.throttle = 0
+    FakeOpenAI.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/v1"
+    httpd.shutdown()
+
+
+def test_request_tokens_counts_prompt_and_max_tokens():
+    params = {"messages": [{"content": "x" * 40}, {"content": None}], "max_tokens": 10}
+    assert request_tokens(params) == 11 + 1 + 10
+
+
+def test_agents_share_clients_and_limiter(endpoint):
+    pool = ClientPool()
+    a = pool.chat_model("gpt-test", "key", base_url=endpoint)
+    b = pool.chat_model("gpt-test", "key", base_url=endpoint)
+    assert a.client.limiter is b.client.limiter
+    assert a([HumanMessage(content="ping")]).content == "pong"
+    assert b([HumanMessage(content="ping")]).content == "pong"
+    assert len(pool._sync) == 1
+    other = pool.chat_model("gpt-other", "key", base_url=endpoint)
+    assert other.client.limiter is not a.client.limiter
+
+
+def test_429_is_retried_after_hint(endpoint):
+    FakeOpenAI.throttle = 2
+    pool = ClientPool(max_retries=3)
+    chat = pool.chat_model("gpt-test", "key", base_url=endpoint)
+    assert chat([HumanMessage(content="ping")]).content == "pong"
+    assert len(FakeOpenAI.requests) == 3
+    assert pool.stats()["gpt-test"]["throttled"] == 2
+    assert pool.stats()["gpt-test"]["waited_s"] >= 0.05
+
+
+def test_429_gives_up_after_max_retries(endpoint):
+    import openai
+
+    FakeOpenAI.throttle = 10
+    chat = ClientPool(max_retries=1).chat_model("gpt-test", "key", base_url=endpoint)
+    with pytest.raises(openai.RateLimitError):
+        chat([HumanMessage(content="ping")])
+    assert len(FakeOpenAI.requests) == 2
+
+
+def test_async_calls_work_across_event_loops(endpoint):
+    FakeOpenAI.throttle = 1
+    pool = ClientPool(rpm=600)
+    chat = pool.chat_model("gpt-test", "key", base_url=endpoint)
+
+    async def ask():
+        result = await chat.agenerate([[HumanMessage(content="ping")]])
+        return result.generations[0][0].text
+
+    # the CLI runs every turn in a fresh loop
+    assert asyncio.run(ask()) == "pong"
+    assert asyncio.run(ask()) == "pong"
+    assert len(FakeOpenAI.requests) == 3
+
+
+def test_loop_clients_are_closed_when_the_loop_ends(endpoint, monkeypatch):
+    import clients
+    from pipeline import run_in_new_loop
+
+    pool = ClientPool()
+    monkeypatch.setattr(clients, "_pool", pool)
+    chat = pool.chat_model("gpt-test", "key", base_url=endpoint)
+    opened = []
+
+    async def ask():
+        result = await chat.agenerate([[HumanMessage(content="ping")]])
+        opened.extend(pool._async[asyncio.get_running_loop()].values())
+        return result.generations[0][0].text
+
+    assert run_in_new_loop(ask()) == "pong"
+    assert opened and all(client.is_closed() for client in opened)
+    assert len(pool._async) == 0
+
+
+def test_configure_keeps_limits_that_are_not_given():
+    pool = ClientPool(rpm=60, tpm=1000)
+    pool.configure(rpm=120)
+    assert (pool.rpm, pool.tpm) == (120, 1000)
+    pool.configure(tpm=2000)
+    assert (pool.rpm, pool.tpm) == (120, 2000)
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from deadlines import DeadlineExceeded, LatencyWindow, earliest, hedged, within
+
+
+def test_earliest_and_latency_window():
+    assert earliest(None, 3, 1.5) == 1.5 and earliest(None, None) is None
+    window = LatencyWindow(size=50, min_samples=10)
+    for i in range(9):
+        window.add(i / 100)
+    assert window.quantile(0.95) is None
+    for i in range(9, 100):
+        window.add(i / 100)
+    assert window.quantile(0.95) == pytest.approx(0.97)
+
+
+def test_within_cancels_call_after_deadline():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(DeadlineExceeded, match="Agent1 did not answer within 0.05 s"):
+            await within(slow(), 0.05, "Agent1")
+        await asyncio.sleep(0)
+        assert await within(asyncio.sleep(0, result="ok"), 1, "Agent1") == "ok"
+
+    asyncio.run(run())
+    assert cancelled == [True]
+
+
+def test_within_passes_through_the_calls_own_timeout_error():
+    async def fails():
+        raise TimeoutError("upstream")
+
+    with pytest.raises(TimeoutError, match="upstream"):
+        asyncio.run(within(fails(), 1, "Agent1"))
+
+
+def test_hedged_request_wins_and_cancels_original():
+    delays = iter([1.0, 0.01])
+    cancelled = []
+
+    async def call():
+        delay = next(delays)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    start = time.perf_counter()
+    assert asyncio.run(hedged(call, 0.05, "Agent1")) == 0.01
+    assert time.perf_counter() - start < 0.5
+    assert cancelled == [1.0]
+
+
+def test_hedged_falls_back_to_the_other_call_on_error():
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) == 2:
+            raise RuntimeError("hedge failed")
+        await asyncio.sleep(0.1)
+        return "original"
+
+    assert asyncio.run(hedged(call, 0.01, "Agent1")) == "original"
+    assert asyncio.run(hedged(lambda: asyncio.sleep(0, result="fast"), 1, "Agent1")) == "fast"
@@ -0,0 +1,166 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+try:
+    from memory import (
+        RECALL_PREFIX,
+        CompactMemory,
+        RetrievalMemory,
+        SummaryWindowMemory,
+        extractive_summary,
+        llm_summarizer,
+    )
+except ModuleNotFoundError:
+    pytest.skip("LangChain not available", allow_module_level=True)
+
+
+def words(n):
+    return " ".join(["word"] * n)
+
+
+def test_window_stays_within_budget_and_summarizes():
+    mem = SummaryWindowMemory(max_tokens=100, summary_tokens=40)
+    for i in range(20):
+        mem.add_user_message(f"question {i} " + words(10))
+        mem.add_ai_message(f"answer {i} " + words(10))
+    msgs = mem.chat_memory.messages
+    assert msgs[0].type == "system" and "Summary" in msgs[0].content
+    assert msgs[-1].content.startswith("answer 19")
+    assert mem._window_tokens <= 60
+    assert len(mem.summary) <= 40 * 4
+
+
+def test_summary_is_updated_incrementally():
+    calls = []
+
+    def summarize(summary, evicted, max_tokens):
+        calls.append((summary, [m.content for m in evicted]))
+        return summary + "|" + ",".join(m.content for m in evicted)
+
+    mem = SummaryWindowMemory(max_tokens=6, summary_tokens=2, summarize=summarize)
+    for i in range(4):
+        mem.add_user_message(f"u{i}")
+        mem.add_ai_message(f"a{i}")
+    assert all(len(evicted) % 2 == 0 for _, evicted in calls)
+    assert calls[1][0] == calls[0][0] + "|" + ",".join(calls[0][1])
+    assert "u0" in mem.summary and "a3" not in mem.summary
+
+
+def test_latest_turn_is_never_evicted():
+    mem = SummaryWindowMemory(max_tokens=4, summary_tokens=1)
+    mem.add_user_message(words(50))
+    mem.add_ai_message(words(50))
+    assert [m.type for m in mem.messages] == ["human", "ai"]
+
+
+def test_extractive_summary_keeps_recent_lines():
+    class Msg:
+        def __init__(self, type, content):
+            self.type, self.content = type, content
+
+    summary = extractive_summary("User: old", [Msg("human", "new"), Msg("ai", "reply")], 7)
+    assert summary.endswith("Assistant: reply")
+    assert "old" not in summary
+
+
+def test_llm_summary_runs_off_the_event_loop():
+    import asyncio
+    import threading
+    import time
+
+    from agent import SimpleAgent
+    from fake_llm import FakeChatModel, FakeMessage
+
+    class SlowSummaryChat:
+        def __call__(self, messages):
+            assert threading.current_thread() is not threading.main_thread()
+            time.sleep(0.2)
+            return FakeMessage("a summary")
+
+    summarize = llm_summarizer(SlowSummaryChat())
+    mem = SummaryWindowMemory(max_tokens=4, summary_tokens=1, summarize=summarize)
+    assert mem.blocking and not SummaryWindowMemory().blocking
+    agent = SimpleAgent("Agent1", FakeChatModel(), mem, "sys")
+    ticks = []
+
+    async def ticker():
+        for _ in range(10):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await agent.arespond(words(10))
+        await asyncio.gather(agent.arespond(words(10)), ticker())
+
+    asyncio.run(main())
+    assert mem.summary == "a summary"
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.15
+
+
+def test_retrieval_memory_keeps_window_and_recalls_older_turns():
+    mem = RetrievalMemory(k=2, window_turns=2)
+    topics = ["postgres vacuum", "kubernetes ingress", "python packaging", "rust lifetimes", "go channels"]
+    for topic in topics:
+        mem.add_user_message(f"tell me about {topic}")
+        mem.add_ai_message(f"{topic} explained")
+    assert [m.content for m in mem.messages] == [
+        "tell me about rust lifetimes", "rust lifetimes explained",
+        "tell me about go channels", "go channels explained",
+    ]
+    recalled = mem.recall("how does postgres vacuum work?")
+    assert len(recalled) == 1 and recalled[0].type == "system"
+    assert recalled[0].content == (
+        RECALL_PREFIX + "User: tell me about postgres vacuum\nAssistant: postgres vacuum explained"
+    )
+    # turns still in the window are not repeated
+    assert mem.recall("rust lifetimes") == []
+
+
+def test_agent_injects_recalled_turns():
+    from agent import SimpleAgent
+    from fake_llm import FakeChatModel
+
+    seen = []
+
+    class RecordingModel(FakeChatModel):
+        def __call__(self, messages, callbacks=None):
+            seen.append([m.content for m in messages])
+            return super().__call__(messages, callbacks)
+
+    agent = SimpleAgent("Agent1", RecordingModel(reply="ok"), RetrievalMemory(k=1, window_turns=1), "sys")
+    for prompt in ["my cat is called Miso", "what is 2+2", "weather today"]:
+        agent.respond(prompt)
+    agent.respond("what is my cat called?")
+    assert seen[-1][:3] == ["sys", "weather today", "ok"]
+    assert seen[-1][3] == RECALL_PREFIX + "User: my cat is called Miso\nAssistant: ok"
+    assert seen[-1][-1] == "what is my cat called?"
+
+
+def test_compact_memory_round_trips_messages():
+    from langchain.schema import SystemMessage
+
+    mem = CompactMemory()
+    mem.add_user_message("héllo wörld ✓")
+    mem.add_ai_message("")
+    mem.add_message(SystemMessage(content="note"))
+    msgs = mem.chat_memory.messages
+    assert [(m.type, m.content) for m in msgs] == [("human", "héllo wörld ✓"), ("ai", ""), ("system", "note")]
+    mem.add_ai_message("more")  # the arena can grow after messages were read
+    assert len(mem) == 4 and mem.messages[-1].content == "more"
+    assert not hasattr(mem, "__dict__")
+    mem.clear()
+    assert mem.messages == []
+
+
+def test_agent_with_compact_memory():
+    from agent import SimpleAgent
+    from fake_llm import FakeChatModel
+
+    agent = SimpleAgent("Agent1", FakeChatModel(), CompactMemory(), "sys")
+    agent.respond("one")
+    assert agent.respond("two") == "echo: two"
+    assert [m.content for m in agent.memory.chat_memory.messages] == ["one", "echo: one", "two", "echo: two"]
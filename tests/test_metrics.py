@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import metrics
+from fake_llm import FakeChatModel
+
+
+def test_histogram_snapshot_and_render():
+    registry = metrics.Registry()
+    hist = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 2.0):
+        hist.observe(value, agent="A")
+    snap = hist.snapshot(agent="A")
+    assert snap["count"] == 4
+    assert snap["sum"] == pytest.approx(2.6)
+    assert snap["p50"] == 0.1
+    assert snap["p95"] == float("inf")
+    assert hist.snapshot(agent="B")["count"] == 0
+    assert registry.histogram("latency_seconds") is hist
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{agent="A",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{agent="A",le="1"} 3' in text
+    assert 'latency_seconds_bucket{agent="A",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{agent="A"} 4' in text
+
+
+def test_counter_and_label_escaping():
+    registry = metrics.Registry()
+    counter = registry.counter("errors_total", "Errors")
+    counter.inc(tool='we"ird')
+    counter.inc(2, tool='we"ird')
+    assert counter.value(tool='we"ird') == 3
+    assert 'errors_total{tool="we\\"ird"} 3' in registry.render()
+
+
+def test_track_tool_counts_errors():
+    with pytest.raises(ValueError):
+        with metrics.track_tool("metrics-test"):
+            raise ValueError("boom")
+    assert metrics.TOOL_ERRORS.value(tool="metrics-test") == 1
+    assert metrics.TOOL_SECONDS.snapshot(tool="metrics-test")["count"] == 1
+
+
+def test_agent_records_latency_tokens_and_first_token():
+    pytest.importorskip("langchain")
+    from test_agent import SimpleMemory
+    from agent import SimpleAgent
+
+    chat = FakeChatModel(reply="one two three")
+    chat.streaming = True
+    agent = SimpleAgent(name="MetricsAgent", chat=chat, memory=SimpleMemory(), system_prompt="sys")
+    agent.respond("hello")
+    asyncio.run(agent.arespond("again"))
+
+    assert metrics.AGENT_SECONDS.snapshot(agent="MetricsAgent")["count"] == 2
+    assert metrics.AGENT_FIRST_TOKEN_SECONDS.snapshot(agent="MetricsAgent")["count"] == 2
+    assert metrics.AGENT_PROMPT_TOKENS.value(agent="MetricsAgent") > 0
+    assert metrics.AGENT_COMPLETION_TOKENS.value(agent="MetricsAgent") == 2 * 4
+
+
+def test_agent_counts_errors():
+    pytest.importorskip("langchain")
+    from test_agent import SimpleMemory
+    from agent import SimpleAgent
+
+    def failing(messages):
+        raise RuntimeError("down")
+
+    agent = SimpleAgent(name="BrokenAgent", chat=failing, memory=SimpleMemory(), system_prompt="sys")
+    with pytest.raises(RuntimeError):
+        agent.respond("hello")
+    assert metrics.AGENT_ERRORS.value(agent="BrokenAgent") == 1
+    assert metrics.AGENT_SECONDS.snapshot(agent="BrokenAgent")["count"] == 1
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+try:
+    from agent import SimpleAgent
+except ModuleNotFoundError:
+    pytest.skip("LangChain not available", allow_module_level=True)
+
+from pipeline import Pipeline, parse_dag
+from test_agent import AIMessage, SimpleMemory
+
+
+class Generation:
+    def __init__(self, text):
+        self.text = text
+
+
+class Result:
+    def __init__(self, text):
+        self.generations = [[Generation(text)]]
+
+
+class SlowChat:
+    """Async chat model that echoes its input after ``delay`` seconds."""
+
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+
+    def __call__(self, messages):
+        time.sleep(self.delay)
+        return AIMessage(f"{self.name}({messages[-1].content})")
+
+    async def agenerate(self, batches):
+        await asyncio.sleep(self.delay)
+        return Result(f"{self.name}({batches[0][-1].content})")
+
+
+def make_agents(n, delay=0.0):
+    return [
+        SimpleAgent(
+            name=f"Agent{i}",
+            chat=SlowChat(f"A{i}", delay),
+            memory=SimpleMemory(),
+            system_prompt=f"You are Agent{i}.",
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def test_chain_passes_answers_along():
+    agents = make_agents(3)
+    results = Pipeline(agents).run("hi")
+    assert [answer for _, answer in results] == ["A1(hi)", "A2(A1(hi))", "A3(A2(A1(hi)))"]
+
+
+def test_inputs_records_each_agents_prompt():
+    inputs = {}
+    asyncio.run(Pipeline(make_agents(2)).arun("hi", inputs=inputs))
+    assert inputs == {"Agent1": "hi", "Agent2": "A1(hi)"}
+
+
+def test_broadcast_runs_concurrently():
+    agents = make_agents(6, delay=0.1)
+    start = time.perf_counter()
+    results = Pipeline(agents, topology="broadcast", concurrency=6).run("hi")
+    elapsed = time.perf_counter() - start
+    assert [answer for _, answer in results] == [f"A{i}(hi)" for i in range(1, 7)]
+    assert elapsed < 0.4
+
+
+def test_concurrency_cap_limits_parallelism():
+    agents = make_agents(4, delay=0.1)
+    start = time.perf_counter()
+    Pipeline(agents, topology="broadcast", concurrency=2).run("hi")
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_dag_combines_parent_answers():
+    agents = make_agents(3)
+    dag = parse_dag("Agent1->Agent3, Agent2->Agent3")
+    seen = []
+    results = Pipeline(agents, topology="dag", dag=dag).run(
+        "q", on_result=lambda agent, answer: seen.append(agent.name)
+    )
+    assert results[2][1] == "A3(Agent1: A1(q)\n\nAgent2: A2(q))"
+    assert seen[-1] == "Agent3"
+
+
+def test_async_on_result_is_awaited_before_dependents_start():
+    agents = make_agents(2)
+    seen = []
+
+    async def on_result(agent, answer):
+        await asyncio.sleep(0.01)
+        seen.append(agent.name)
+
+    Pipeline(agents).run(
+        "hi", on_start=lambda agent: seen.append("start " + agent.name), on_result=on_result
+    )
+    assert seen == ["start Agent1", "Agent1", "start Agent2", "Agent2"]
+
+
+def test_dag_rejects_cycles_and_unknown_agents():
+    with pytest.raises(ValueError):
+        parse_dag("Agent1->Agent2,Agent2->Agent1")
+    pipeline = Pipeline(make_agents(1), topology="dag", dag=parse_dag("Agent1->Agent9"))
+    with pytest.raises(ValueError):
+        pipeline.run("hi")
+
+
+def test_sync_chat_falls_back_to_thread():
+    class SyncChat:
+        def __call__(self, messages):
+            return AIMessage("sync")
+
+    agent = SimpleAgent("Agent1", SyncChat(), SimpleMemory(), "You are Agent1.")
+    assert Pipeline([agent]).run("hi") == [(agent, "sync")]
+
+
+def test_agent_missing_its_deadline_is_skipped_in_chain():
+    agents = make_agents(3)
+    agents[1].chat = SlowChat("A2", delay=1.0)
+    agents[1].timeout = 0.05
+    skipped = []
+    results = Pipeline(agents).run("hi", on_skip=lambda agent, exc: skipped.append(agent.name))
+    assert skipped == ["Agent2"]
+    # Agent3 answers what Agent2 was asked
+    assert [(agent.name, answer) for agent, answer in results] == [
+        ("Agent1", "A1(hi)"), ("Agent3", "A3(A1(hi))")
+    ]
+    assert agents[1].memory.chat_memory.messages == []
+
+
+def test_turn_deadline_skips_agents_that_cannot_finish():
+    agents = make_agents(3, delay=0.1)
+    start = time.perf_counter()
+    skipped = []
+    results = Pipeline(agents, turn_timeout=0.15).run(
+        "hi", on_skip=lambda agent, exc: skipped.append(agent.name)
+    )
+    assert time.perf_counter() - start < 0.3
+    assert [agent.name for agent, _ in results] == ["Agent1"]
+    assert skipped == ["Agent2", "Agent3"]
+
+
+def test_agents_past_the_turn_deadline_count_as_misses():
+    import metrics
+
+    agents = make_agents(2, delay=0.1)
+    before = metrics.AGENT_DEADLINE_MISSES.value(agent="Agent2")
+    results = Pipeline(agents, turn_timeout=0.1, agent_timeout=1.0).run("hi")
+    assert results == []
+    assert metrics.AGENT_DEADLINE_MISSES.value(agent="Agent2") == before + 1
+
+
+def test_agent_whose_routes_all_time_out_is_skipped():
+    from router import ModelRouter, Route
+
+    agents = make_agents(2)
+    agents[0].chat = ModelRouter([Route("slow", SlowChat("A1", delay=1.0))], timeout=0.05)
+    skipped = []
+    results = Pipeline(agents).run("hi", on_skip=lambda agent, exc: skipped.append(agent.name))
+    assert skipped == ["Agent1"]
+    assert [(agent.name, answer) for agent, answer in results] == [("Agent2", "A2(hi)")]
+
+
+def test_other_errors_still_fail_the_turn():
+    class Broken(SlowChat):
+        async def agenerate(self, batches):
+            raise RuntimeError("boom")
+
+    agents = make_agents(2)
+    agents[0].chat = Broken("A1")
+    with pytest.raises(RuntimeError, match="boom"):
+        Pipeline(agents, agent_timeout=1).run("hi")
+
+
+def test_hedging_cuts_tail_latency():
+    from fake_llm import FakeChatModel
+
+    agent = make_agents(1)[0]
+    agent.chat = FakeChatModel(latency=0.005, reply="ok")
+    agent.hedge = True
+    for _ in range(20):  # build a latency history
+        agent.respond("warm up")
+    agent.chat.tail_probability, agent.chat.tail_latency = 1.0, 1.0
+    calls = agent.chat.calls
+
+    async def slow_then_fast():
+        # The original call hits the slow tail, the hedge does not.
+        task = asyncio.ensure_future(agent.arespond("hi"))
+        await asyncio.sleep(0.001)
+        agent.chat.tail_probability = 0.0
+        return await task
+
+    start = time.perf_counter()
+    assert asyncio.run(slow_then_fast()) == "ok"
+    assert time.perf_counter() - start < 0.5
+    assert agent.chat.calls == calls + 2
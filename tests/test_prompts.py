@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from prompts import EvolvingPrompt
+
+
+def test_prefix_is_stable_across_turns():
+    prompt = EvolvingPrompt("You are Agent1, a helpful assistant.", max_notes=3)
+    rendered = []
+    for i in range(10):
+        prompt.add_note(f"answer number {i} " + "blah " * 100)
+        rendered.append(prompt.render())
+    assert all(text.startswith("You are Agent1, a helpful assistant.\n") for text in rendered)
+    assert len(prompt.notes) == 3
+    assert rendered[-1].endswith(" ...")
+    assert "answer number 9" in rendered[-1] and "answer number 6" not in rendered[-1]
+
+
+def test_notes_respect_token_budget_but_prefix_is_kept():
+    prefix = "x" * 1995
+    prompt = EvolvingPrompt(prefix, max_tokens=500)
+    prompt.add_note("response")
+    assert prompt.render() == prefix
+
+    prompt = EvolvingPrompt("You are A.", max_tokens=30, note_chars=40)
+    for i in range(5):
+        prompt.add_note(f"reply {i} with several words in it")
+    notes = prompt.render().splitlines()[1:]
+    assert notes and notes[-1].startswith("Previously you said: reply 4")
+    assert len(notes) < 5
+
+
+def test_assistant_agent_uses_structured_prompt():
+    from assistants_chat import AssistantAgent
+
+    agent = AssistantAgent(client=None, assistant_id="a", thread_id="t", instructions="Be nice.")
+    agent.prompt.add_note("hello")
+    assert agent.prompt.render() == "Be nice.\nPreviously you said: hello"
+
+
+def test_agent_requests_extend_the_previous_request():
+    pytest.importorskip("langchain", reason="LangChain not available")
+    from langchain.memory import ConversationBufferMemory
+
+    from agent import SimpleAgent
+    from fake_llm import FakeChatModel
+
+    seen = []
+
+    class RecordingModel(FakeChatModel):
+        def __call__(self, messages, callbacks=None):
+            seen.append([m.content for m in messages])
+            return super().__call__(messages, callbacks)
+
+    agent = SimpleAgent("Agent1", RecordingModel(reply="ok"), ConversationBufferMemory(), "Be nice.")
+    for prompt in ["one", "two", "three"]:
+        agent.respond(prompt)
+    # Only the notes and the new prompt follow the history, so each request
+    # starts with everything the previous one sent before its notes.
+    assert seen[2][:5] == seen[1][:3] + ["two", "ok"]
+    assert seen[2][0] == "Be nice."
+    assert seen[2][-2].startswith("Previously you said: ")
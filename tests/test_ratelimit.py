@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from ratelimit import RateLimiter, parse_duration, retry_after_from_headers
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_queue_in_order_once_budget_is_spent():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, clock=clock)  # one request per second
+    waits = [limiter.reserve() for _ in range(63)]
+    assert waits[:60] == [0.0] * 60
+    assert waits[60:] == pytest.approx([1.0, 2.0, 3.0])
+    clock.now += 10
+    assert limiter.reserve() == pytest.approx(0.0)
+
+
+def test_token_budget_and_settle():
+    clock = FakeClock()
+    limiter = RateLimiter(tpm=600, clock=clock)  # ten tokens per second
+    assert limiter.reserve(500) == 0.0
+    assert limiter.reserve(200) == pytest.approx(10.0)
+    # the first request only used 100 tokens: 400 go back to the bucket
+    limiter.settle(500, 100)
+    assert limiter.reserve(100) == pytest.approx(0.0)
+    # an oversized request needs a full bucket rather than waiting forever
+    limiter = RateLimiter(tpm=600, clock=clock)
+    assert limiter.reserve(10_000) == 0.0
+    assert limiter.reserve(600) == pytest.approx(60.0)
+
+
+def test_penalize_pauses_everyone_and_backs_off():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, base_backoff=1.0, max_backoff=8.0)
+    assert limiter.penalize(2.5) == 2.5
+    assert limiter.reserve() == pytest.approx(2.5)
+    first = limiter.penalize()
+    second = limiter.penalize()
+    assert 1.0 <= first <= 2.0 and 2.0 <= second <= 4.0
+    assert limiter.penalize(120) == 8.0
+    limiter.success()
+    assert limiter.penalize() <= 1.0
+    assert limiter.stats()["throttled"] == 5
+
+
+def test_retry_hints():
+    assert retry_after_from_headers({"Retry-After-Ms": "250"}) == 0.25
+    assert retry_after_from_headers({"retry-after": "3"}) == 3.0
+    assert retry_after_from_headers(
+        {"x-ratelimit-reset-requests": "1.5s", "x-ratelimit-reset-tokens": "6m0s"}
+    ) == 360.0
+    assert retry_after_from_headers({"retry-after": "soon"}) is None
+    assert retry_after_from_headers({}) is None
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1h2m") == 3720.0
+    assert parse_duration("fast") is None
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import metrics
+from replicator import MongoReplicator
+from storage import Storage
+
+
+class FakeCollection:
+    """In-process stand-in for a pymongo collection."""
+
+    def __init__(self, failures=0):
+        self.docs = {}
+        self.failures = failures
+        self.calls = 0
+
+    def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo is down")
+        duplicates = [
+            {"index": i, "code": 11000} for i, doc in enumerate(documents) if doc["_id"] in self.docs
+        ]
+        for doc in documents:
+            self.docs.setdefault(doc["_id"], dict(doc))
+        if duplicates:
+            error = Exception("duplicate key")
+            error.details = {"writeErrors": duplicates}
+            raise error
+
+
+def _fill(path, count, start=0):
+    store = Storage(path)
+    for i in range(start, start + count):
+        store.save("Agent1", "user", f"msg {i}", session_id="s1")
+    store.close()
+
+
+def test_replicator_batches_and_resumes_from_cursor(tmp_path):
+    db = str(tmp_path / "chat.db")
+    _fill(db, 5)
+    target = FakeCollection()
+    replicator = MongoReplicator(db, target, batch_size=2)
+    assert replicator.lag()[0] == 5
+    assert replicator.drain() == 5
+    assert target.calls == 3
+    assert [doc["content"] for _, doc in sorted(target.docs.items())] == [f"msg {i}" for i in range(5)]
+    assert replicator.lag() == (0, 0.0)
+    replicator.close()
+
+    _fill(db, 3, start=5)
+    replicator = MongoReplicator(db, target, batch_size=10)
+    assert replicator.cursor == 5
+    assert replicator.drain() == 3
+    assert len(target.docs) == 8
+    replicator.close()
+
+
+def test_replicator_keeps_rows_pending_while_mongo_fails(tmp_path):
+    db = str(tmp_path / "chat.db")
+    _fill(db, 3)
+    target = FakeCollection(failures=1)
+    replicator = MongoReplicator(db, target)
+    try:
+        replicator.sync_once()
+    except ConnectionError:
+        pass
+    assert replicator.cursor == 0
+    assert replicator.lag()[0] == 3
+    assert replicator.sync_once() == 3
+    assert metrics.MONGO_REPLICATION_PENDING.value() == 0
+    replicator.close()
+
+
+def test_replicator_skips_documents_already_in_mongo(tmp_path):
+    db = str(tmp_path / "chat.db")
+    _fill(db, 3)
+    target = FakeCollection()
+    target.docs[1] = {"_id": 1, "content": "msg 0"}
+    replicator = MongoReplicator(db, target)
+    assert replicator.sync_once() == 3
+    assert sorted(target.docs) == [1, 2, 3]
+    assert replicator.cursor == 3
+    replicator.close()
+
+
+def test_storage_save_does_not_wait_for_mongo(tmp_path, monkeypatch):
+    import storage
+
+    class SlowCollection(FakeCollection):
+        def insert_many(self, documents, ordered=True):
+            time.sleep(0.5)
+            super().insert_many(documents, ordered)
+
+    target = SlowCollection(failures=1)
+
+    class FakeClient(dict):
+        def __init__(self, uri):
+            super().__init__(chat=type("DB", (), {"messages": target})())
+
+    monkeypatch.setenv("MONGODB_URI", "mongodb://fake")
+    monkeypatch.setattr(storage, "_mongo_client_class", lambda: FakeClient)
+    store = Storage(str(tmp_path / "chat.db"))
+    store.replicator.base_backoff = 0.01
+    start = time.perf_counter()
+    for i in range(5):
+        store.save("Agent1", "user", f"msg {i}")
+    assert time.perf_counter() - start < 0.5
+    store.close()
+    assert sorted(doc["content"] for doc in target.docs.values()) == [f"msg {i}" for i in range(5)]
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+np = pytest.importorskip("numpy", reason="NumPy not available")
+from retrieval import BM25Index, tokenize
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Deploy the API, then re-run!") == ["deploy", "the", "api", "then", "re", "run"]
+
+
+def test_bm25_ranks_rare_and_repeated_terms_higher():
+    index = BM25Index()
+    docs = [
+        "the cat sat on the mat",
+        "the dog chased the cat",
+        "postgres vacuum settings for the dog shelter database",
+        "the the the the",
+    ]
+    for doc in docs:
+        index.add(doc)
+    assert [doc for doc, _ in index.search("postgres database")] == [2]
+    hits = index.search("cat dog")
+    assert hits[0][0] == 1 and {doc for doc, _ in hits} == {0, 1, 2}
+    assert hits == sorted(hits, key=lambda hit: -hit[1])
+    assert index.search("unknown words") == []
+    assert index.search("cat", k=0) == []
+
+
+def test_bm25_limit_excludes_newer_documents():
+    index = BM25Index()
+    for i in range(10):
+        index.add(f"topic{i % 3} note {i}")
+    assert {doc for doc, _ in index.search("topic1", k=10)} == {1, 4, 7}
+    assert {doc for doc, _ in index.search("topic1", k=10, limit=5)} == {1, 4}
+    assert index.search("topic1", limit=0) == []
+
+
+def test_bm25_query_over_100k_documents_is_fast():
+    rng = np.random.default_rng(0)
+    vocab = np.array([f"w{i}" for i in range(20000)])
+    index = BM25Index()
+    for words in rng.zipf(1.3, size=(100_000, 20)) % len(vocab):
+        index.add(" ".join(vocab[words]))
+    assert len(index) == 100_000
+    index.search("w5 w77 w901")  # warm up
+    start = time.perf_counter()
+    for _ in range(20):
+        index.search("w5 w77 w901 w1234", k=5)
+    assert (time.perf_counter() - start) / 20 < 0.05
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from fake_llm import FakeChatModel
+from router import ModelHealth, ModelRouter, Route, is_route_spec, parse_routes
+
+
+class Msg:
+    def __init__(self, content):
+        self.content = content
+        self.type = "human"
+
+
+class FailingModel(FakeChatModel):
+    def __call__(self, messages, callbacks=None):
+        self.calls += 1
+        raise RuntimeError("model unavailable")
+
+    async def agenerate(self, batches, callbacks=None):
+        self.calls += 1
+        raise RuntimeError("model unavailable")
+
+
+def answer_of(result):
+    return result.generations[0][0].text
+
+
+def test_parse_routes():
+    assert parse_routes("small:500, large") == [("small", 500), ("large", None)]
+    assert is_route_spec("a,b") and is_route_spec("a:10") and not is_route_spec("gpt-4o")
+    with pytest.raises(ValueError):
+        parse_routes("a,,b")
+
+
+def test_short_prompts_use_small_model_and_long_prompts_skip_it():
+    small, large = FakeChatModel(reply="small"), FakeChatModel(reply="large")
+    router = ModelRouter([Route("small", small, max_prompt_tokens=50), Route("large", large)])
+    assert router([Msg("hi")]).content == "small"
+    assert router([Msg("word " * 400)]).content == "large"
+    assert router.model_name == "small:50,large"
+
+
+def test_prefers_model_with_lower_moving_latency():
+    slow = FakeChatModel(latency=0.05, reply="slow")
+    fast = FakeChatModel(latency=0.005, reply="fast")
+    router = ModelRouter([Route("slow", slow), Route("fast", fast)])
+
+    async def run():
+        return [answer_of(await router.agenerate([[Msg("q")]])) for _ in range(6)]
+
+    answers = asyncio.run(run())
+    # each unmeasured model is probed once, then the fast one wins
+    assert answers[:2] == ["slow", "fast"]
+    assert answers[2:] == ["fast"] * 4
+    assert router.stats()["slow"]["calls"] == 1
+
+
+def test_fails_over_on_error_and_demotes_erroring_model():
+    broken, backup = FailingModel(), FakeChatModel(reply="backup")
+    router = ModelRouter([Route("broken", broken), Route("backup", backup)])
+    assert router([Msg("q")]).content == "backup"
+    assert router.stats()["broken"]["error_rate"] == 1.0
+    assert router([Msg("q")]).content == "backup"
+    assert broken.calls == 1  # unhealthy, so tried after the healthy model
+
+    only_broken = ModelRouter([Route("broken", FailingModel())])
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        only_broken([Msg("q")])
+
+
+def test_fails_over_on_timeout():
+    hung = FakeChatModel(latency=2.0, reply="late")
+    backup = FakeChatModel(reply="backup")
+    router = ModelRouter([Route("hung", hung), Route("backup", backup)], timeout=0.1)
+
+    start = time.perf_counter()
+    assert answer_of(asyncio.run(router.agenerate([[Msg("q")]]))) == "backup"
+    assert router([Msg("q")]).content == "backup"
+    assert time.perf_counter() - start < 1.0
+    assert router.stats()["hung"]["error_rate"] == 1.0
+
+
+def test_health_forgets_old_calls():
+    now = [0.0]
+    health = ModelHealth(window=3, max_age=10, clock=lambda: now[0])
+    health.record(1.0, False)
+    now[0] = 5
+    health.record(0.2, True)
+    assert health.error_rate() == 0.5 and health.latency() == 0.2
+    now[0] = 12
+    assert health.error_rate() == 0.0 and health.calls() == 1
+    now[0] = 20
+    assert health.latency() is None
+
+
+def test_agent_uses_router():
+    pytest.importorskip("langchain", reason="LangChain not available")
+    from langchain.memory import ConversationBufferMemory
+
+    from agent import SimpleAgent
+
+    router = ModelRouter([Route("broken", FailingModel()), Route("ok", FakeChatModel(reply="fine"))])
+    agent = SimpleAgent("Agent1", router, ConversationBufferMemory(), "sys")
+    assert agent.respond("hello") == "fine"
+    assert asyncio.run(agent.arespond("again")) == "fine"
+
+
+def test_temperature_comes_from_the_routes():
+    same = ModelRouter([Route("a", FakeChatModel(temperature=0)), Route("b", FakeChatModel(temperature=0))])
+    assert same.temperature == 0
+    mixed = ModelRouter([Route("a", FakeChatModel(temperature=0)), Route("b", FakeChatModel(temperature=0.7))])
+    assert mixed.temperature is None
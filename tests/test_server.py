@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+try:
+    import langchain  # noqa: F401
+    import server
+    from agent import SimpleAgent
+except ModuleNotFoundError:
+    pytest.skip("Flask or LangChain not available", allow_module_level=True)
+
+from test_agent import SimpleMemory
+from test_pipeline import Result
+
+
+class StreamingChat:
+    """Fake chat model that streams its reply word by word."""
+
+    def __init__(self, reply):
+        self.reply = reply
+
+    async def agenerate(self, batches, callbacks=None):
+        for word in self.reply.split():
+            await asyncio.sleep(0)
+            for handler in callbacks or []:
+                await handler.on_llm_new_token(word + " ")
+        return Result(self.reply)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def new_agents():
+        return [
+            SimpleAgent("Agent1", StreamingChat("hello there"), SimpleMemory(), "You are Agent1."),
+            SimpleAgent("Agent2", StreamingChat("general kenobi"), SimpleMemory(), "You are Agent2."),
+        ]
+
+    monkeypatch.setattr(server.sessions, "factory", new_agents)
+    monkeypatch.setattr(server, "get_storage", lambda: None)
+    return server.app.test_client()
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_emits_tokens(client):
+    resp = client.post("/chat/stream", json={"message": "hi", "session_id": "s1"})
+    assert resp.mimetype == "text/event-stream"
+    events = parse_events(resp.get_data(as_text=True))
+    assert events[0] == ("session", {"session_id": "s1"})
+    tokens = [data["token"] for name, data in events if name == "token" and data["agent"] == "Agent1"]
+    assert tokens == ["hello ", "there "]
+    assert events[-1][0] == "done"
+    assert events[-1][1]["reply"] == "general kenobi"
+
+
+def test_sessions_keep_separate_memory(client):
+    client.post("/chat", json={"message": "one", "session_id": "a"})
+    client.post("/chat", json={"message": "two", "session_id": "b"})
+    reply = client.post("/chat", json={"message": "three", "session_id": "a"}).get_json()
+    assert reply["session_id"] == "a"
+    agents = server.sessions.get("a").agents
+    assert [m.content for m in agents[0].memory.chat_memory.messages[::2]] == ["one", "three"]
+
+
+def test_metrics_endpoint(client):
+    client.post("/chat", json={"message": "hi", "session_id": "m"})
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    assert "agent_response_seconds_count" in resp.get_data(as_text=True)
+
+
+def test_history_and_resume_after_restart(client, monkeypatch, tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"))
+    monkeypatch.setattr(server, "get_storage", lambda: store)
+    client.post("/chat", json={"message": "one", "session_id": "r"})
+    page = client.get("/history?session_id=r&limit=2").get_json()
+    assert [m["content"] for m in page["messages"]] == ["hello there", "general kenobi"]
+    older = client.get(f"/history?session_id=r&limit=2&before={page['next_before']}").get_json()
+    assert [m["role"] for m in older["messages"]] == ["user"]
+
+    server.sessions.drop("r")  # as if the server restarted
+    client.post("/chat", json={"message": "two", "session_id": "r"})
+    agents = server.sessions.get("r").agents
+    assert [m.content for m in agents[0].memory.chat_memory.messages] == [
+        "one", "hello there", "two", "hello there"
+    ]
+    # in the chain Agent2 was asked Agent1's reply, not the user message
+    assert [m.content for m in agents[1].memory.chat_memory.messages][:2] == [
+        "hello there", "general kenobi"
+    ]
+
+    hits = client.get("/search?q=kenobi&limit=1").get_json()
+    assert hits["results"][0]["snippet"] == "general [kenobi]"
+    assert hits["next_offset"] == 1
+    assert client.get("/search?q=kenobi&session_id=other").get_json()["results"] == []
+    assert client.get("/search").status_code == 400
+
+
+def test_sessions_survive_restart_via_checkpoint(client, monkeypatch, tmp_path):
+    monkeypatch.setattr("atexit.register", lambda func: func)
+    path = str(tmp_path / "sessions.ckpt")
+    client.post("/chat", json={"message": "one", "session_id": "ck"})
+    server.start_checkpointing(path, interval=3600).stop()
+
+    server.sessions.drop("ck")
+    server.start_checkpointing(path, interval=3600).stop()
+    agents = server.sessions.get("ck").agents
+    assert [m.content for m in agents[0].memory.chat_memory.messages] == ["one", "hello there"]
+    assert agents[0].prompt.notes[-1] == "Previously you said: hello there"
+
+
+def test_checkpoint_snapshot_waits_for_a_running_turn(client):
+    client.post("/chat", json={"message": "one", "session_id": "busy"})
+    session = server.sessions.get("busy")
+
+    async def collect_during_turn():
+        await session.lock.acquire()
+        collect = asyncio.ensure_future(server._collect_sessions())
+        await asyncio.sleep(0.01)
+        assert not collect.done()
+        session.lock.release()
+        return await collect
+
+    loop = server.get_loop()
+    states = asyncio.run_coroutine_threadsafe(collect_during_turn(), loop).result()
+    assert "busy" in states
+
+
+def test_shared_state_keeps_one_conversation_across_workers(client, monkeypatch):
+    from state_store import MemoryStateStore
+
+    store = MemoryStateStore()
+    monkeypatch.setattr(server, "get_state_store", lambda: store)
+    monkeypatch.setattr(server, "new_chat", lambda settings=None: StreamingChat("restored"))
+    client.post("/chat", json={"message": "one", "session_id": "w"})
+    server.sessions.drop("w")  # the next request lands on another worker
+    client.post("/chat", json={"message": "two", "session_id": "w"})
+    assert store.version("w") == 2
+
+    # a third worker commits while this one's turn is running
+    session = server.sessions.get("w")
+    original = server.Pipeline.arun
+
+    async def racing_arun(self, prompt, **kwargs):
+        other = server.sessions.factory()
+        for agent in other:
+            agent.restore([("one", "x"), ("two", "x"), ("elsewhere", "x")])
+        store.save("w", server._encode_agents(other), store.version("w"))
+        return await original(self, prompt, **kwargs)
+
+    monkeypatch.setattr(server.Pipeline, "arun", racing_arun)
+    client.post("/chat", json={"message": "three", "session_id": "w"})
+    assert store.version("w") == 4
+    server._load_state(session, store, force=True)
+    prompts = [m.content for m in session.agents[0].memory.chat_memory.messages[::2]]
+    assert prompts == ["one", "two", "elsewhere", "three"]
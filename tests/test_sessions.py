@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sessions import SessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_created_lazily_and_reused():
+    created = []
+    manager = SessionManager(lambda: created.append(1) or ["agent"])
+    first = manager.get("abc")
+    assert manager.get("abc") is first
+    assert len(created) == 1
+    assert manager.get().session_id != "abc"
+
+
+def test_idle_sessions_are_evicted():
+    clock = FakeClock()
+    manager = SessionManager(list, idle_timeout=10, clock=clock)
+    manager.get("old")
+    clock.now = 5
+    manager.get("recent")
+    clock.now = 12
+    manager.get("new")
+    assert "old" not in manager
+    assert "recent" in manager and "new" in manager
+
+
+def test_max_sessions_evicts_least_recently_used():
+    manager = SessionManager(list, max_sessions=2)
+    manager.get("a")
+    manager.get("b")
+    manager.get("a")
+    manager.get("c")
+    assert "b" not in manager
+    assert len(manager) == 2
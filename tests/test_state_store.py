@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from state_store import MemoryStateStore, SQLiteStateStore, StateConflict, StateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+def test_compare_and_swap(store):
+    assert store.load("s") is None and store.version("s") == 0
+    assert store.save("s", b"one", 0) == 1
+    with pytest.raises(StateConflict):
+        store.save("s", b"stale", 0)
+    assert store.save("s", b"two", 1) == 2
+    with pytest.raises(StateConflict):
+        store.save("s", b"stale", 1)
+    assert store.load("s") == (2, b"two")
+    store.delete("s")
+    assert store.version("s") == 0
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    worker_a, worker_b = SQLiteStateStore(path), SQLiteStateStore(path)
+    worker_a.save("s", b"from a", 0)
+    assert worker_b.load("s") == (1, b"from a")
+    worker_b.save("s", b"from b", 1)
+    with pytest.raises(StateConflict):
+        worker_a.save("s", b"lost update", 1)
+    assert worker_a.load("s").data == b"from b"
+
+
+def test_store_interface_is_abstract():
+    class NoDelete(StateStore):
+        def load(self, session_id):
+            return None
+
+        def save(self, session_id, data, expected_version):
+            return 1
+
+    with pytest.raises(TypeError):
+        NoDelete()
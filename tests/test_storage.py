@@ -7,3 +7,148 @@ def test_storage_sqlite(tmp_path):
     rows = list(store.conn.execute("SELECT agent, role, content FROM messages"))
     assert rows == [("Agent1", "user", "hello")]
 
+
+
+def test_storage_uses_wal(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"))
+    mode = store.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+
+def test_storage_write_behind_flush(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"), write_behind=True, batch_size=50, flush_interval=10)
+    for i in range(120):
+        store.save("Agent1", "assistant", f"msg {i}")
+    store.flush()
+    rows = list(store.conn.execute("SELECT content FROM messages"))
+    assert rows == [(f"msg {i}",) for i in range(120)]
+    store.close()
+
+
+def test_history_sees_queued_writes(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"), write_behind=True, flush_interval=10)
+    store.save("user", "user", "hi", "s1")
+    assert [m.content for m in store.history("s1")] == ["hi"]
+    store.close()
+
+
+def test_storage_write_behind_close_flushes(tmp_path):
+    import sqlite3
+
+    from storage import Storage
+
+    db = tmp_path / "chat.db"
+    store = Storage(str(db), write_behind=True, max_queue=4, flush_interval=10)
+    for i in range(10):
+        store.save("Agent1", "user", str(i))
+    store.close()
+    count = sqlite3.connect(str(db)).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    assert count == 10
+
+
+def test_storage_migrates_legacy_table(tmp_path):
+    import sqlite3
+
+    from storage import SCHEMA_VERSION, Storage
+
+    db = tmp_path / "chat.db"
+    legacy = sqlite3.connect(str(db))
+    legacy.execute("CREATE TABLE messages (agent TEXT, role TEXT, content TEXT)")
+    legacy.executemany(
+        "INSERT INTO messages VALUES (?, ?, ?)", [("user", "user", "hi"), ("Agent1", "assistant", "yo")]
+    )
+    legacy.commit()
+    legacy.close()
+
+    store = Storage(str(db))
+    assert store.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    indexes = store.conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'"
+    ).fetchall()
+    assert indexes == [("messages_session",)]
+    rows = list(store.conn.execute("SELECT id, session_id, agent, content FROM messages ORDER BY id"))
+    assert rows == [(1, "", "user", "hi"), (2, "", "Agent1", "yo")]
+    # rows from before the upgrade were already mirrored inline
+    cursor = store.conn.execute("SELECT last_id FROM replication_cursors WHERE name = 'mongo'")
+    assert cursor.fetchone()[0] == 2
+    store.save("Agent1", "user", "later", "s1")
+    assert store.history("s1")[0].id == 3
+    store.close()
+    # reopening an up-to-date database is a no-op
+    reopened = Storage(str(db))
+    assert reopened.history("")[-1].content == "yo"
+    # legacy rows are backfilled into the full-text index
+    assert [hit.snippet for hit in reopened.search("yo")] == ["[yo]"]
+
+
+def test_history_keyset_pagination(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"))
+    for i in range(5):
+        store.save("Agent1", "assistant", f"a{i}", "s1")
+        store.save("Agent1", "assistant", f"b{i}", "s2")
+    page = store.history("s1", limit=2)
+    assert [msg.content for msg in page] == ["a3", "a4"]
+    assert page[0].created_at is not None
+    older = store.history("s1", limit=2, before=page[0].id)
+    assert [msg.content for msg in older] == ["a1", "a2"]
+    assert [msg.content for msg in store.history("s1", limit=2, before=older[0].id)] == ["a0"]
+
+
+def test_load_turns_groups_last_turns_by_agent(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"), write_behind=True, flush_interval=10)
+    for i in range(3):
+        store.save("user", "user", f"q{i}", "s1")
+        store.save("Agent1", "assistant", f"a{i}", "s1")
+        store.save("Agent2", "assistant", f"b{i}", "s1")
+    store.save("user", "user", "other", "s2")
+    turns = store.load_turns("s1", turns=2)
+    assert turns == {
+        "Agent1": [("q1", "a1"), ("q2", "a2")],
+        "Agent2": [("q1", "b1"), ("q2", "b2")],
+    }
+    assert len(store.load_turns("s1", turns=10)["Agent1"]) == 3
+    assert store.load_turns("missing") == {}
+    store.close()
+
+
+def test_load_turns_replays_the_prompt_each_agent_was_given(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"))
+    store.save("user", "user", "q", "s1")
+    store.save("Agent1", "assistant", "a", "s1", prompt="q")
+    store.save("Agent2", "assistant", "b", "s1", prompt="a")
+    assert store.load_turns("s1") == {"Agent1": [("q", "a")], "Agent2": [("a", "b")]}
+    store.close()
+
+
+def test_search_ranks_highlights_and_paginates(tmp_path):
+    from storage import Storage
+
+    store = Storage(str(tmp_path / "chat.db"), write_behind=True, flush_interval=10)
+    store.save("Agent1", "assistant", "the deploy failed twice", "s1")
+    store.save("Agent1", "assistant", "deploy deploy deploy", "s1")
+    store.save("Agent2", "assistant", "Deploy finished", "s2")
+    store.save("Agent2", "assistant", "nothing to see", "s2")
+
+    hits = store.search("deploy")
+    assert [hit.snippet for hit in hits][0] == "[deploy] [deploy] [deploy]"
+    assert len(hits) == 3
+    assert [hit.agent for hit in store.search("deploy", session_id="s2")] == ["Agent2"]
+    assert [hit.id for hit in store.search("deploy failed")] == [1]
+    first, second = store.search("deploy", limit=2), store.search("deploy", limit=2, offset=2)
+    assert {hit.id for hit in first + second} == {1, 2, 3}
+    # punctuation and FTS operators in user input are matched literally
+    assert store.search('failed" OR -twice:') == []
+    assert store.search("   ") == []
+    store.close()
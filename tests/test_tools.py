@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+pytest.importorskip("requests")
+
+from tools import SearchClient, normalize_query
+
+
+@pytest.fixture
+def search_server():
+    """Local stand-in for the Tavily endpoint.
+
+    Queries starting with ``flaky`` fail with 503 on their first attempt.
+    """
+    state = {"hits": [], "failed": set()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)["query"][0]
+            state["hits"].append(query)
+            if query.startswith("flaky") and query not in state["failed"]:
+                state["failed"].add(query)
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = json.dumps({"results": [{"content": f"result for {query}"}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/search"
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("TAVILY_API_KEY", "x")
+
+
+def test_normalize_query():
+    assert normalize_query("  Hello   World ") == "hello world"
+
+
+def test_cache_hits_on_normalized_query(search_server):
+    client = SearchClient(url=search_server["url"])
+    assert client.search("Python GIL") == "result for Python GIL"
+    assert client.search("python  gil") == "result for Python GIL"
+    assert search_server["hits"] == ["Python GIL"]
+    assert client.stats()["cache_hits"] == 1
+
+
+def test_retries_transient_errors(search_server):
+    client = SearchClient(url=search_server["url"], backoff=0.01)
+    assert client.search("flaky one") == "result for flaky one"
+    assert client.retries == 1
+    assert search_server["hits"] == ["flaky one", "flaky one"]
+
+
+def test_search_many_runs_concurrently(search_server):
+    client = SearchClient(url=search_server["url"])
+    queries = [f"q{i}" for i in range(8)]
+    assert client.search_many(queries, max_workers=4) == [f"result for q{i}" for i in range(8)]
+    stats = client.stats()
+    assert stats["requests"] == 8
+    assert stats["latency_p95"] >= stats["latency_p50"] > 0
+
+
+def _git(*args, cwd=None):
+    import subprocess
+
+    subprocess.check_call(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def source_repo(tmp_path):
+    src = tmp_path / "src" / "project"
+    src.mkdir(parents=True)
+    _git("init", "-q", "-b", "main", str(src))
+    (src / "a.txt").write_text("one")
+    _git("add", "a.txt", cwd=src)
+    _git("commit", "-q", "-m", "first", cwd=src)
+    return src
+
+
+def test_clone_jobs_use_mirror_and_fetch_updates(source_repo, tmp_path, monkeypatch):
+    import subprocess
+
+    import tools
+    from tools import CloneManager
+
+    calls = []
+    git = tools._git
+    monkeypatch.setattr(tools, "_git", lambda *args: calls.append(args) or git(*args))
+
+    manager = CloneManager(dest=str(tmp_path / "repos"), max_workers=2)
+    url = source_repo.as_uri()
+    job = manager.wait(manager.submit(url).job_id, timeout=30)
+    assert job.status == "done", job.error
+    checkout = tmp_path / "repos" / "project"
+    assert (checkout / "a.txt").read_text() == "one"
+    assert (checkout / ".git" / "objects" / "info" / "alternates").exists()
+    mirror = tmp_path / "repos" / ".mirror" / "objects.git"
+    refs = subprocess.check_output(
+        ["git", "-C", str(mirror), "for-each-ref", "--format=%(refname)"]
+    )
+    assert refs.decode().strip().endswith("/main")
+    # the remote is contacted once, by the clone; the mirror copies from it locally
+    assert sum(url in args for args in calls) == 2
+    assert not any("fetch" in args and url in args for args in calls)
+
+    (source_repo / "a.txt").write_text("two")
+    _git("commit", "-q", "-am", "second", cwd=source_repo)
+    job = manager.wait(manager.submit(url).job_id, timeout=30)
+    assert job.status == "done", job.error
+    assert (checkout / "a.txt").read_text() == "two"
+    assert [j.job_id for j in manager.jobs()] == [1, 2]
+    # the pull refreshed the mirror too
+    head = subprocess.check_output(["git", "-C", str(source_repo), "rev-parse", "HEAD"]).strip()
+    assert head in subprocess.check_output(["git", "-C", str(mirror), "for-each-ref"])
+    # checkouts rely on the mirror's objects, so it must never prune them
+    config = lambda key: subprocess.check_output(["git", "-C", str(mirror), "config", key])
+    assert config("gc.auto").strip() == b"0"
+    assert config("gc.pruneExpire").strip() == b"never"
+    manager.shutdown()
+
+
+def test_concurrent_jobs_for_one_repository_share_the_checkout(source_repo, tmp_path):
+    from tools import CloneManager
+
+    manager = CloneManager(dest=str(tmp_path / "repos"), max_workers=4)
+    url = source_repo.as_uri()
+    ids = [manager.submit(url).job_id for _ in range(4)]
+    jobs = [manager.wait(job_id, timeout=30) for job_id in ids]
+    assert all(job.status == "done" for job in jobs), [job.error for job in jobs]
+    assert (tmp_path / "repos" / "project" / "a.txt").read_text() == "one"
+    manager.shutdown()
+
+
+def test_failed_clone_job_reports_error(tmp_path):
+    from tools import CloneManager
+
+    manager = CloneManager(dest=str(tmp_path / "repos"))
+    missing = (tmp_path / "missing").as_uri()
+    job = manager.wait(manager.submit(missing).job_id, timeout=30)
+    assert job.status == "failed" and job.error
+    manager.shutdown()
@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import voice
+from voice import SentenceBuffer, SpeechStream, SpeechWorker
+
+
+class FakeEngine:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.spoken = []
+        self.threads = set()
+        self._pending = []
+
+    def say(self, text):
+        self._pending.append(text)
+
+    def runAndWait(self):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        self.spoken.extend(self._pending)
+        self._pending.clear()
+
+
+def test_sentence_buffer_releases_complete_sentences():
+    buf = SentenceBuffer()
+    out = []
+    for token in ["Hel", "lo there", ". How ", "are you", "? Fine", "\nBye"]:
+        out += buf.feed(token)
+    assert out == ["Hello there.", "How are you?", "Fine"]
+    assert buf.flush() == ["Bye"]
+
+
+def test_worker_speaks_in_background_with_one_engine():
+    engines = []
+
+    def factory():
+        engines.append(FakeEngine(delay=0.05))
+        return engines[-1]
+
+    worker = SpeechWorker(engine_factory=factory)
+    start = time.perf_counter()
+    worker.say("One. Two. Three.")
+    assert time.perf_counter() - start < 0.05
+    worker.wait()
+    worker.say("Four.")
+    worker.wait()
+    assert len(engines) == 1
+    assert engines[0].spoken == ["One.", "Two.", "Three.", "Four."]
+    assert threading.get_ident() not in engines[0].threads
+    worker.shutdown()
+
+
+def test_speech_stream_starts_before_answer_is_finished():
+    engine = FakeEngine()
+    worker = SpeechWorker(engine_factory=lambda: engine)
+    stream = SpeechStream(worker)
+    stream.feed("First sentence. Sec")
+    worker.wait()
+    assert engine.spoken == ["First sentence."]
+    stream.feed("ond one")
+    stream.end()
+    worker.wait()
+    assert engine.spoken == ["First sentence.", "Second one"]
+    worker.shutdown()
+
+
+def test_speak_without_pyttsx3_is_noop(monkeypatch):
+    monkeypatch.setattr(voice, "pyttsx3", None)
+    monkeypatch.setattr(voice, "_worker", None)
+    voice.speak("Hello.")
+    assert voice._worker is None
+
+
+def test_sentence_buffer_matches_whole_text_split_for_any_tokenization():
+    import random
+
+    text = 'He said "stop." Then (quietly!) left?\n\nThe end. "Really?" Yes.'
+    expected = [s for s in voice._SENTENCE_END.split(text) if s.strip()]
+    rng = random.Random(1)
+    for _ in range(50):
+        buf, out, i = SentenceBuffer(), [], 0
+        while i < len(text):
+            step = rng.randint(1, 4)
+            out += buf.feed(text[i : i + step])
+            i += step
+        assert out + buf.flush() == [s.strip() for s in expected]
+
+
+def test_sentence_buffer_feeds_long_sentences_in_linear_time():
+    buf = SentenceBuffer()
+    start = time.perf_counter()
+    for _ in range(100_000):
+        assert buf.feed("word ") == []
+    assert time.perf_counter() - start < 2.0
+    assert buf.feed("end. ") == [("word " * 100_000 + "end.").strip()]
+
+
+def test_failed_stream_does_not_leak_into_next_answer():
+    import pytest
+
+    pytest.importorskip("langchain", reason="LangChain not available")
+    from handlers import SpeechStreamingHandler
+
+    engine = FakeEngine()
+    handler = SpeechStreamingHandler()
+    handler.stream.worker = SpeechWorker(engine_factory=lambda: engine)
+    handler.on_llm_new_token("Half a sen")
+    handler.on_llm_error(RuntimeError("boom"))
+    handler.on_llm_new_token("Fresh answer.")
+    handler.on_llm_end(None)
+    handler.stream.worker.wait()
+    assert engine.spoken == ["Fresh answer."]
+    handler.stream.worker.shutdown()
@@ -1,33 +1,333 @@
+import hashlib
 import os
+import random
 import subprocess
-from typing import List
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+TAVILY_URL = "https://api.tavily.com/search"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of ``query`` used as cache key."""
+    return " ".join(query.lower().split())
+
+
+class SearchClient:
+    """Tavily search over a pooled session with caching and retries.
+
+    Results are cached per normalized query for ``ttl`` seconds.  Requests that
+    fail with 429/5xx or a connection error are retried up to ``max_retries``
+    times with jittered exponential backoff, honouring ``Retry-After``.
+    """
+
+    def __init__(
+        self,
+        url: str = TAVILY_URL,
+        ttl: float = 300.0,
+        max_entries: int = 256,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 10.0,
+        pool_size: int = 10,
+    ) -> None:
+        self.url = url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.latencies: deque = deque(maxlen=1000)
+        self.requests = 0
+        self.cache_hits = 0
+        self.retries = 0
+
+    def search(self, query: str) -> str:
+        """Return search results for ``query`` as newline-joined snippets."""
+        api_key = os.getenv("TAVILY_API_KEY")
+        if not api_key:
+            raise RuntimeError("TAVILY_API_KEY environment variable is required")
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+        start = time.perf_counter()
+        data = self._get({"api_key": api_key, "query": query, "max_results": 5})
+        # Expect data["results"] to be a list of dicts with "content" key
+        results = data.get("results", [])
+        result = "\n".join(item.get("content", "") for item in results)
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+            self._cache[key] = (time.monotonic() + self.ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def search_many(self, queries: List[str], max_workers: int = 4) -> List[str]:
+        """Run ``queries`` concurrently (at most ``max_workers`` at a time)."""
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(self.search, queries))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "retries": self.retries,
+            }
+        for name, q in (("p50", 0.5), ("p95", 0.95)):
+            stats[f"latency_{name}"] = (
+                latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+            )
+        return stats
+
+    def _get(self, params: dict) -> dict:
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                self.requests += 1
+            try:
+                resp = self.session.get(self.url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt, None)
+                continue
+            if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._sleep_before_retry(attempt, resp.headers.get("Retry-After"))
+                continue
+            resp.raise_for_status()
+            return resp.json()
+        raise AssertionError("unreachable")
+
+    def _sleep_before_retry(self, attempt: int, retry_after: Optional[str]) -> None:
+        with self._lock:
+            self.retries += 1
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+
+_search_client: Optional[SearchClient] = None
+_singleton_lock = threading.Lock()
+
+
+def get_search_client() -> SearchClient:
+    """Return the process-wide :class:`SearchClient`, creating it on first use."""
+    global _search_client
+    with _singleton_lock:
+        if _search_client is None:
+            _search_client = SearchClient(url=os.getenv("TAVILY_URL", TAVILY_URL))
+        return _search_client
 
 
 def search_web(query: str) -> str:
     """Return search results using the Tavily API."""
-    api_key = os.getenv("TAVILY_API_KEY")
-    if not api_key:
-        raise RuntimeError("TAVILY_API_KEY environment variable is required")
-    resp = requests.get(
-        "https://api.tavily.com/search",
-        params={"api_key": api_key, "query": query, "max_results": 5},
-        timeout=10,
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    # Expect data["results"] to be a list of dicts with "content" key
-    results = data.get("results", [])
-    return "\n".join(item.get("content", "") for item in results)
-
-
-def pull_from_github(repo_url: str, dest: str = "repos") -> str:
-    """Clone ``repo_url`` into ``dest`` and return the local path."""
+    with metrics.track_tool("search"):
+        return get_search_client().search(query)
+
+
+def search_many(queries: List[str], max_workers: int = 4) -> List[str]:
+    """Search several queries concurrently using the shared client."""
+    return get_search_client().search_many(queries, max_workers=max_workers)
+
+
+def _git(*args: str) -> None:
+    subprocess.check_call(["git", *args])
+
+
+_path_locks: Dict[str, threading.Lock] = {}
+
+
+def _path_lock(path: str) -> threading.Lock:
+    # One lock per repository on disk (a mirror or a checkout), so jobs for
+    # the same path run one at a time while different paths run in parallel.
+    with _singleton_lock:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def init_mirror(mirror_dir: str) -> str:
+    """Create the shared bare object store under ``mirror_dir`` and return its path.
+
+    Checkouts borrow the mirror's objects through ``alternates``, and its
+    refs are force-updated, so garbage collection is switched off: pruning
+    an object that became unreachable in the mirror would corrupt every
+    checkout still using it.
+    """
+    mirror = os.path.join(mirror_dir, "objects.git")
+    with _path_lock(mirror):
+        if not os.path.isdir(mirror):
+            os.makedirs(mirror_dir, exist_ok=True)
+            _git("init", "--quiet", "--bare", mirror)
+            _git("-C", mirror, "config", "gc.auto", "0")
+            _git("-C", mirror, "config", "gc.pruneExpire", "never")
+    return mirror
+
+
+def update_mirror(repo_url: str, mirror_dir: str, source: Optional[str] = None) -> str:
+    """Fetch ``repo_url`` into the shared bare object store and return its path.
+
+    Every repository is a remote of one bare repo, so repeated clones and
+    related repositories (forks, mirrors) share the objects they have in
+    common.  ``source`` is a local clone of ``repo_url`` to copy its branches
+    from instead of contacting ``repo_url``.
+    """
+    mirror = init_mirror(mirror_dir)
+    remote = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:12]
+    with _path_lock(mirror):
+        _git("-C", mirror, "config", f"remote.{remote}.url", repo_url)
+        _git(
+            "-C",
+            mirror,
+            "config",
+            f"remote.{remote}.fetch",
+            f"+refs/heads/*:refs/remotes/{remote}/*",
+        )
+        if source is None:
+            _git("-C", mirror, "fetch", "--quiet", remote)
+        else:
+            _git(
+                "-C",
+                mirror,
+                "fetch",
+                "--quiet",
+                os.path.abspath(source),
+                f"+refs/remotes/origin/*:refs/remotes/{remote}/*",
+            )
+    return mirror
+
+
+def pull_from_github(repo_url: str, dest: str = "repos", mirror_dir: Optional[str] = None) -> str:
+    """Clone ``repo_url`` into ``dest`` and return the local path.
+
+    An existing checkout is updated with a fast-forward ``git pull`` instead
+    of being skipped.  With ``mirror_dir`` new clones borrow objects from the
+    shared mirror (``--reference``), only download what it lacks, and every
+    clone or pull then adds its objects to the mirror.  Jobs for the same
+    ``dest`` path run one at a time.
+    """
+    with metrics.track_tool("clone"):
+        return _pull(repo_url, dest, mirror_dir)
+
+
+def _pull(repo_url: str, dest: str, mirror_dir: Optional[str]) -> str:
     os.makedirs(dest, exist_ok=True)
     repo_name = os.path.basename(repo_url.rstrip("/"))
     path = os.path.join(dest, repo_name)
-    if os.path.exists(path):
-        return path
-    subprocess.check_call(["git", "clone", "--depth", "1", repo_url, path])
+    with _path_lock(path):
+        if os.path.exists(path):
+            if not os.path.isdir(os.path.join(path, ".git")):
+                return path
+            _git("-C", path, "pull", "--quiet", "--ff-only")
+        elif mirror_dir is None:
+            subprocess.check_call(["git", "clone", "--depth", "1", repo_url, path])
+            return path
+        else:
+            # Only objects the mirror lacks are downloaded.
+            _git("clone", "--quiet", "--reference", init_mirror(mirror_dir), repo_url, path)
+        if mirror_dir is not None:
+            # The mirror takes the new objects from the checkout locally,
+            # without a second network round-trip.
+            update_mirror(repo_url, mirror_dir, source=path)
     return path
+
+
+@dataclass
+class CloneJob:
+    """A clone or update running in the background."""
+
+    job_id: int
+    repo_url: str
+    status: str = "queued"
+    path: Optional[str] = None
+    error: Optional[str] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+
+class CloneManager:
+    """Run :func:`pull_from_github` as background jobs.
+
+    At most ``max_workers`` clones run at once; the rest wait in the queue.
+    """
+
+    def __init__(
+        self, dest: str = "repos", mirror_dir: Optional[str] = None, max_workers: int = 2
+    ) -> None:
+        self.dest = dest
+        self.mirror_dir = mirror_dir if mirror_dir is not None else os.path.join(dest, ".mirror")
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clone")
+        self._jobs: Dict[int, CloneJob] = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def submit(self, repo_url: str, on_done: Optional[Callable[[CloneJob], None]] = None) -> CloneJob:
+        with self._lock:
+            job = CloneJob(self._next_id, repo_url)
+            self._jobs[job.job_id] = job
+            self._next_id += 1
+        job.future = self._pool.submit(self._run, job)
+        if on_done is not None:
+            job.future.add_done_callback(lambda _: on_done(job))
+        return job
+
+    def get(self, job_id: int) -> Optional[CloneJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[CloneJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> CloneJob:
+        job = self._jobs[job_id]
+        wait([job.future], timeout=timeout)
+        return job
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job: CloneJob) -> None:
+        job.status = "running"
+        try:
+            job.path = pull_from_github(job.repo_url, self.dest, self.mirror_dir)
+        except Exception as exc:
+            job.error = str(exc)
+            job.status = "failed"
+        else:
+            job.status = "done"
+
+
+_clone_manager: Optional[CloneManager] = None
+
+
+def get_clone_manager() -> CloneManager:
+    """Return the process-wide :class:`CloneManager`, creating it on first use."""
+    global _clone_manager
+    with _singleton_lock:
+        if _clone_manager is None:
+            _clone_manager = CloneManager()
+        return _clone_manager
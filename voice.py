@@ -1,4 +1,8 @@
 import os
+import queue
+import re
+import threading
+from typing import Callable, List, Optional
 
 try:
     import speech_recognition as sr
@@ -16,6 +20,8 @@ def record_and_transcribe(timeout: int = 5) -> str:
     if sr is None:
         raise RuntimeError("speech_recognition is not installed")
 
+    if _worker is not None:
+        _worker.wait()  # don't record our own speech
     recognizer = sr.Recognizer()
     with sr.Microphone() as source:
         print("Listening...")
@@ -29,10 +35,158 @@ def record_and_transcribe(timeout: int = 5) -> str:
         return ""
 
 
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+
+class SentenceBuffer:
+    """Accumulate streamed tokens and release complete sentences.
+
+    A sentence boundary can only start in the run of quotes, brackets and
+    whitespace at the end of the pending text, so each token is searched
+    together with that run only; the rest of the pending sentence is kept as
+    chunks and joined once the sentence is complete.
+    """
+
+    def __init__(self) -> None:
+        self._head: List[str] = []
+        self._window = ""
+        self._scan = 0
+
+    def feed(self, token: str) -> List[str]:
+        window = self._window + token
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(window, self._scan):
+            sentence = "".join(self._head) + window[start : match.start()]
+            self._head = []
+            if sentence.strip():
+                sentences.append(sentence.strip())
+            start = match.end()
+        rest = window[start:]
+        run = _trailing_run_start(rest)
+        keep = max(run - 1, 0)  # one more character for the look-behind
+        if keep:
+            self._head.append(rest[:keep])
+        self._window = rest[keep:]
+        self._scan = run - keep
+        return sentences
+
+    def flush(self) -> List[str]:
+        text = ("".join(self._head) + self._window).strip()
+        self.clear()
+        return [text] if text else []
+
+    def clear(self) -> None:
+        """Drop the pending partial sentence."""
+        self._head, self._window, self._scan = [], "", 0
+
+
+def _trailing_run_start(text: str) -> int:
+    end = len(text)
+    while end and (text[end - 1] in "\"')]" or text[end - 1].isspace()):
+        end -= 1
+    return end
+
+
+class SpeechWorker:
+    """Speak queued sentences on a dedicated thread with one engine.
+
+    The engine is created once, inside the worker thread, on first use.
+    :meth:`say` returns immediately so generation never waits for speech.
+    """
+
+    def __init__(self, engine_factory: Optional[Callable[[], object]] = None) -> None:
+        self.engine_factory = engine_factory or (pyttsx3.init if pyttsx3 is not None else None)
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def say(self, text: str) -> None:
+        """Queue ``text`` sentence by sentence."""
+        buffer = SentenceBuffer()
+        for sentence in buffer.feed(text) + buffer.flush():
+            self.enqueue(sentence)
+
+    def wait(self) -> None:
+        """Block until everything queued so far has been spoken."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def shutdown(self) -> None:
+        """Drop pending sentences and stop the worker after the current one."""
+        if self._thread is None:
+            return
+        try:
+            while True:
+                self._queue.get_nowait()
+                self._queue.task_done()
+        except queue.Empty:
+            pass
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def enqueue(self, sentence: str) -> None:
+        """Queue one complete sentence."""
+        if self.engine_factory is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="speech", daemon=True)
+                self._thread.start()
+        self._queue.put(sentence)
+
+    def _run(self) -> None:
+        engine = self.engine_factory()
+        while True:
+            sentence = self._queue.get()
+            try:
+                if sentence is None:
+                    return
+                engine.say(sentence)
+                engine.runAndWait()
+            except Exception as exc:  # keep speaking later sentences
+                print(f"[Voice error] {exc}")
+            finally:
+                self._queue.task_done()
+
+
+class SpeechStream:
+    """Feed streamed tokens for one utterance to a :class:`SpeechWorker`.
+
+    Each sentence is queued as soon as it is complete, so speech starts after
+    the first sentence rather than after the whole answer.
+    """
+
+    def __init__(self, worker: "SpeechWorker") -> None:
+        self.worker = worker
+        self._buffer = SentenceBuffer()
+
+    def feed(self, token: str) -> None:
+        for sentence in self._buffer.feed(token):
+            self.worker.enqueue(sentence)
+
+    def end(self) -> None:
+        for sentence in self._buffer.flush():
+            self.worker.enqueue(sentence)
+
+    def reset(self) -> None:
+        """Forget the unfinished sentence, e.g. after the call failed."""
+        self._buffer.clear()
+
+
+_worker: Optional[SpeechWorker] = None
+
+
+def get_worker() -> SpeechWorker:
+    global _worker
+    if _worker is None:
+        _worker = SpeechWorker()
+    return _worker
+
+
 def speak(text: str) -> None:
-    """Speak ``text`` using pyttsx3 if available."""
+    """Queue ``text`` for speech using pyttsx3 if available; does not block."""
     if pyttsx3 is None:
         return
-    engine = pyttsx3.init()
-    engine.say(text)
-    engine.runAndWait()
+    get_worker().say(text)